@@ -0,0 +1,45 @@
+-- Local STAC scene catalog
+-- Scenes are synced incrementally from Planetary Computer by the
+-- SYNC_SCENE_CATALOG worker job so pipeline jobs resolve scenes with one
+-- local spatial query instead of a remote STAC search per job.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS stac_scenes (
+    collection VARCHAR(50) NOT NULL,           -- e.g., 'sentinel-2-l2a', 'sentinel-1-rtc'
+    scene_id TEXT NOT NULL,                    -- STAC item id
+    datetime TIMESTAMPTZ NOT NULL,
+    cloud_cover DOUBLE PRECISION NOT NULL DEFAULT 0,
+    platform VARCHAR(50),
+    footprint GEOMETRY(Geometry, 4326) NOT NULL,
+    bbox DOUBLE PRECISION[],
+    assets JSONB NOT NULL,                     -- band key -> unsigned asset href
+    self_href TEXT,
+    synced_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (collection, scene_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_stac_scenes_footprint
+    ON stac_scenes USING GIST (footprint);
+CREATE INDEX IF NOT EXISTS idx_stac_scenes_collection_datetime
+    ON stac_scenes(collection, datetime);
+
+-- Time range and extent fully synced per collection. Searches outside it
+-- fall back to the live STAC API.
+CREATE TABLE IF NOT EXISTS stac_catalog_sync (
+    collection VARCHAR(50) PRIMARY KEY,
+    extent GEOMETRY(Polygon, 4326) NOT NULL,
+    synced_from TIMESTAMPTZ NOT NULL,
+    synced_through TIMESTAMPTZ NOT NULL,
+    scene_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE stac_scenes IS 'Local catalog of STAC scenes (footprints, cloud cover, asset hrefs)';
+COMMENT ON TABLE stac_catalog_sync IS 'Synced time range / extent of stac_scenes per collection';
+
+COMMIT;
+
+-- Down Migration (run manually if needed)
+-- DROP TABLE IF EXISTS stac_catalog_sync;
+-- DROP TABLE IF EXISTS stac_scenes;
@@ -0,0 +1,9 @@
+-- Multi-band index COG output (INDEX_OUTPUT_MODE=multiband)
+-- One int16 COG per AOI-week holds every index; per-index *_s3_uri columns
+-- are NULL for those rows.
+
+ALTER TABLE derived_assets
+ADD COLUMN IF NOT EXISTS indices_s3_uri TEXT,
+-- index name -> {"band": 1-based band, "scale": float, "offset": float}
+-- (value = raw * scale + offset; nodata = -32768)
+ADD COLUMN IF NOT EXISTS indices_band_map JSONB;
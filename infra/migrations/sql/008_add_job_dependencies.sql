@@ -0,0 +1,16 @@
+-- Job dependencies (per-week pipeline DAG)
+-- A job with upstream dependencies is created with status 'WAITING' and is
+-- only enqueued once every job it depends on is DONE (the worker releases
+-- dependents when a job completes, see worker/shared/job_queue.py).
+
+CREATE TABLE IF NOT EXISTS job_dependencies (
+    job_id UUID NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    depends_on_job_id UUID NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (job_id, depends_on_job_id),
+    CHECK (job_id <> depends_on_job_id)
+);
+
+-- Completion looks up the dependents of the finished job
+CREATE INDEX IF NOT EXISTS idx_job_dependencies_depends_on
+ON job_dependencies(depends_on_job_id);
@@ -0,0 +1,22 @@
+-- Postgres job queue backend (QUEUE_BACKEND=postgres)
+-- Workers claim jobs straight from this table with FOR UPDATE SKIP LOCKED
+-- (services/worker/worker/shared/pg_queue.py).
+
+ALTER TABLE jobs
+-- Higher is claimed first; change in bulk with UPDATE ... SET priority
+ADD COLUMN IF NOT EXISTS priority INT NOT NULL DEFAULT 0,
+-- Claims so far (retry limit and receipt-handle fencing)
+ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0,
+-- Set while a worker holds the job; extended by its heartbeat
+ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ,
+ADD COLUMN IF NOT EXISTS leased_by TEXT;
+
+-- Claim order of runnable jobs
+CREATE INDEX IF NOT EXISTS idx_jobs_claim
+ON jobs(priority DESC, created_at)
+WHERE status = 'PENDING';
+
+-- Expired leases (retries, crashed workers)
+CREATE INDEX IF NOT EXISTS idx_jobs_lease_expires
+ON jobs(lease_expires_at)
+WHERE lease_expires_at IS NOT NULL;
@@ -0,0 +1,14 @@
+-- Stage checkpoints of long jobs (PROCESS_WEEK, PROCESS_RADAR_WEEK)
+-- A rerun of a job (redelivery, retry, re-created after FAILED) resumes
+-- after the last stage recorded here instead of starting over
+-- (services/worker/worker/shared/checkpoints.py). Rows are removed when the
+-- job completes.
+
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+    job_id UUID NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    -- JSON as text: stage data may hold NaN statistics, which jsonb rejects
+    data_json TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (job_id, stage)
+);
@@ -0,0 +1,10 @@
+-- Postgres job queue backend: each claim ranks only the oldest claimable jobs
+-- of every tenant (services/worker/worker/shared/pg_queue.py), read per
+-- tenant from this index instead of ranking the whole PENDING backlog.
+
+CREATE INDEX IF NOT EXISTS idx_jobs_tenant_claim
+ON jobs(tenant_id, priority DESC, created_at)
+WHERE status = 'PENDING';
+
+-- Superseded by idx_jobs_tenant_claim
+DROP INDEX IF EXISTS idx_jobs_claim;
@@ -43,9 +43,16 @@ class Settings(BaseSettings):
     s3_force_path_style: bool = False
     
     sqs_queue_name: str
+    sqs_queue_high_priority_name: str = "vivacampo-jobs-high"  # Interactive jobs
     sqs_dlq_name: str
     sqs_visibility_timeout_seconds: int = 900
     sqs_max_receive_count: int = 3
+    # "postgres": workers claim PENDING job rows directly, so job messages
+    # are not sent to SQS (must match the worker's QUEUE_BACKEND)
+    queue_backend: Literal["sqs", "postgres"] = "sqs"
+    # Only join an in-flight job with the same key updated this recently (or
+    # holding a live lease); older ones are presumed lost and reset
+    job_coalesce_max_age_seconds: int = 6 * 3600
     
     # Pipeline
     pipeline_version: str = "v1"
@@ -0,0 +1,126 @@
+"""
+Bulk job creation and dispatch (same contract as worker/shared/job_queue.py).
+
+create_jobs() upserts any number of jobs with multi-row INSERT ... ON CONFLICT
+statements and enqueue_jobs() sends their worker messages with
+SendMessageBatch, 10 per call. A job whose key matches a job that is still
+PENDING, WAITING or RUNNING attaches to it (NewJob.coalesced) instead of
+being reset and sent again, unless that job has not been updated for
+settings.job_coalesce_max_age_seconds and holds no live lease (presumed lost).
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+# Rows per INSERT statement
+INSERT_CHUNK = 500
+
+# Scheduling classes (payload["priority_class"], see worker/scheduling.py):
+# interactive jobs are enqueued on the high-priority queue and get this
+# jobs.priority (Postgres queue backend); bulk jobs are 0
+INTERACTIVE = "interactive"
+BULK = "bulk"
+INTERACTIVE_PRIORITY = 10
+
+
+@dataclass
+class NewJob:
+    tenant_id: str
+    aoi_id: Optional[str]
+    job_type: str
+    job_key: str
+    payload: Dict[str, Any]
+    # Set by create_jobs(): attached to an in-flight job with the same key
+    coalesced: bool = False
+
+
+def job_key(*parts: Any) -> str:
+    """Idempotency key: sha256 of the concatenated parts."""
+    return hashlib.sha256("".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def create_jobs(db: Session, jobs: List[NewJob]) -> List[Tuple[str, NewJob]]:
+    """
+    Upsert jobs as PENDING. A finished (DONE / FAILED) or stale in-flight job
+    with the same key is reset to PENDING with the new job's payload and
+    priority; an in-flight one is kept and the new job marked coalesced.
+    Does not commit.
+
+    Returns:
+        [(job id, job)] in input order, one per distinct (tenant_id, job_key);
+        the id of a coalesced job is the in-flight job's
+    """
+    unique: Dict[Tuple[str, str], NewJob] = {}
+    for job in jobs:
+        # One statement can't upsert the same key twice
+        unique[(str(job.tenant_id), job.job_key)] = job
+    jobs = list(unique.values())
+
+    ids: Dict[Tuple[str, str], str] = {}
+    for start in range(0, len(jobs), INSERT_CHUNK):
+        chunk = jobs[start:start + INSERT_CHUNK]
+        values, params = [], {"coalesce_max_age": settings.job_coalesce_max_age_seconds}
+        for i, job in enumerate(chunk):
+            priority = INTERACTIVE_PRIORITY if job.payload.get("priority_class") == INTERACTIVE else 0
+            values.append(
+                f"(:tenant_id_{i}, :aoi_id_{i}, :job_type_{i}, :job_key_{i}, 'PENDING', {priority}, :payload_{i})"
+            )
+            params.update({
+                f"tenant_id_{i}": str(job.tenant_id),
+                f"aoi_id_{i}": str(job.aoi_id) if job.aoi_id else None,
+                f"job_type_{i}": job.job_type,
+                f"job_key_{i}": job.job_key,
+                f"payload_{i}": json.dumps(job.payload),
+            })
+        sql = text(f"""
+            INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, priority, payload_json)
+            VALUES {', '.join(values)}
+            ON CONFLICT (tenant_id, job_key) DO UPDATE
+            SET status = 'PENDING', priority = EXCLUDED.priority,
+                payload_json = EXCLUDED.payload_json,
+                attempts = 0, lease_expires_at = NULL, leased_by = NULL, updated_at = now()
+            WHERE jobs.status NOT IN ('PENDING', 'WAITING', 'RUNNING')
+               OR (jobs.updated_at < now() - make_interval(secs => :coalesce_max_age)
+                   AND (jobs.lease_expires_at IS NULL OR jobs.lease_expires_at < now()))
+            RETURNING id, tenant_id, job_key
+        """)
+        for row in db.execute(sql, params).fetchall():
+            ids[(str(row[1]), row[2])] = str(row[0])
+
+        # Rows left alone by the upsert are in flight: attach to them
+        attached = [job for job in chunk if (str(job.tenant_id), job.job_key) not in ids]
+        if attached:
+            rows = db.execute(text("""
+                SELECT id, tenant_id, job_key FROM jobs
+                WHERE tenant_id = ANY(CAST(:tenant_ids AS uuid[]))
+                  AND job_key = ANY(CAST(:job_keys AS text[]))
+            """), {
+                "tenant_ids": sorted({str(job.tenant_id) for job in attached}),
+                "job_keys": [job.job_key for job in attached],
+            }).fetchall()
+            for row in rows:
+                ids.setdefault((str(row[1]), row[2]), str(row[0]))
+            for job in attached:
+                job.coalesced = True
+
+    return [(ids[(str(job.tenant_id), job.job_key)], job) for job in jobs]
+
+
+def enqueue_jobs(sqs, queue_name_or_url: str, created: List[Tuple[str, NewJob]]):
+    """Send the worker message of each created job (SendMessageBatch), except coalesced ones."""
+    created = [(job_id, job) for job_id, job in created if not job.coalesced]
+    if not created:
+        return
+    sqs.send_message_batch(
+        queue_name_or_url,
+        [
+            json.dumps({"job_id": job_id, "job_type": job.job_type, "payload": job.payload})
+            for job_id, job in created
+        ],
+    )
@@ -1,3 +1,5 @@
+from typing import List
+
 import boto3
 from app.config import settings
 
@@ -11,7 +13,41 @@ class SQSClientWrapper:
             aws_secret_access_key=settings.aws_secret_access_key,
         )
 
+    def _queue_url(self, queue_name_or_url: str) -> str:
+        if queue_name_or_url.startswith("http"):
+            return queue_name_or_url
+        try:
+            response = self.client.get_queue_url(QueueName=queue_name_or_url)
+            return response["QueueUrl"]
+        except Exception:
+            return f"{settings.aws_endpoint_url}/queue/{queue_name_or_url}" if settings.aws_endpoint_url else queue_name_or_url
+
+    def send_message_batch(self, queue_name_or_url: str, bodies: List[str]):
+        """
+        Send several messages with SendMessageBatch (10 per request).
+
+        Raises:
+            RuntimeError if any message could not be sent
+        """
+        if settings.queue_backend == "postgres":
+            return  # Workers claim the PENDING job rows
+        queue_url = self._queue_url(queue_name_or_url)
+        failed = []
+        for start in range(0, len(bodies), 10):
+            chunk = bodies[start:start + 10]
+            response = self.client.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=[{"Id": str(i), "MessageBody": body} for i, body in enumerate(chunk)],
+            )
+            failed += response.get("Failed", [])
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} of {len(bodies)} messages could not be sent: {failed[0].get('Message')}"
+            )
+
     def send_message(self, queue_name_or_url: str, body: str):
+        if settings.queue_backend == "postgres":
+            return None  # Workers claim the PENDING job rows
         # If queue_name_or_url is a name, we might need to get the URL first.
         # But commonly localstack/aws can take URL. 
         # If it's just a name, we should resolve it. 
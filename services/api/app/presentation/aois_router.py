@@ -11,7 +11,6 @@ from app.domain.quotas import check_aoi_quota, check_backfill_quota, QuotaExceed
 from app.domain.audit import get_audit_logger
 from app.infrastructure.s3_client import presign_row_s3_fields
 import structlog
-import hashlib
 
 logger = structlog.get_logger()
 router = APIRouter()
@@ -179,53 +178,31 @@ def _create_backfill_job(tenant_id: str, aoi_id: str, days: int, db: Session):
     """Helper to create and dispatch a backfill job for recent history"""
     from datetime import date, timedelta
     from app.config import settings
-    import json
+    from app.infrastructure.job_queue import INTERACTIVE, NewJob, create_jobs, enqueue_jobs, job_key
+    from app.infrastructure.sqs_client import get_sqs_client
     
     to_date = date.today().isoformat()
     from_date = (date.today() - timedelta(days=days)).isoformat()
     
-    job_key = hashlib.sha256(
-        f"{tenant_id}{aoi_id}{from_date}{to_date}BACKFILL{settings.pipeline_version}".encode()
-    ).hexdigest()
-    
-    sql = text("""
-        INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-        VALUES (:tenant_id, :aoi_id, 'BACKFILL', :job_key, 'PENDING', :payload)
-        ON CONFLICT (tenant_id, job_key) DO UPDATE
-        SET status = 'PENDING', updated_at = now()
-        RETURNING id
-    """)
-    
+    # A user is waiting for the first results: scheduled ahead of bulk work
     payload = {
         "tenant_id": tenant_id,
         "aoi_id": aoi_id,
         "from_date": from_date,
         "to_date": to_date,
-        "cadence": "weekly"
+        "cadence": "weekly",
+        "priority_class": INTERACTIVE,
     }
     
-    result = db.execute(sql, {
-        "tenant_id": tenant_id,
-        "aoi_id": aoi_id,
-        "job_key": job_key,
-        "payload": json.dumps(payload)
-    })
+    created = create_jobs(db, [NewJob(
+        tenant_id, aoi_id, "BACKFILL",
+        job_key(tenant_id, aoi_id, from_date, to_date, "BACKFILL", settings.pipeline_version),
+        payload,
+    )])
     db.commit()
     
-    job_id = result.fetchone()[0]
-    
-    # Send to SQS
-    from app.infrastructure.sqs_client import get_sqs_client
-    sqs = get_sqs_client()
-    
-    # Ensure correct format for worker
-    message_body = {
-        "job_id": str(job_id),
-        "job_type": "BACKFILL",
-        "payload": payload
-    }
-    
-    sqs.send_message(settings.sqs_queue_name, json.dumps(message_body))
+    # Send to SQS (worker message format)
+    enqueue_jobs(get_sqs_client(), settings.sqs_queue_high_priority_name, created)
 
 
 @router.patch("/aois/{aoi_id}", response_model=AOIView)
@@ -367,36 +344,30 @@ async def request_backfill(
             detail=f"Backfill quota exceeded: {str(e)}"
         )
     
-    # Create job
+    # Create job (attaches to an identical backfill that is still in flight)
     from app.config import settings
-    job_key = hashlib.sha256(
-        f"{membership.tenant_id}{aoi_id}{backfill_data.from_date}{backfill_data.to_date}BACKFILL{settings.pipeline_version}".encode()
-    ).hexdigest()
-    
-    sql = text("""
-        INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-        VALUES (:tenant_id, :aoi_id, 'BACKFILL', :job_key, 'PENDING', :payload)
-        ON CONFLICT (tenant_id, job_key) DO UPDATE
-        SET status = 'PENDING', updated_at = now()
-        RETURNING id
-    """)
-    
-    import json
-    result = db.execute(sql, {
-        "tenant_id": str(membership.tenant_id),
-        "aoi_id": str(aoi_id),
-        "job_key": job_key,
-        "payload": json.dumps({
+    from app.infrastructure.job_queue import NewJob, create_jobs, enqueue_jobs, job_key
+    (job_id, job), = create_jobs(db, [NewJob(
+        str(membership.tenant_id), str(aoi_id), "BACKFILL",
+        job_key(membership.tenant_id, aoi_id, backfill_data.from_date, backfill_data.to_date,
+                "BACKFILL", settings.pipeline_version),
+        {
             "tenant_id": str(membership.tenant_id),
             "aoi_id": str(aoi_id),
             "from_date": backfill_data.from_date,
             "to_date": backfill_data.to_date,
             "cadence": backfill_data.cadence
-        })
-    })
+        },
+    )])
     db.commit()
     
-    job_id = result.fetchone()[0]
+    if job.coalesced:
+        return {
+            "job_id": job_id,
+            "status": "PENDING",
+            "weeks_count": weeks_count,
+            "message": "Backfill already in progress"
+        }
     
     # Audit log
     audit = get_audit_logger(db)
@@ -411,21 +382,7 @@ async def request_backfill(
     
     # Send to SQS
     from app.infrastructure.sqs_client import get_sqs_client
-    sqs = get_sqs_client()
-    
-    message_body = {
-        "job_id": str(job_id),
-        "job_type": "BACKFILL",
-        "payload": {
-            "tenant_id": str(membership.tenant_id),
-            "aoi_id": str(aoi_id),
-            "from_date": backfill_data.from_date,
-            "to_date": backfill_data.to_date,
-            "cadence": backfill_data.cadence
-        }
-    }
-    
-    sqs.send_message(settings.sqs_queue_name, json.dumps(message_body))
+    enqueue_jobs(get_sqs_client(), settings.sqs_queue_name, [(job_id, job)])
     
     return {
         "job_id": job_id,
@@ -450,6 +407,7 @@ async def get_aoi_assets(
                
                ndre_s3_uri, reci_s3_uri, gndvi_s3_uri, evi_s3_uri,
                msi_s3_uri, nbr_s3_uri, bsi_s3_uri, ari_s3_uri, cri_s3_uri,
+               indices_s3_uri, indices_band_map,
 
                ndvi_mean, ndvi_min, ndvi_max, ndvi_std,
                ndwi_mean, ndwi_min, ndwi_max, ndwi_std,
@@ -497,6 +455,7 @@ async def get_aoi_assets(
         "bsi_s3_uri",
         "ari_s3_uri",
         "cri_s3_uri",
+        "indices_s3_uri",
     ]
     return presign_row_s3_fields(assets, s3_fields)
 
@@ -134,8 +134,8 @@ def get_job_runs(
             job_id=job_id,
             attempt=row.attempt,
             status=row.status,
-            metrics=json.loads(row.metrics_json) if row.metrics_json else None,
-            error=json.loads(row.error_json) if row.error_json else None,
+            metrics=json.loads(row.metrics_json) if isinstance(row.metrics_json, str) else row.metrics_json,
+            error=json.loads(row.error_json) if isinstance(row.error_json, str) else row.error_json,
             started_at=row.started_at,
             finished_at=row.finished_at
         ))
@@ -176,7 +176,7 @@ def retry_job(
     # Update job status
     sql = text("""
         UPDATE jobs
-        SET status = 'PENDING', updated_at = now()
+        SET status = 'PENDING', attempts = 0, lease_expires_at = NULL, leased_by = NULL, updated_at = now()
         WHERE id = :job_id AND tenant_id = :tenant_id
     """)
     
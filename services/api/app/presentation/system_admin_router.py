@@ -223,7 +223,7 @@ async def admin_retry_job(
     """
     sql = text("""
         UPDATE jobs
-        SET status = 'PENDING', updated_at = now()
+        SET status = 'PENDING', attempts = 0, lease_expires_at = NULL, leased_by = NULL, updated_at = now()
         WHERE id = :job_id AND status IN ('FAILED', 'CANCELLED')
     """)
     
@@ -257,9 +257,8 @@ async def reprocess_missing_aois(
     Enqueue BACKFILL jobs for AOIs with no derived assets.
     """
     from app.config import settings
+    from app.infrastructure.job_queue import BULK, NewJob, create_jobs, enqueue_jobs, job_key
     from app.infrastructure.sqs_client import get_sqs_client
-    import json
-    import hashlib
 
     to_date = date.today().isoformat()
     from_date = (date.today() - timedelta(days=days)).isoformat()
@@ -279,49 +278,27 @@ async def reprocess_missing_aois(
     if not rows:
         return {"queued": 0, "message": "No missing AOIs found"}
 
-    sqs = get_sqs_client()
-    queued = 0
-
+    # One multi-row insert and batched sends for all AOIs
+    jobs = []
     for row in rows:
-        job_key = hashlib.sha256(
-            f"{row.tenant_id}{row.id}{from_date}{to_date}BACKFILL{settings.pipeline_version}".encode()
-        ).hexdigest()
-
         payload = {
             "tenant_id": str(row.tenant_id),
             "aoi_id": str(row.id),
             "from_date": from_date,
             "to_date": to_date,
-            "cadence": "weekly"
+            "cadence": "weekly",
+            "priority_class": BULK,
         }
+        jobs.append(NewJob(
+            str(row.tenant_id), str(row.id), "BACKFILL",
+            job_key(row.tenant_id, row.id, from_date, to_date, "BACKFILL", settings.pipeline_version),
+            payload,
+        ))
 
-        sql_insert = text("""
-            INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-            VALUES (:tenant_id, :aoi_id, 'BACKFILL', :job_key, 'PENDING', :payload)
-            ON CONFLICT (tenant_id, job_key) DO UPDATE
-            SET status = 'PENDING', updated_at = now()
-            RETURNING id
-        """)
-
-        result = db.execute(sql_insert, {
-            "tenant_id": str(row.tenant_id),
-            "aoi_id": str(row.id),
-            "job_key": job_key,
-            "payload": json.dumps(payload)
-        })
-        db.commit()
-
-        job_id = result.fetchone()[0]
-
-        sqs.send_message(
-            settings.sqs_queue_name,
-            json.dumps({
-                "job_id": str(job_id),
-                "job_type": "BACKFILL",
-                "payload": payload
-            })
-        )
-        queued += 1
+    created = create_jobs(db, jobs)
+    db.commit()
+    enqueue_jobs(get_sqs_client(), settings.sqs_queue_name, created)
+    queued = len(created)
 
     audit = get_audit_logger(db)
     audit.log(
@@ -411,9 +388,8 @@ async def reprocess_missing_weeks(
     Enqueue BACKFILL jobs for missing weekly observations in the last N weeks.
     """
     from app.config import settings
+    from app.infrastructure.job_queue import BULK, NewJob, create_jobs, enqueue_jobs, job_key
     from app.infrastructure.sqs_client import get_sqs_client
-    import json
-    import hashlib
 
     weeks = max(1, min(weeks, 104))
     limit = max(1, min(limit, 200))
@@ -437,9 +413,7 @@ async def reprocess_missing_weeks(
         LIMIT :limit
     """)
     aois = db.execute(sql_aois, {"limit": limit}).fetchall()
-    sqs = get_sqs_client()
-
-    queued = 0
+    jobs = []
 
     for row in aois:
         sql_obs = text("""
@@ -477,44 +451,25 @@ async def reprocess_missing_weeks(
             from_date = _iso_week_start(run[0][0], run[0][1]).isoformat()
             to_date = _iso_week_end(run[-1][0], run[-1][1]).isoformat()
 
-            job_key = hashlib.sha256(
-                f"{row.tenant_id}{row.id}{from_date}{to_date}BACKFILL{settings.pipeline_version}".encode()
-            ).hexdigest()
-
             payload = {
                 "tenant_id": str(row.tenant_id),
                 "aoi_id": str(row.id),
                 "from_date": from_date,
                 "to_date": to_date,
-                "cadence": "weekly"
+                "cadence": "weekly",
+                "priority_class": BULK,
             }
-
-            sql_insert = text("""
-                INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-                VALUES (:tenant_id, :aoi_id, 'BACKFILL', :job_key, 'PENDING', :payload)
-                ON CONFLICT (tenant_id, job_key) DO UPDATE
-                SET status = 'PENDING', updated_at = now()
-                RETURNING id
-            """)
-
-            result = db.execute(sql_insert, {
-                "tenant_id": str(row.tenant_id),
-                "aoi_id": str(row.id),
-                "job_key": job_key,
-                "payload": json.dumps(payload)
-            })
-            db.commit()
-
-            job_id = result.fetchone()[0]
-            sqs.send_message(
-                settings.sqs_queue_name,
-                json.dumps({
-                    "job_id": str(job_id),
-                    "job_type": "BACKFILL",
-                    "payload": payload
-                })
-            )
-            queued += 1
+            jobs.append(NewJob(
+                str(row.tenant_id), str(row.id), "BACKFILL",
+                job_key(row.tenant_id, row.id, from_date, to_date, "BACKFILL", settings.pipeline_version),
+                payload,
+            ))
+
+    # One multi-row insert and batched sends for all runs of all AOIs
+    created = create_jobs(db, jobs)
+    db.commit()
+    enqueue_jobs(get_sqs_client(), settings.sqs_queue_name, created)
+    queued = len(created)
 
     audit = get_audit_logger(db)
     audit.log(
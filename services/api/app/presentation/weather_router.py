@@ -80,7 +80,7 @@ async def sync_weather_data(
         INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
         VALUES (:tenant_id, :aoi_id, 'PROCESS_WEATHER', :job_key, 'PENDING', :payload)
         ON CONFLICT (tenant_id, job_key) DO UPDATE
-        SET status = 'PENDING', updated_at = now()
+        SET status = 'PENDING', attempts = 0, lease_expires_at = NULL, leased_by = NULL, updated_at = now()
         RETURNING id
     """)
     
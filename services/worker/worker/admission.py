@@ -0,0 +1,231 @@
+"""
+Memory-aware job admission.
+
+Raster jobs allocate full-grid arrays over their AOI's bounding box, so their
+peak memory grows with AOI area, band count and resolution - a job count alone
+says nothing about whether the next job fits. Before a job starts, the worker
+runtime estimates its peak memory (estimate_job_memory) and admits it only
+once that much of the host memory budget (host_memory_budget) is free.
+
+A job whose estimate exceeds the whole budget can't run in memory at all.
+Job types with a block-wise path (OUT_OF_CORE_JOB_TYPES) are admitted with
+payload["processing_mode"] = "out_of_core" and reserve only their block
+working set; any other oversized job reserves the whole budget and runs alone.
+
+With settings.use_dynamic_tiling, PROCESS_WEEK only delegates to
+CALCULATE_STATS (TiTiler reads, no full-grid arrays): it is charged the
+per-job base and never routed out of core.
+"""
+import asyncio
+import json
+import math
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import structlog
+from shapely.geometry import shape
+
+from worker.config import settings
+
+logger = structlog.get_logger()
+
+MB = 1024 * 1024
+
+PROCESSING_MODES = ("in_memory", "out_of_core")
+
+# Metres per degree of latitude
+METERS_PER_DEGREE = 111_320.0
+
+
+@dataclass(frozen=True)
+class MemoryProfile:
+    """Peak memory of a per-AOI raster job: bytes per grid pixel at a resolution."""
+    resolution_m: float
+    bytes_per_pixel: int
+
+
+# Peak full-grid arrays per job type:
+#   PROCESS_WEEK: 7-band float32 stack + 14 float32 indices + int16 multi-band
+#                 copy / COG encode buffers
+#   PROCESS_RADAR_WEEK: VV, VH, RVI, ratio and their float32 temporaries
+#   PROCESS_TOPOGRAPHY: DEM plus float64 gradients / slope at 30 m
+JOB_MEMORY_PROFILES: Dict[str, MemoryProfile] = {
+    "PROCESS_WEEK": MemoryProfile(resolution_m=10.0, bytes_per_pixel=120),
+    "PROCESS_RADAR_WEEK": MemoryProfile(resolution_m=10.0, bytes_per_pixel=40),
+    "PROCESS_TOPOGRAPHY": MemoryProfile(resolution_m=30.0, bytes_per_pixel=64),
+}
+
+
+# Job types that honour processing_mode="out_of_core" (pipeline/out_of_core.py)
+OUT_OF_CORE_JOB_TYPES = {"PROCESS_WEEK"}
+
+# Blocks alive at once on the out-of-core path (one computing, one prefetching)
+OUT_OF_CORE_BLOCKS_IN_FLIGHT = 2
+
+# Job types that hold no full-grid arrays when settings.use_dynamic_tiling is on
+DYNAMIC_TILING_JOB_TYPES = {"PROCESS_WEEK"}
+
+
+def uses_dynamic_tiling(job_type: Optional[str]) -> bool:
+    """Whether a job of this type runs on the dynamic-tiling (TiTiler) path."""
+    return settings.use_dynamic_tiling and job_type in DYNAMIC_TILING_JOB_TYPES
+
+
+def resolve_processing_mode(payload: Dict[str, Any]) -> str:
+    """Processing mode for a job: payload["processing_mode"] (set on admission) or in-memory."""
+    mode = payload.get("processing_mode") or "in_memory"
+    if mode not in PROCESSING_MODES:
+        raise ValueError(f"Unknown processing_mode '{mode}', expected one of {PROCESSING_MODES}")
+    return mode
+
+
+def aoi_grid_pixels(aoi_geom: Dict[str, Any], resolution_m: float) -> int:
+    """Pixels of the AOI's bounding-box grid at resolution_m (EPSG:4326 geometry)."""
+    minx, miny, maxx, maxy = shape(aoi_geom).bounds
+    lat = math.radians((miny + maxy) / 2)
+    width_m = (maxx - minx) * METERS_PER_DEGREE * math.cos(lat)
+    height_m = (maxy - miny) * METERS_PER_DEGREE
+    return math.ceil(width_m / resolution_m) * math.ceil(height_m / resolution_m)
+
+
+def estimate_job_memory(job_type: Optional[str], payload: Dict[str, Any], db) -> int:
+    """
+    Estimated peak memory of a job in bytes.
+
+    Per-AOI raster jobs (JOB_MEMORY_PROFILES) are sized from their AOI geometry;
+    everything else, including jobs on the dynamic-tiling path, is charged the
+    per-job base only.
+    """
+    from worker.shared.utils import get_aoi_geometry
+
+    base = settings.job_base_memory_mb * MB
+    profile = JOB_MEMORY_PROFILES.get(job_type)
+    if profile is None or not payload.get("aoi_id") or uses_dynamic_tiling(job_type):
+        return base
+    aoi_geom = get_aoi_geometry(payload["aoi_id"], db)
+    return base + aoi_grid_pixels(aoi_geom, profile.resolution_m) * profile.bytes_per_pixel
+
+
+def estimate_out_of_core_memory(job_type: Optional[str]) -> int:
+    """Peak memory of a job on the block-wise path: independent of AOI size."""
+    profile = JOB_MEMORY_PROFILES[job_type]
+    block_pixels = settings.out_of_core_block_size ** 2
+    return (
+        settings.job_base_memory_mb * MB
+        + OUT_OF_CORE_BLOCKS_IN_FLIGHT * block_pixels * profile.bytes_per_pixel
+    )
+
+
+def _cgroup_memory_limit() -> Optional[int]:
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            return int(value)
+    return None
+
+
+def host_memory_budget() -> int:
+    """
+    Bytes of memory jobs may reserve: settings.worker_memory_budget_mb, or
+    settings.worker_memory_fraction of the container (cgroup) / host memory.
+    """
+    if settings.worker_memory_budget_mb:
+        return settings.worker_memory_budget_mb * MB
+    total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    limit = _cgroup_memory_limit()
+    if limit is not None:
+        total = min(total, limit)
+    return int(total * settings.worker_memory_fraction)
+
+
+class MemoryAdmission:
+    """
+    Admits jobs against a memory budget.
+
+    Jobs are admitted in arrival order: a large job waiting for memory is not
+    overtaken by smaller ones that would otherwise keep the budget busy.
+
+    Args:
+        budget: bytes jobs may reserve in total
+        estimate: blocking callable(job_type, payload) -> estimated peak bytes
+    """
+
+    def __init__(self, budget: int, estimate: Callable[[Optional[str], Dict[str, Any]], int]):
+        self.budget = budget
+        self.estimate = estimate
+        self.reserved = 0
+        self._waiting: deque = deque()
+        self._changed: Optional[asyncio.Condition] = None
+
+    def plan(self, message: dict) -> Tuple[dict, int]:
+        """
+        Estimate a message's job (blocking).
+
+        Returns:
+            (message to run - payload marked out_of_core if it can't fit the
+            budget, bytes to reserve)
+        """
+        body = message.get("Body")
+        try:
+            if not isinstance(body, (dict, list)):
+                body = json.loads(body)
+            job_type = body.get("job_type")
+            payload = body.get("payload") or {}
+        except (TypeError, ValueError, AttributeError):
+            return message, settings.job_base_memory_mb * MB
+
+        try:
+            estimate = self.estimate(job_type, payload)
+        except Exception as e:
+            logger.warning("job_memory_estimate_failed", job_type=job_type, error=str(e))
+            estimate = settings.job_base_memory_mb * MB
+
+        if estimate <= self.budget:
+            return message, estimate
+
+        if job_type not in OUT_OF_CORE_JOB_TYPES or uses_dynamic_tiling(job_type):
+            # No block-wise path: give it the whole budget
+            logger.warning(
+                "job_exceeds_memory_budget", job_type=job_type,
+                estimate_mb=estimate // MB, budget_mb=self.budget // MB,
+            )
+            return message, self.budget
+
+        # Too big to hold in memory: run it block by block
+        logger.info(
+            "job_routed_out_of_core",
+            job_id=body.get("job_id"),
+            job_type=job_type,
+            estimate_mb=estimate // MB,
+            budget_mb=self.budget // MB,
+        )
+        body = dict(body, payload=dict(payload, processing_mode="out_of_core"))
+        reservation = min(self.budget, estimate_out_of_core_memory(job_type))
+        return dict(message, Body=json.dumps(body)), reservation
+
+    async def acquire(self, nbytes: int):
+        """Wait until nbytes fit the budget and it's this job's turn."""
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        ticket = object()
+        self._waiting.append(ticket)
+        async with self._changed:
+            try:
+                await self._changed.wait_for(
+                    lambda: self._waiting[0] is ticket and self.reserved + nbytes <= self.budget
+                )
+                self.reserved += nbytes
+            finally:
+                self._waiting.remove(ticket)
+                self._changed.notify_all()
+
+    async def release(self, nbytes: int):
+        async with self._changed:
+            self.reserved -= nbytes
+            self._changed.notify_all()
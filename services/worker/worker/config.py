@@ -19,12 +19,38 @@ class Settings(BaseSettings):
     aws_secret_access_key: str | None = None
     s3_bucket: str
     s3_force_path_style: bool = False
+    # Shared S3 client and I/O pool (shared/aws_clients.py): connections and
+    # threads for concurrent uploads/reads, multipart above the threshold
+    s3_max_pool_connections: int = 32
+    s3_io_threads: int = 16
+    s3_job_upload_concurrency: int = 4  # Outputs of one job in flight at once
+    s3_multipart_threshold_mb: int = 16
+    s3_multipart_chunk_mb: int = 16
+    s3_multipart_concurrency: int = 8  # Parts of one object in flight at once
     
     sqs_queue_name: str
     sqs_queue_high_priority_name: str = "vivacampo-jobs-high"
     sqs_dlq_name: str
-    sqs_visibility_timeout_seconds: int = 900
+    # Kept short: the worker heartbeat extends leases of running jobs, so a
+    # crashed worker's messages come back after one timeout
+    sqs_visibility_timeout_seconds: int = 120
+    sqs_heartbeat_interval_seconds: int = 30
+    sqs_max_lease_seconds: int = 6 * 3600  # Stop extending runaway jobs
+    sqs_delete_flush_seconds: float = 1.0  # Finished messages are deleted in batches this often
     sqs_max_receive_count: int = 3
+
+    # Where the worker gets jobs: "sqs", or "postgres" to claim PENDING rows
+    # straight from the jobs table (worker/shared/pg_queue.py; producers then
+    # skip the SQS send). The postgres backend reuses the SQS lease and
+    # max-receive settings above.
+    queue_backend: Literal["sqs", "postgres"] = "sqs"
+    queue_poll_interval_seconds: float = 1.0
+    queue_retry_backoff_seconds: int = 30  # Doubled per attempt
+    queue_claim_depth: int = 20  # Oldest claimable jobs per tenant ranked by each claim
+    # A new job only attaches to a PENDING / WAITING / RUNNING job with the same
+    # key (job_queue.create_jobs) if that one was updated this recently or holds
+    # a live lease; an older one is presumed lost and reset
+    job_coalesce_max_age_seconds: int = 6 * 3600
     
     # TiTiler
     tiler_url: str = "http://tiler:8080"
@@ -35,6 +61,87 @@ class Settings(BaseSettings):
     max_cloud_cover: int = 100
     min_valid_pixel_ratio: float = 0.01
 
+    # Band ingestion (overridable per job with payload["ingestion_mode"])
+    # "windowed": range-read only the COG tiles overlapping the AOI
+    # "download": legacy full-asset download, then clip locally
+    band_ingestion_mode: Literal["windowed", "download"] = "windowed"
+
+    # Host-local source asset cache shared by all worker processes
+    asset_cache_enabled: bool = True
+    asset_cache_dir: str | None = None  # Defaults to <tmpdir>/vivacampo-asset-cache
+    asset_cache_max_mb: int = 20480
+
+    # Derived rasters up to this size are encoded to COG in memory and uploaded
+    # straight from the buffer; larger ones spill to a temp file first
+    in_memory_raster_max_mb: int = 256
+
+    # Stage checkpoints of PROCESS_WEEK / PROCESS_RADAR_WEEK (shared/checkpoints.py):
+    # a rerun of the same job resumes after its last completed stage. Band
+    # stacks up to this size are also kept in S3 (under checkpoints/) so a
+    # rerun skips the band reads; 0 = don't keep them
+    checkpoints_enabled: bool = True
+    checkpoint_band_stack_max_mb: int = 512
+
+    # Bulk upserts (shared/bulk_writer.py): batches of at least this many rows
+    # are COPYed through a temp table, smaller ones are one INSERT ... VALUES
+    bulk_copy_min_rows: int = 50
+
+    # Index rasters per AOI-week: "per_index" = one float32 COG per index,
+    # "multiband" = one int16 scale/offset COG with a band per index
+    index_output_mode: Literal["per_index", "multiband"] = "per_index"
+
+    # Worker runtime (worker/runtime.py). WORKER_CONCURRENCY (env) caps jobs in
+    # flight; job types listed here are additionally capped individually
+    raster_threads: int = 8  # Shared executor for blocking raster reads/compute
+    job_type_concurrency: dict[str, int] = {
+        "BACKFILL": 1,
+        "CREATE_MOSAIC": 1,
+        "SYNC_SCENE_CATALOG": 1,
+    }
+    # Prometheus metrics (worker/metrics.py) served on this port; 0 = off
+    metrics_port: int = 9100
+    # Job profiling (worker/profiling.py): jobs with payload.profile = true,
+    # plus this fraction of all jobs, run under cProfile and tracemalloc
+    profile_sample_rate: float = 0.0
+    profile_top_n: int = 40  # Functions / allocation sites in the text summaries
+    # Fair scheduling (worker/scheduling.py): interactive jobs start first,
+    # then slots are shared between tenants by weight (default 1) and, within
+    # a tenant, between job types by weight
+    scheduler_lookahead: int = 0  # Extra messages held to choose from; 0 = WORKER_CONCURRENCY
+    # Messages held back by a job type / tenant cap that don't count against the lookahead
+    scheduler_max_blocked: int = 20
+    tenant_concurrency_limit: int = 0  # Max running jobs per tenant; 0 = no cap
+    tenant_concurrency: dict[str, int] = {}  # Per-tenant cap overrides (tenant id -> cap)
+    tenant_weights: dict[str, float] = {}
+    job_type_weights: dict[str, float] = {}
+    # BACKFILLs without payload.priority_class spanning up to this many weeks
+    # are interactive (e.g. a user's short reprocess), longer ones bulk
+    interactive_backfill_max_weeks: int = 12
+    # Process pool for CPU-bound raster stages of job types whose
+    # JobHandler.cpu_mode is "process" (worker/pipeline/cpu_pool.py)
+    cpu_pool_enabled: bool = True
+    cpu_pool_processes: int = 0  # 0 = one per CPU
+    # Memory admission (worker/admission.py): jobs start only when their
+    # estimated peak memory fits the budget; larger-than-budget jobs run out-of-core
+    memory_admission_enabled: bool = True
+    worker_memory_budget_mb: int = 0  # 0 = worker_memory_fraction of container/host memory
+    worker_memory_fraction: float = 0.8
+    job_base_memory_mb: int = 200  # Charged to every job (GDAL/HTTP buffers, interpreter share)
+    out_of_core_block_size: int = 1024  # Pixels per block side (rounded to source COG tiles)
+
+    # Local STAC scene catalog (kept current by SYNC_SCENE_CATALOG)
+    scene_catalog_enabled: bool = True
+    scene_catalog_bbox: list[float] = [-74.0, -34.0, -34.0, 6.0]  # Brazil
+    scene_catalog_collections: list[str] = ["sentinel-2-l2a", "sentinel-1-rtc"]
+    scene_catalog_lookback_days: int = 30  # First sync window
+    scene_catalog_overlap_days: int = 3  # Re-sync to pick up late-published scenes
+
+    # AOI-local cloud pre-screen: rank candidate scenes by the valid-pixel
+    # fraction of a coarse SCL read over the AOI before fetching any band
+    cloud_prescreen_enabled: bool = True
+    cloud_prescreen_resolution_m: float = 160.0
+    cloud_prescreen_max_scenes: int = 8  # Candidates screened, lowest scene cloud cover first
+
     # Dynamic Tiling (ADR-0007)
     # When enabled, skips per-AOI COG generation and uses MosaicJSON + TiTiler instead
     use_dynamic_tiling: bool = True  # Default to new architecture
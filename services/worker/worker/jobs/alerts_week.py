@@ -8,12 +8,15 @@ import structlog
 from typing import Dict, Any
 import json
 
+from worker.shared.utils import payload_weeks
+
 logger = structlog.get_logger()
 
 
 async def handle_alerts_week(job: Dict[str, Any], db: Session):
     """
-    Generate alerts for a specific week based on observations.
+    Generate alerts for a week, or for each week of a range job
+    (payload["weeks"], see payload_weeks()), based on observations.
     
     Alert types:
     - LOW_NDVI: NDVI below critical threshold
@@ -25,14 +28,35 @@ async def handle_alerts_week(job: Dict[str, Any], db: Session):
     
     tenant_id = job["tenant_id"]
     aoi_id = job["aoi_id"]
-    year = job["payload"]["year"]
-    week = job["payload"]["week"]
+    weeks = payload_weeks(job["payload"])
     
     # Get tenant settings
     sql = text("SELECT min_valid_pixel_ratio FROM tenant_settings WHERE tenant_id = :tenant_id")
     settings_result = db.execute(sql, {"tenant_id": tenant_id}).fetchone()
     min_valid_ratio = settings_result.min_valid_pixel_ratio if settings_result else 0.15
     
+    alert_types = []
+    for year, week in weeks:
+        week_alerts = _generate_week_alerts(tenant_id, aoi_id, year, week, min_valid_ratio, db)
+        if week_alerts is None and len(weeks) == 1:
+            return
+        alert_types += week_alerts or []
+    
+    db.commit()
+    
+    logger.info("alerts_week_completed", 
+                job_id=job["id"], 
+                weeks=len(weeks),
+                alerts_created=len(alert_types))
+    
+    return {
+        "alerts_created": len(alert_types),
+        "alert_types": alert_types
+    }
+
+
+def _generate_week_alerts(tenant_id: str, aoi_id: str, year: int, week: int, min_valid_ratio: float, db: Session):
+    """Create or update one week's alerts (not committed); None if the week has no observation."""
     # Get current observation
     sql = text("""
         SELECT status, valid_pixel_ratio, ndvi_mean, ndvi_p10, anomaly
@@ -50,7 +74,7 @@ async def handle_alerts_week(job: Dict[str, Any], db: Session):
     
     if not obs:
         logger.warning("no_observation_found", aoi_id=aoi_id, year=year, week=week)
-        return
+        return None
     
     alerts_to_create = []
     
@@ -191,13 +215,4 @@ async def handle_alerts_week(job: Dict[str, Any], db: Session):
                 "evidence": json.dumps(alert_data["evidence"])
             })
     
-    db.commit()
-    
-    logger.info("alerts_week_completed", 
-                job_id=job["id"], 
-                alerts_created=len(alerts_to_create))
-    
-    return {
-        "alerts_created": len(alerts_to_create),
-        "alert_types": [a["alert_type"] for a in alerts_to_create]
-    }
+    return [a["alert_type"] for a in alerts_to_create]
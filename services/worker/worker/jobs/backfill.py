@@ -1,17 +1,21 @@
 """
 BACKFILL handler - Orchestrate processing of historical data.
-Creates PROCESS_WEEK, ALERTS_WEEK, SIGNALS_WEEK, and FORECAST_WEEK jobs for each week.
+Creates PROCESS_WEEK and FORECAST_WEEK jobs for each week, and one
+ALERTS_WEEK and SIGNALS_WEEK range job for all of them.
 """
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 import structlog
 from typing import Dict, Any
-import json
 from datetime import datetime, timedelta
-import hashlib
 
 logger = structlog.get_logger()
 
+# Weekly job types that read observations_weekly (released after PROCESS_WEEK)
+OBSERVATION_JOB_TYPES = {"ALERTS_WEEK", "SIGNALS_WEEK", "FORECAST_WEEK"}
+# Of those, the ones created as a single job over the backfill's weeks
+RANGE_JOB_TYPES = {"ALERTS_WEEK", "SIGNALS_WEEK"}
+
 
 async def handle_backfill(job: Dict[str, Any], db: Session):
     """
@@ -22,6 +26,22 @@ async def handle_backfill(job: Dict[str, Any], db: Session):
     2. ALERTS_WEEK (generate alerts)
     3. SIGNALS_WEEK (generate signals)
     4. FORECAST_WEEK (generate forecasts)
+
+    All child jobs are inserted in bulk and enqueued in batches of 10. They
+    inherit the backfill's priority class (payload["priority_class"]; without
+    one, backfills of up to settings.interactive_backfill_max_weeks weeks are
+    interactive).
+    ALERTS_WEEK, SIGNALS_WEEK and FORECAST_WEEK read the week's observations,
+    so they wait (job_dependencies) for that week's PROCESS_WEEK to finish;
+    FORECAST_WEEK fails with it if it fails.
+    ALERTS_WEEK and SIGNALS_WEEK are one range job each (payload["weeks"])
+    that waits for every week's PROCESS_WEEK, instead of a job per week, and
+    runs once they have all finished (weeks that failed have no observation
+    and are skipped).
+
+    A child whose job_key matches a job that is still in flight (e.g. an
+    overlapping backfill) attaches to it instead of running again; only
+    newly created jobs are counted.
     """
     logger.info("backfill_started", job_id=job["id"])
     db.execute(text("UPDATE jobs SET status = 'RUNNING', updated_at = now() WHERE id = :job_id"), {"job_id": job["id"]})
@@ -49,7 +69,12 @@ async def handle_backfill(job: Dict[str, Any], db: Session):
     
     # Get pipeline version
     from worker.config import settings
+    from worker.scheduling import BULK, INTERACTIVE, PRIORITY_CLASSES
     pipeline_version = settings.pipeline_version
+
+    job_class = job["payload"].get("priority_class")
+    if job_class not in PRIORITY_CLASSES:
+        job_class = INTERACTIVE if len(weeks_to_process) <= settings.interactive_backfill_max_weeks else BULK
     
     jobs_created = {
         "PROCESS_WEEK": 0,
@@ -61,248 +86,101 @@ async def handle_backfill(job: Dict[str, Any], db: Session):
         "FORECAST_WEEK": 0
     }
     
-    # Create jobs for each week
-    from worker.shared.aws_clients import SQSClient
-    sqs = SQSClient()
-
-    # Create PROCESS_WEATHER (range-based) once per backfill
-    weather_job_key = hashlib.sha256(
-        f"{tenant_id}{aoi_id}{from_date.date().isoformat()}{to_date.date().isoformat()}PROCESS_WEATHER{pipeline_version}".encode()
-    ).hexdigest()
-
-    weather_payload = {
-        "tenant_id": tenant_id,
-        "aoi_id": aoi_id,
-        "start_date": from_date.date().isoformat(),
-        "end_date": to_date.date().isoformat()
-    }
-
-    sql_weather = text("""
-        INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-        VALUES (:tenant_id, :aoi_id, 'PROCESS_WEATHER', :job_key, 'PENDING', :payload)
-        ON CONFLICT (tenant_id, job_key) DO UPDATE 
-        SET status = 'PENDING', updated_at = now()
-        RETURNING id
+    # Collect every child job, then create them in bulk (multi-row upsert)
+    # and enqueue them with SendMessageBatch (see worker/shared/job_queue.py)
+    from worker.shared.job_queue import (
+        NewJob, create_jobs, enqueue_jobs, get_queue_client, job_key, release_ready,
+    )
+    sqs = get_queue_client()
+    jobs = []
+
+    # PROCESS_WEATHER (range-based) once per backfill
+    jobs.append(NewJob(
+        tenant_id, aoi_id, "PROCESS_WEATHER",
+        job_key(tenant_id, aoi_id, from_date.date().isoformat(), to_date.date().isoformat(),
+                "PROCESS_WEATHER", pipeline_version),
+        {
+            "tenant_id": tenant_id,
+            "aoi_id": aoi_id,
+            "start_date": from_date.date().isoformat(),
+            "end_date": to_date.date().isoformat(),
+            "priority_class": job_class,
+        },
+    ))
+
+    # PROCESS_TOPOGRAPHY once per backfill
+    jobs.append(NewJob(
+        tenant_id, aoi_id, "PROCESS_TOPOGRAPHY",
+        job_key(tenant_id, aoi_id, "PROCESS_TOPOGRAPHY", pipeline_version),
+        {"tenant_id": tenant_id, "aoi_id": aoi_id, "priority_class": job_class},
+    ))
+
+    # FORECAST_WEEK only for crop AOIs with a season
+    sql_check_season = text("""
+        SELECT id FROM seasons
+        WHERE tenant_id = :tenant_id AND aoi_id = :aoi_id
     """)
-
-    result = db.execute(sql_weather, {
-        "tenant_id": tenant_id,
-        "aoi_id": aoi_id,
-        "job_key": weather_job_key,
-        "payload": json.dumps(weather_payload)
-    })
-
-    row = result.fetchone()
-    if row:
-        jobs_created["PROCESS_WEATHER"] += 1
-        sqs.send_message({
-            "job_id": str(row[0]),
-            "job_type": "PROCESS_WEATHER",
-            "payload": weather_payload
-        })
-
-    # Create PROCESS_TOPOGRAPHY once per backfill
-    topo_job_key = hashlib.sha256(
-        f"{tenant_id}{aoi_id}PROCESS_TOPOGRAPHY{pipeline_version}".encode()
-    ).hexdigest()
-
-    topo_payload = {
+    has_season = db.execute(sql_check_season, {
         "tenant_id": tenant_id,
         "aoi_id": aoi_id
-    }
-
-    sql_topo = text("""
-        INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-        VALUES (:tenant_id, :aoi_id, 'PROCESS_TOPOGRAPHY', :job_key, 'PENDING', :payload)
-        ON CONFLICT (tenant_id, job_key) DO UPDATE 
-        SET status = 'PENDING', updated_at = now()
-        RETURNING id
-    """)
-
-    result = db.execute(sql_topo, {
-        "tenant_id": tenant_id,
-        "aoi_id": aoi_id,
-        "job_key": topo_job_key,
-        "payload": json.dumps(topo_payload)
-    })
+    }).fetchone()
 
-    row = result.fetchone()
-    if row:
-        jobs_created["PROCESS_TOPOGRAPHY"] += 1
-        sqs.send_message({
-            "job_id": str(row[0]),
-            "job_type": "PROCESS_TOPOGRAPHY",
-            "payload": topo_payload
-        })
+    weekly_job_types = ["PROCESS_WEEK", "PROCESS_RADAR_WEEK", "ALERTS_WEEK"]
+    if settings.signals_enabled:
+        weekly_job_types.append("SIGNALS_WEEK")
+    if has_season:
+        weekly_job_types.append("FORECAST_WEEK")
 
+    process_week_keys = []
     for year, week in weeks_to_process:
-        # 1. PROCESS_WEEK
-        job_key = hashlib.sha256(
-            f"{tenant_id}{aoi_id}{year}{week}PROCESS_WEEK{pipeline_version}".encode()
-        ).hexdigest()
-        
         payload_dict = {
             "tenant_id": tenant_id,
             "aoi_id": aoi_id,
             "year": year,
-            "week": week
+            "week": week,
+            "priority_class": job_class,
         }
-
-        sql = text("""
-            INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-            VALUES (:tenant_id, :aoi_id, 'PROCESS_WEEK', :job_key, 'PENDING', :payload)
-            ON CONFLICT (tenant_id, job_key) DO UPDATE 
-            SET status = 'PENDING', updated_at = now()
-            RETURNING id
-        """)
-        
-        result = db.execute(sql, {
-            "tenant_id": tenant_id,
-            "aoi_id": aoi_id,
-            "job_key": job_key,
-            "payload": json.dumps(payload_dict)
-        })
-        
-        row = result.fetchone()
-        if row:
-            jobs_created["PROCESS_WEEK"] += 1
-            sqs.send_message({
-                "job_id": str(row[0]),
-                "job_type": "PROCESS_WEEK",
-                "payload": payload_dict
-            })
-
-        # 1b. PROCESS_RADAR_WEEK
-        job_key = hashlib.sha256(
-            f"{tenant_id}{aoi_id}{year}{week}PROCESS_RADAR_WEEK{pipeline_version}".encode()
-        ).hexdigest()
-
-        sql = text("""
-            INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-            VALUES (:tenant_id, :aoi_id, 'PROCESS_RADAR_WEEK', :job_key, 'PENDING', :payload)
-            ON CONFLICT (tenant_id, job_key) DO UPDATE 
-            SET status = 'PENDING', updated_at = now()
-            RETURNING id
-        """)
-
-        result = db.execute(sql, {
-            "tenant_id": tenant_id,
-            "aoi_id": aoi_id,
-            "job_key": job_key,
-            "payload": json.dumps(payload_dict)
-        })
-
-        row = result.fetchone()
-        if row:
-            jobs_created["PROCESS_RADAR_WEEK"] += 1
-            sqs.send_message({
-                "job_id": str(row[0]),
-                "job_type": "PROCESS_RADAR_WEEK",
-                "payload": payload_dict
-            })
-        
-        # 2. ALERTS_WEEK
-        job_key = hashlib.sha256(
-            f"{tenant_id}{aoi_id}{year}{week}ALERTS_WEEK{pipeline_version}".encode()
-        ).hexdigest()
-        
-        sql = text("""
-            INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-            VALUES (:tenant_id, :aoi_id, 'ALERTS_WEEK', :job_key, 'PENDING', :payload)
-            ON CONFLICT (tenant_id, job_key) DO UPDATE 
-            SET status = 'PENDING', updated_at = now()
-            RETURNING id
-        """)
-
-        result = db.execute(sql, {
-            "tenant_id": tenant_id,
-            "aoi_id": aoi_id,
-            "job_key": job_key,
-            "payload": json.dumps(payload_dict)
-        })
-        
-        row = result.fetchone()
-        if row:
-            jobs_created["ALERTS_WEEK"] += 1
-            sqs.send_message({
-                "job_id": str(row[0]),
-                "job_type": "ALERTS_WEEK",
-                "payload": payload_dict
-            })
-        
-        # 3. SIGNALS_WEEK (only if signals enabled)
-        if settings.signals_enabled:
-            job_key = hashlib.sha256(
-                f"{tenant_id}{aoi_id}{year}{week}SIGNALS_WEEK{pipeline_version}".encode()
-            ).hexdigest()
-            
-            sql_signals = text("""
-                INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-                VALUES (:tenant_id, :aoi_id, 'SIGNALS_WEEK', :job_key, 'PENDING', :payload)
-                ON CONFLICT (tenant_id, job_key) DO UPDATE 
-                SET status = 'PENDING', updated_at = now()
-                RETURNING id
-            """)
-            
-            result = db.execute(sql_signals, {
+        process_week_key = job_key(tenant_id, aoi_id, year, week, "PROCESS_WEEK", pipeline_version)
+        process_week_keys.append(process_week_key)
+        for job_type in weekly_job_types:
+            if job_type in RANGE_JOB_TYPES:
+                continue
+            jobs.append(NewJob(
+                tenant_id, aoi_id, job_type,
+                job_key(tenant_id, aoi_id, year, week, job_type, pipeline_version),
+                payload_dict,
+                depends_on=[process_week_key] if job_type in OBSERVATION_JOB_TYPES else [],
+            ))
+
+    # Range jobs: one per job type over all weeks
+    range_job_types = [t for t in weekly_job_types if t in RANGE_JOB_TYPES] if weeks_to_process else []
+    for job_type in range_job_types:
+        (first_year, first_week), (last_year, last_week) = weeks_to_process[0], weeks_to_process[-1]
+        jobs.append(NewJob(
+            tenant_id, aoi_id, job_type,
+            job_key(tenant_id, aoi_id, first_year, first_week, last_year, last_week, job_type, pipeline_version),
+            {
                 "tenant_id": tenant_id,
                 "aoi_id": aoi_id,
-                "job_key": job_key,
-                "payload": json.dumps(payload_dict)
-            })
-            
-            row = result.fetchone()
-            if row:
-                jobs_created["SIGNALS_WEEK"] += 1
-                sqs.send_message({
-                    "job_id": str(row[0]),
-                    "job_type": "SIGNALS_WEEK",
-                    "payload": payload_dict
-                })
-        
-        # 4. FORECAST_WEEK (only for crop AOIs with active season)
-        sql_check_season = text("""
-            SELECT id FROM seasons
-            WHERE tenant_id = :tenant_id AND aoi_id = :aoi_id
-        """)
-        
-        has_season = db.execute(sql_check_season, {
-            "tenant_id": tenant_id,
-            "aoi_id": aoi_id
-        }).fetchone()
-        
-        if has_season:
-            job_key = hashlib.sha256(
-                f"{tenant_id}{aoi_id}{year}{week}FORECAST_WEEK{pipeline_version}".encode()
-            ).hexdigest()
-            
-            sql_forecast = text("""
-                INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, payload_json)
-                VALUES (:tenant_id, :aoi_id, 'FORECAST_WEEK', :job_key, 'PENDING', :payload)
-                ON CONFLICT (tenant_id, job_key) DO UPDATE 
-                SET status = 'PENDING', updated_at = now()
-                RETURNING id
-            """)
-            
-            result = db.execute(sql_forecast, {
-                "tenant_id": tenant_id,
-                "aoi_id": aoi_id,
-                "job_key": job_key,
-                "payload": json.dumps(payload_dict)
-            })
-            
-            row = result.fetchone()
-            if row:
-                jobs_created["FORECAST_WEEK"] += 1
-                sqs.send_message({
-                    "job_id": str(row[0]),
-                    "job_type": "FORECAST_WEEK",
-                    "payload": payload_dict
-                })
-    
+                "weeks": [[year, week] for year, week in weeks_to_process],
+                "priority_class": job_class,
+            },
+            depends_on=process_week_keys,
+        ))
+
+    created = create_jobs(db, jobs)
+    # Commit before enqueueing so consumers always find their job row
     db.commit()
+    enqueue_jobs(sqs, created)
+    # A new job may wait on a PROCESS_WEEK it attached to that finished
+    # before this commit; its release then found nothing to release
+    waiting = [job_id for job_id, created_job in created if created_job.depends_on and not created_job.coalesced]
+    enqueue_jobs(sqs, release_ready(db, waiting))
+    db.commit()
+    for _, created_job in created:
+        if not created_job.coalesced:
+            jobs_created[created_job.job_type] += 1
     
-    # Update status of THIS job (the backfill job)
     # Update status of THIS job (the backfill job)
     sql_update = text("UPDATE jobs SET status = 'DONE', updated_at = now() WHERE id = :job_id")
     db.execute(sql_update, {"job_id": job["id"]})
@@ -24,22 +24,18 @@ from shapely.geometry import mapping
 
 from worker.config import settings
 from worker.jobs.create_mosaic import ensure_mosaic_exists
+from worker.metrics import stage
+from worker.pipeline.indices import titiler_expressions
+from worker.runtime import run_async
+from worker.shared.bulk_writer import UpsertTarget, upsert_rows
 
 logger = structlog.get_logger()
 
 # TiTiler URL (internal service URL)
 TILER_URL = settings.tiler_url
 
-# Vegetation indices to calculate
-INDICES = {
-    "ndvi": "(B08-B04)/(B08+B04)",
-    "ndwi": "(B03-B08)/(B03+B08)",
-    "ndmi": "(B08-B11)/(B08+B11)",
-    "evi": "2.5*(B08-B04)/(B08+6*B04-7.5*B02+1)",
-    "savi": "1.5*(B08-B04)/(B08+B04+0.5)",
-    "ndre": "(B08-B05)/(B08+B05)",
-    "gndvi": "(B08-B03)/(B08+B03)",
-}
+# Vegetation indices to calculate (expressions come from the shared index engine)
+INDICES = titiler_expressions(["ndvi", "ndwi", "ndmi", "evi", "savi", "ndre", "gndvi"])
 
 # HTTP client timeout
 HTTP_TIMEOUT = 120.0  # 2 minutes for stats calculation
@@ -243,41 +239,29 @@ def _save_observations(
                 columns.append(col_name)
                 values[col_name] = index_stats.get(field)
 
-    # Build SQL dynamically
-    columns_str = ", ".join(columns)
-    placeholders = ", ".join(f":{col}" for col in columns)
-
-    # Build ON CONFLICT update clause
-    update_cols = [c for c in columns if c not in ["tenant_id", "aoi_id", "year", "week", "pipeline_version"]]
-    update_str = ", ".join(f"{c} = :{c}" for c in update_cols)
-
-    sql = text(f"""
-        INSERT INTO observations_weekly ({columns_str})
-        VALUES ({placeholders})
-        ON CONFLICT (tenant_id, aoi_id, year, week, pipeline_version)
-        DO UPDATE SET {update_str}, updated_at = NOW()
-    """)
+    target = UpsertTarget(
+        table="observations_weekly",
+        columns=tuple(columns),
+        key=("tenant_id", "aoi_id", "year", "week", "pipeline_version"),
+        touch_updated_at=True,
+    )
 
     try:
-        db.execute(sql, values)
-        db.commit()
+        upsert_rows(db, target, [values])
         logger.debug("observations_saved", aoi_id=aoi_id, year=year, week=week)
     except Exception as e:
         logger.error("observations_save_failed", error=str(e))
-        db.rollback()
         raise
 
 
 # Sync wrapper for compatibility with existing job system
 def calculate_stats_sync_handler(job_id: str, payload: dict, db: Session) -> dict:
     """Sync wrapper for calculate_stats_handler."""
-    import asyncio
-
     job = {
         "id": job_id,
         "payload": payload,
     }
-    return asyncio.run(calculate_stats_handler(job, db))
+    return run_async(calculate_stats_handler(job, db))
 
 
 def calculate_stats_handler(job_id: str, payload: dict, db: Session) -> dict:
@@ -295,21 +279,13 @@ def calculate_stats_handler(job_id: str, payload: dict, db: Session) -> dict:
     Returns:
         dict with status and results
     """
-    import asyncio
-
     job = {
         "id": job_id,
         "payload": payload,
     }
 
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(calculate_stats_async_handler(job, db))
-            return result
-        finally:
-            loop.close()
+        return run_async(calculate_stats_async_handler(job, db))
     except Exception as e:
         logger.error("calculate_stats_failed", job_id=job_id, error=str(e), exc_info=True)
         raise
@@ -337,10 +313,11 @@ async def calculate_stats_async_handler(job: dict, db: Session) -> dict:
     )
 
     # 1. Get AOI geometry from database
-    aoi_result = db.execute(
-        text("SELECT ST_AsText(geom) as geom_wkt FROM aois WHERE id = :aoi_id AND tenant_id = :tenant_id"),
-        {"aoi_id": aoi_id, "tenant_id": tenant_id},
-    ).fetchone()
+    with stage("db"):
+        aoi_result = db.execute(
+            text("SELECT ST_AsText(geom) as geom_wkt FROM aois WHERE id = :aoi_id AND tenant_id = :tenant_id"),
+            {"aoi_id": aoi_id, "tenant_id": tenant_id},
+        ).fetchone()
 
     if not aoi_result:
         raise ValueError(f"AOI {aoi_id} not found for tenant {tenant_id}")
@@ -349,8 +326,9 @@ async def calculate_stats_async_handler(job: dict, db: Session) -> dict:
     geom = wkt.loads(aoi_result.geom_wkt)
     geometry_geojson = mapping(geom)
 
-    # 2. Verify mosaic exists
-    mosaic_url = ensure_mosaic_exists(year, week, "sentinel-2-l2a")
+    # 2. Verify mosaic exists (scene search, mosaic creation if missing)
+    with stage("search"):
+        mosaic_url = ensure_mosaic_exists(year, week, "sentinel-2-l2a")
     if not mosaic_url:
         logger.warning(
             "mosaic_not_found",
@@ -358,32 +336,35 @@ async def calculate_stats_async_handler(job: dict, db: Session) -> dict:
             week=week,
         )
         # Mark as NO_DATA in observations
-        _save_observations(db, tenant_id, aoi_id, year, week, {}, status="NO_DATA")
+        with stage("db"):
+            _save_observations(db, tenant_id, aoi_id, year, week, {}, status="NO_DATA")
         return {"status": "NO_DATA", "reason": "mosaic_not_found"}
 
-    # 3. Calculate stats for each index
+    # 3. Calculate stats for each index (TiTiler reads the mosaic)
     all_stats = {}
-    for index_name in indices_to_calc:
-        if index_name not in INDICES:
-            logger.warning("unknown_index", index=index_name)
-            continue
-
-        expression = INDICES[index_name]
-        stats = await fetch_stats_from_tiler(mosaic_url, expression, geometry_geojson)
-
-        if stats:
-            all_stats[index_name] = stats
-            logger.debug(
-                "index_stats_calculated",
-                index=index_name,
-                mean=stats.get("mean"),
-            )
-        else:
-            logger.warning("index_stats_failed", index=index_name)
+    with stage("read"):
+        for index_name in indices_to_calc:
+            if index_name not in INDICES:
+                logger.warning("unknown_index", index=index_name)
+                continue
+
+            expression = INDICES[index_name]
+            stats = await fetch_stats_from_tiler(mosaic_url, expression, geometry_geojson)
+
+            if stats:
+                all_stats[index_name] = stats
+                logger.debug(
+                    "index_stats_calculated",
+                    index=index_name,
+                    mean=stats.get("mean"),
+                )
+            else:
+                logger.warning("index_stats_failed", index=index_name)
 
     # 4. Save to database
     if all_stats:
-        _save_observations(db, tenant_id, aoi_id, year, week, all_stats, status="OK")
+        with stage("db"):
+            _save_observations(db, tenant_id, aoi_id, year, week, all_stats, status="OK")
         logger.info(
             "calculate_stats_complete",
             aoi_id=aoi_id,
@@ -393,5 +374,6 @@ async def calculate_stats_async_handler(job: dict, db: Session) -> dict:
         )
         return {"status": "OK", "indices": list(all_stats.keys())}
     else:
-        _save_observations(db, tenant_id, aoi_id, year, week, {}, status="NO_DATA")
+        with stage("db"):
+            _save_observations(db, tenant_id, aoi_id, year, week, {}, status="NO_DATA")
         return {"status": "NO_DATA", "reason": "no_stats_calculated"}
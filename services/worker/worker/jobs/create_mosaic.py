@@ -17,7 +17,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 import planetary_computer
 from pystac_client import Client
-from shapely.geometry import box
+from shapely.geometry import box, mapping
 
 from worker.config import settings
 from worker.shared.aws_clients import S3Client
@@ -66,7 +66,7 @@ def create_mosaic_json(
     href and let TiTiler/rio-tiler handle band selection via expressions.
 
     Args:
-        scenes: List of STAC items
+        scenes: List of STAC items, or scene dicts from the local scene catalog
         collection: Collection name (e.g., "sentinel-2-l2a")
         year: ISO year
         week: ISO week number
@@ -97,6 +97,11 @@ def create_mosaic_json(
 
         # Get STAC item self-link
         self_link = None
+        if isinstance(item, dict):
+            self_link = item.get("self_href")
+            item_id, item_bbox = item["id"], item.get("bbox")
+        else:
+            item_id, item_bbox = item.id, item.bbox
         if hasattr(item, 'links'):
             for link in item.links:
                 if link.rel == 'self':
@@ -105,16 +110,16 @@ def create_mosaic_json(
 
         if not self_link:
             # Fallback: construct URL from item ID (Planetary Computer format)
-            self_link = f"https://planetarycomputer.microsoft.com/api/stac/v1/collections/{collection}/items/{item.id}"
+            self_link = f"https://planetarycomputer.microsoft.com/api/stac/v1/collections/{collection}/items/{item_id}"
 
         # Store UNSIGNED URL - signing will happen at request time
         # Planetary Computer signed URLs expire, so we don't sign at mosaic creation
         signed_href = self_link
 
         # Get quadkeys covered by this scene
-        if item.bbox:
+        if item_bbox:
             # Calculate quadkeys at maxzoom that intersect this scene
-            tiles = list(mercantile.tiles(*item.bbox, zooms=maxzoom))
+            tiles = list(mercantile.tiles(*item_bbox, zooms=maxzoom))
             for tile in tiles:
                 qk = mercantile.quadkey(tile)
                 if qk not in tiles_dict:
@@ -139,6 +144,80 @@ def create_mosaic_json(
     return mosaic
 
 
+def _catalog_scenes(
+    db: Session,
+    collection: str,
+    start_date: str,
+    end_date: str,
+    max_cloud_cover: float,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Scenes for the week from the local scene catalog, or None when the
+    catalog does not cover Brazil for this week (caller searches live).
+    """
+    from worker.pipeline.scene_catalog import catalog_covers, query_scenes
+
+    if not settings.scene_catalog_enabled:
+        return None
+
+    brazil = mapping(box(*BRAZIL_BBOX))
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1) - timedelta(microseconds=1)
+    if collection != "sentinel-2-l2a":
+        max_cloud_cover = 100
+    try:
+        if not catalog_covers(db, collection, brazil, start, end):
+            return None
+        items = query_scenes(db, collection, brazil, start, end, max_cloud_cover)
+    except Exception as e:
+        logger.warning("scene_catalog_query_failed", error=str(e))
+        db.rollback()
+        return None
+
+    logger.info("scene_catalog_hit", collection=collection, scene_count=len(items))
+    return items
+
+
+def _search_scenes(
+    collection: str,
+    start_date: str,
+    end_date: str,
+    max_cloud_cover: float,
+) -> list:
+    """Live Planetary Computer STAC search for the week over Brazil."""
+    # Connect to Planetary Computer STAC
+    catalog = Client.open(
+        PC_STAC_URL,
+        modifier=planetary_computer.sign_inplace,
+    )
+
+    # Build query
+    query = {}
+    if collection == "sentinel-2-l2a":
+        query["eo:cloud_cover"] = {"lt": max_cloud_cover}
+
+    # Search for scenes
+    logger.info(
+        "stac_search_start",
+        collection=collection,
+        start_date=start_date,
+        end_date=end_date,
+        bbox=BRAZIL_BBOX,
+    )
+
+    search = catalog.search(
+        collections=[collection],
+        bbox=BRAZIL_BBOX,
+        datetime=f"{start_date}/{end_date}",
+        query=query if query else None,
+        max_items=2000,  # Increased to capture more of Brazil
+    )
+
+    items = list(search.items())
+    logger.info("stac_search_complete", scene_count=len(items))
+    return items
+
+
 def create_mosaic_handler(job_id: str, payload: dict, db: Session) -> dict:
     """
     Job handler for CREATE_MOSAIC.
@@ -180,36 +259,9 @@ def create_mosaic_handler(job_id: str, payload: dict, db: Session) -> dict:
         bands = SENTINEL2_BANDS
 
     try:
-        # Connect to Planetary Computer STAC
-        catalog = Client.open(
-            PC_STAC_URL,
-            modifier=planetary_computer.sign_inplace,
-        )
-
-        # Build query
-        query = {}
-        if collection == "sentinel-2-l2a":
-            query["eo:cloud_cover"] = {"lt": max_cloud_cover}
-
-        # Search for scenes
-        logger.info(
-            "stac_search_start",
-            collection=collection,
-            start_date=start_date,
-            end_date=end_date,
-            bbox=BRAZIL_BBOX,
-        )
-
-        search = catalog.search(
-            collections=[collection],
-            bbox=BRAZIL_BBOX,
-            datetime=f"{start_date}/{end_date}",
-            query=query if query else None,
-            max_items=2000,  # Increased to capture more of Brazil
-        )
-
-        items = list(search.items())
-        logger.info("stac_search_complete", scene_count=len(items))
+        items = _catalog_scenes(db, collection, start_date, end_date, max_cloud_cover)
+        if items is None:
+            items = _search_scenes(collection, start_date, end_date, max_cloud_cover)
 
         if not items:
             logger.warning(
@@ -1,33 +1,22 @@
+import asyncio
 import structlog
 from sqlalchemy.orm import Session
 from worker.config import settings
 from worker.shared.aws_clients import S3Client
-import tempfile
-import os
-import rasterio
+from worker.shared.bulk_writer import UpsertTarget, once_per_process, upsert_rows
 import numpy as np
+from worker.pipeline.raster_io import upload_rasters
+from worker.runtime import run_async
+from worker.metrics import stage
+from worker.shared.checkpoints import (
+    BANDS_FETCHED, INDICES_WRITTEN, SCENE_SELECTED, STATS_SAVED, JobCheckpoints, profile_from_json, profile_to_json,
+)
 
 logger = structlog.get_logger()
 
-def export_cog(data: np.ndarray, output_path: str, profile: dict):
-    """Export data as Cloud Optimized GeoTIFF"""
-    cog_profile = profile.copy()
-    cog_profile.update({
-        "driver": "GTiff",
-        "dtype": "float32",
-        "count": 1,
-        "compress": "deflate",
-        "predictor": 2,
-        "tiled": True,
-        "blockxsize": 256,
-        "blockysize": 256
-    })
-    
-    with rasterio.open(output_path, 'w', **cog_profile) as dst:
-        dst.write(data.astype('float32'), 1)
-
+@once_per_process
 def ensure_radar_table_exists(db: Session):
-    """Ensure derived_radar_assets table exists"""
+    """Ensure derived_radar_assets table exists (once per process)"""
     from sqlalchemy import text
     sql = text("""
         CREATE TABLE IF NOT EXISTS derived_radar_assets (
@@ -56,43 +45,31 @@ def ensure_radar_table_exists(db: Session):
     db.execute(sql)
     db.commit()
 
+RADAR_ASSETS = UpsertTarget(
+    table="derived_radar_assets",
+    columns=(
+        "tenant_id", "aoi_id", "year", "week", "pipeline_version",
+        "rvi_s3_uri", "ratio_s3_uri", "vh_s3_uri", "vv_s3_uri",
+        "rvi_mean", "rvi_std", "ratio_mean", "ratio_std",
+    ),
+    key=("tenant_id", "aoi_id", "year", "week", "pipeline_version"),
+    touch_updated_at=True,
+)
+
+
 def save_radar_assets(tenant_id: str, aoi_id: str, year: int, week: int, 
                        rvi_uri: str, ratio_uri: str, vh_uri: str, vv_uri: str,
                        stats: dict, db: Session):
     """Save radar assets to database"""
-    from sqlalchemy import text
-    
     ensure_radar_table_exists(db)
     
-    sql = text("""
-        INSERT INTO derived_radar_assets 
-        (tenant_id, aoi_id, year, week, pipeline_version, 
-         rvi_s3_uri, ratio_s3_uri, vh_s3_uri, vv_s3_uri,
-         rvi_mean, rvi_std, ratio_mean, ratio_std)
-        VALUES 
-        (:tenant_id, :aoi_id, :year, :week, :pipeline_version, 
-         :rvi_uri, :ratio_uri, :vh_uri, :vv_uri,
-         :rvi_mean, :rvi_std, :ratio_mean, :ratio_std)
-        ON CONFLICT (tenant_id, aoi_id, year, week, pipeline_version) DO UPDATE
-        SET rvi_s3_uri = :rvi_uri, 
-            ratio_s3_uri = :ratio_uri, 
-            vh_s3_uri = :vh_uri,
-            vv_s3_uri = :vv_uri,
-            rvi_mean = :rvi_mean, rvi_std = :rvi_std,
-            ratio_mean = :ratio_mean, ratio_std = :ratio_std,
-            updated_at = NOW()
-    """)
-    
-    params = {
+    upsert_rows(db, RADAR_ASSETS, [{
         "tenant_id": tenant_id, "aoi_id": aoi_id, "year": year, "week": week,
         "pipeline_version": settings.pipeline_version,
-        "rvi_uri": rvi_uri, "ratio_uri": ratio_uri, "vh_uri": vh_uri, "vv_uri": vv_uri,
+        "rvi_s3_uri": rvi_uri, "ratio_s3_uri": ratio_uri, "vh_s3_uri": vh_uri, "vv_s3_uri": vv_uri,
         "rvi_mean": stats.get('rvi_mean', 0), "rvi_std": stats.get('rvi_std', 0),
         "ratio_mean": stats.get('ratio_mean', 0), "ratio_std": stats.get('ratio_std', 0)
-    }
-    
-    db.execute(sql, params)
-    db.commit()
+    }])
 
 def update_job_status(job_id: str, status: str, db: Session, error: str = None):
     from sqlalchemy import text
@@ -101,64 +78,101 @@ def update_job_status(job_id: str, status: str, db: Session, error: str = None):
     db.commit()
 
 async def process_radar_week_async(job_id: str, payload: dict, db: Session):
-    from worker.pipeline.stac_client import get_stac_client
+    from worker.pipeline.stac_client import get_stac_client, resolve_ingestion_mode
+    from worker.pipeline.scene_catalog import find_scenes
     from worker.shared.utils import get_week_date_range, get_aoi_geometry
-    import gc
     
     tenant_id = payload['tenant_id']
     aoi_id = payload['aoi_id']
     year = payload['year']
-    year = payload['year']
     week = payload['week']
+    ingestion_mode = resolve_ingestion_mode(payload)
     
     # Ensure table exists regardless of data finding (prevents Frontend 500s)
     ensure_radar_table_exists(db)
     
+    checkpoints = JobCheckpoints(db, job_id)
+    if checkpoints.get(STATS_SAVED):
+        # Only the status update was left
+        update_job_status(job_id, "DONE", db)
+        return
+    
     # 1. Search Scenes
     start_date, end_date = get_week_date_range(year, week)
     aoi_geom = get_aoi_geometry(aoi_id, db)
     client = get_stac_client()
     
-    # Search Sentinel-1 RTC
-    scenes = await client.search_scenes(
-        aoi_geom, start_date, end_date, 
-        max_cloud_cover=100, # Not used for S1 but API requires arg
-        collections=["sentinel-1-rtc"] # Planetary Computer collection
-    )
-    
-    # Filter for valid VV/VH
-    valid_scenes = [s for s in scenes if s['assets'].get('vv') and s['assets'].get('vh')]
+    selection = checkpoints.get(SCENE_SELECTED)
+    if selection is None:
+        # Search Sentinel-1 RTC
+        with stage("search"):
+            scenes = await find_scenes(
+                db, client, aoi_geom, start_date, end_date,
+                max_cloud_cover=100, # Not used for S1 but API requires arg
+                collection="sentinel-1-rtc" # Planetary Computer collection
+            )
+        
+        # Filter for valid VV/VH
+        valid_scenes = [s for s in scenes if s['assets'].get('vv') and s['assets'].get('vh')]
+        
+        # Pick first available scene
+        selection = {'best_scene': valid_scenes[0] if valid_scenes else None}
+        checkpoints.save(SCENE_SELECTED, selection)
+    best_scene = selection['best_scene']
     
-    if not valid_scenes:
+    if not best_scene:
          # No S1 data for this week (uncommon but possible)
          update_job_status(job_id, "DONE", db)
          return
     
-    # Pick first available scene
-    best_scene = valid_scenes[0]
     logger.info("selected_best_radar_scene", scene_id=best_scene['id'])
     
-    # 3. Download and Process
-    with tempfile.TemporaryDirectory() as tmpdir:
-        band_paths = {}
-        profile = None
-        
-        # Download VV and VH
-        for band in ['vv', 'vh']:
-            href = best_scene['assets'].get(band)
-            p = os.path.join(tmpdir, f"{band}.tif")
-            await client.download_and_clip_band(href, aoi_geom, p)
-            band_paths[band] = p
-            
-            if band == 'vv' and profile is None:
-                with rasterio.open(p) as src: profile = src.profile
-        
-        # Load Data
-        with rasterio.open(band_paths['vv']) as src: vv = src.read(1)
-        with rasterio.open(band_paths['vh']) as src: vh = src.read(1)
+    prefix = f"tenant={tenant_id}/aoi={aoi_id}/year={year}/week={week}/radar/"
+    written = checkpoints.get(INDICES_WRITTEN)
+    if written is None:
+        written = await compute_radar_indices(client, best_scene, aoi_geom, ingestion_mode, prefix, checkpoints)
+        checkpoints.save(INDICES_WRITTEN, written)
+    uris = written['uris']
+    
+    # 7. Save DB
+    with stage("db"):
+        save_radar_assets(tenant_id, aoi_id, year, week, 
+                          uris['rvi'], uris['ratio'], uris['vh'], uris['vv'],
+                          written['stats'], db)
+    checkpoints.save(STATS_SAVED, {})
+    
+    update_job_status(job_id, "DONE", db)
+
+async def compute_radar_indices(client, best_scene: dict, aoi_geom, ingestion_mode: str, prefix: str,
+                                checkpoints: JobCheckpoints) -> dict:
+    """
+    Fetch VV/VH, compute RVI and the VH/VV ratio and upload all four COGs.
+
+    Returns:
+        {"uris": {"rvi", "ratio", "vh", "vv"}, "stats"}
+    """
+    # 3. Fetch and Process (in memory); the bands are kept as a checkpoint
+    fetched = checkpoints.get(BANDS_FETCHED)
+    bands = None
+    if fetched is not None:
+        bands = await asyncio.to_thread(checkpoints.get_array, fetched['artifact'])
+    if bands is not None:
+        vv, vh = bands
+        profile = profile_from_json(fetched['profile'])
+    else:
+        with stage("read"):
+            vv, profile = await client.clip_band(best_scene['assets']['vv'], aoi_geom, ingestion_mode)
+            vh, _ = await client.clip_band(best_scene['assets']['vh'], aoi_geom, ingestion_mode)
+        artifact = None
+        if checkpoints.enabled and vv.shape == vh.shape:
+            artifact = await asyncio.to_thread(checkpoints.put_array, "bands", np.stack([vv, vh]))
+        if artifact:
+            checkpoints.save(BANDS_FETCHED, {'artifact': artifact, 'profile': profile_to_json(profile)})
+    del bands
         
-        # 4. Calculate Indices
-        # 4. Calculate Indices
+    # 4. Calculate Indices
+    # 4. Calculate Indices
+    with stage("indices"):
         # Ensure Linear Scale for RVI
         # RTC on Planetary Computer is typically float32 linear power.
         # But if we accidentally get dB (usually negative values for vegetation), we must convert.
@@ -179,50 +193,37 @@ async def process_radar_week_async(job_id: str, payload: dict, db: Session):
         # Calculate VH/VV Ratio (Volume Scattering vs Surface Scattering)
         vv_safe = np.where(vv == 0, 0.0001, vv)
         ratio = vh / vv_safe
-        
+    
         # Stats
         stats = {}
         def calc_stats(arr, name):
             v = arr[~np.isnan(arr)]
             if v.size == 0: return {f"{name}_mean": 0, f"{name}_std": 0}
             return {f"{name}_mean": float(np.mean(v)), f"{name}_std": float(np.std(v))}
-            
+        
         stats.update(calc_stats(rvi, "rvi"))
         stats.update(calc_stats(ratio, "ratio"))
-        
-        # 6. Export and Upload
-        s3 = S3Client()
-        prefix = f"tenant={tenant_id}/aoi={aoi_id}/year={year}/week={week}/radar/"
-        
-        def up(name, data):
-             p = os.path.join(tmpdir, f"{name}.tif")
-             export_cog(data, p, profile)
-             return s3.upload_file(p, prefix + f"{name}.tif")
-        
-        rvi_uri = up("rvi", rvi)
-        ratio_uri = up("ratio", ratio)
-        vh_uri = up("vh", vh)
-        vv_uri = up("vv", vv)
-        
-        # 7. Save DB
-        save_radar_assets(tenant_id, aoi_id, year, week, 
-                          rvi_uri, ratio_uri, vh_uri, vv_uri,
-                          stats, db)
-        
-        update_job_status(job_id, "DONE", db)
+    
+    # 6. Export and Upload
+    s3 = S3Client()
+    
+    uris = await asyncio.to_thread(upload_rasters, s3, [
+        (name, data, profile, prefix + f"{name}.tif")
+        for name, data in (("rvi", rvi), ("ratio", ratio), ("vh", vh), ("vv", vv))
+    ])
+    return {'uris': uris, 'stats': stats}
 
 def process_radar_week_handler(job_id: str, payload: dict, db: Session):
-    """PROCESS_RADAR_WEEK job handler Wrapper"""
-    import asyncio
+    """
+    PROCESS_RADAR_WEEK job handler Wrapper. Errors propagate so that
+    process_message() retries the job (resuming from its checkpoints) or
+    marks it FAILED on the last attempt.
+    """
     logger.info("process_radar_week_start", job_id=job_id)
     update_job_status(job_id, "RUNNING", db)
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(process_radar_week_async(job_id, payload, db))
-        finally:
-            loop.close()
+        run_async(process_radar_week_async(job_id, payload, db))
+        JobCheckpoints(db, job_id).clear()
     except Exception as e:
         logger.error("process_radar_week_failed", job_id=job_id, exc_info=e)
-        update_job_status(job_id, "FAILED", db, error=str(e))
+        raise
@@ -0,0 +1,336 @@
+"""
+PROCESS_SCENE_WEEK Job
+
+Scene-centric variant of PROCESS_WEEK. Instead of one search, band read and
+mask pass per (AOI, week), every AOI covered by the same Sentinel-2 scene in
+a week is processed together:
+
+1. One scene lookup (local catalog or STAC) over the union of all requested AOIs
+2. Each AOI is assigned to its best covering scene (clearest over the AOI by
+   a coarse SCL pre-screen, pipeline/cloud_prescreen.py; lowest cloud cover
+   when the pre-screen is disabled)
+3. Per scene, the AOIs are packed into windows; each band is range-read once
+   per window onto the 10m grid (pipeline/band_stack.py)
+4. AOIs are rasterized into a label grid and per-AOI NDVI statistics are
+   accumulated in a single pass over the window (pipeline/zonal_stats.py)
+5. Results are written as the same observations_weekly rows as PROCESS_WEEK,
+   one bulk upsert per scene (shared/bulk_writer.py)
+
+Payload:
+    year: int - ISO year
+    week: int - ISO week number
+    tenant_id: UUID - process all ACTIVE AOIs of this tenant (optional)
+    aoi_ids: list[UUID] - explicit AOIs to process (optional)
+At least one of tenant_id / aoi_ids is required.
+
+Nothing enqueues this job type: it only writes NDVI observations (no index
+COGs or derived assets), so backfills keep creating PROCESS_WEEK. It is
+created by hand, e.g. to re-derive a tenant's weekly NDVI in bulk.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+from rasterio.features import rasterize
+from rasterio.warp import transform_geom
+from rasterio.windows import Window
+from shapely.geometry import mapping, shape
+from shapely.ops import unary_union
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from worker.config import settings
+from worker.pipeline.band_stack import AOIGrid, pixel_window, read_band_stack, read_cloud_mask
+from worker.pipeline.cloud_prescreen import estimated_valid_fraction, screen_scenes
+from worker.pipeline.indices import NDVI_BASELINE, compute_indices
+from worker.pipeline.zonal_stats import StatsAccumulator, value_range_for
+from worker.runtime import run_async
+from worker.shared.bulk_writer import upsert_rows
+from worker.jobs.process_week import (
+    OBSERVATIONS_NO_DATA,
+    OBSERVATIONS_OK,
+    no_data_observation_row,
+    observation_row,
+    update_job_status,
+)
+
+logger = structlog.get_logger()
+
+# Upper bound on pixels read per band in one window (~16.7M px = 64MB float32).
+# AOIs spread across a scene are split into several windows.
+MAX_WINDOW_PIXELS = 4096 * 4096
+
+
+def _load_aois(db: Session, payload: dict) -> List[Dict[str, Any]]:
+    """Load the AOIs selected by the job payload as GeoJSON geometries."""
+    import json
+
+    conditions = ["status = 'ACTIVE'"]
+    params = {}
+    if payload.get("tenant_id"):
+        conditions.append("tenant_id = :tenant_id")
+        params["tenant_id"] = payload["tenant_id"]
+    if payload.get("aoi_ids"):
+        conditions.append("id = ANY(CAST(:aoi_ids AS uuid[]))")
+        params["aoi_ids"] = [str(a) for a in payload["aoi_ids"]]
+    if len(conditions) == 1:
+        raise ValueError("tenant_id or aoi_ids is required")
+
+    rows = db.execute(
+        text(f"""
+            SELECT id, tenant_id, ST_AsGeoJSON(geom) AS geojson
+            FROM aois
+            WHERE {' AND '.join(conditions)}
+        """),
+        params,
+    ).fetchall()
+
+    return [
+        {"aoi_id": str(row.id), "tenant_id": str(row.tenant_id), "geom": json.loads(row.geojson)}
+        for row in rows
+    ]
+
+
+def assign_aois_to_scenes(
+    aois: List[Dict[str, Any]],
+    scenes: List[Dict[str, Any]],
+    valid_fractions: Optional[Dict[str, List[Optional[float]]]] = None,
+) -> Tuple[Dict[str, Tuple[Dict[str, Any], List[Dict[str, Any]]]], List[Dict[str, Any]]]:
+    """
+    Assign each AOI to one scene.
+
+    Scenes fully covering the AOI are preferred: the clearest over the AOI
+    when pre-screen results are given ({scene_id: [fraction per AOI]}, in
+    aois order), else the lowest cloud cover. Otherwise the scene with the
+    largest overlap is used.
+
+    Returns:
+        ({scene_id: (scene, [aoi, ...])}, [unassigned aoi, ...])
+    """
+    usable = [
+        (s, shape(s["geometry"]))
+        for s in scenes
+        if s["assets"].get("red") and s["assets"].get("nir")
+    ]
+    groups: Dict[str, Tuple[Dict[str, Any], List[Dict[str, Any]]]] = {}
+    unassigned = []
+
+    def clearness(scene, i):
+        measured = (valid_fractions or {}).get(scene["id"], [None] * len(aois))[i]
+        return measured if measured is not None else estimated_valid_fraction(scene)
+
+    for i, aoi in enumerate(aois):
+        aoi_shape = shape(aoi["geom"])
+        covering = [(s, fp) for s, fp in usable if fp.covers(aoi_shape)]
+        if covering and valid_fractions is not None:
+            scene = max(covering, key=lambda item: (clearness(item[0], i), -item[0]["cloud_cover"]))[0]
+        elif covering:
+            scene = min(covering, key=lambda item: item[0]["cloud_cover"])[0]
+        else:
+            overlapping = [
+                (s, fp.intersection(aoi_shape).area) for s, fp in usable if fp.intersects(aoi_shape)
+            ]
+            if not overlapping:
+                unassigned.append(aoi)
+                continue
+            scene = max(overlapping, key=lambda item: (item[1], -item[0]["cloud_cover"]))[0]
+
+        groups.setdefault(scene["id"], (scene, []))[1].append(aoi)
+
+    return groups, unassigned
+
+
+def pack_windows(
+    projected: List[Any],
+    transform,
+    width: int,
+    height: int,
+    max_pixels: int = MAX_WINDOW_PIXELS,
+) -> List[Tuple[Window, List[int]]]:
+    """
+    Greedily pack AOIs (by index) into read windows no larger than max_pixels.
+    AOIs are visited north-to-south so neighbours tend to share a window.
+    """
+    order = sorted(range(len(projected)), key=lambda i: (-projected[i].bounds[3], projected[i].bounds[0]))
+    packed: List[Tuple[Window, List[int]]] = []
+    current: List[int] = []
+    current_bounds = None
+
+    for idx in order:
+        b = projected[idx].bounds
+        if current_bounds is None:
+            candidate = b
+        else:
+            candidate = (
+                min(current_bounds[0], b[0]), min(current_bounds[1], b[1]),
+                max(current_bounds[2], b[2]), max(current_bounds[3], b[3]),
+            )
+        window = pixel_window(candidate, transform, width, height)
+        if current and window.width * window.height > max_pixels:
+            packed.append((pixel_window(current_bounds, transform, width, height), current))
+            current, current_bounds = [idx], b
+        else:
+            current.append(idx)
+            current_bounds = candidate
+
+    if current:
+        packed.append((pixel_window(current_bounds, transform, width, height), current))
+    return packed
+
+
+def build_label_layers(projected: List[Any], members: List[int]) -> List[List[int]]:
+    """
+    Split AOIs into layers of mutually non-overlapping geometries, so each
+    layer can be burned into a single label grid.
+    """
+    layers: List[List[int]] = []
+    for idx in members:
+        for layer in layers:
+            if not any(projected[idx].intersects(projected[other]) and
+                       projected[idx].intersection(projected[other]).area > 0
+                       for other in layer):
+                layer.append(idx)
+                break
+        else:
+            layers.append([idx])
+    return layers
+
+
+async def _process_scene_group(
+    client,
+    scene: Dict[str, Any],
+    aois: List[Dict[str, Any]],
+    year: int,
+    week: int,
+    db: Session,
+) -> Dict[str, int]:
+    """Read the scene once per packed window and save one observation per AOI."""
+    assets = scene["assets"]
+    header = await asyncio.to_thread(client.read_header, assets["red"])
+    crs, transform = header["crs"], header["transform"]
+
+    projected = [shape(transform_geom("EPSG:4326", crs, aoi["geom"])) for aoi in aois]
+    ok_rows, no_data_rows = [], []
+
+    for window, members in pack_windows(projected, transform, header["width"], header["height"]):
+        if window.width == 0 or window.height == 0:
+            for idx in members:
+                no_data_rows.append(no_data_observation_row(aois[idx]["tenant_id"], aois[idx]["aoi_id"], year, week))
+            continue
+
+        grid = AOIGrid.from_window(header, window)
+        out_shape = grid.shape
+        stack, band_index = await read_band_stack(
+            client, assets, ["red", "nir"], grid, required=("red", "nir")
+        )
+
+        # Outside-scene fill and SCL clouds/shadows are invalid
+        invalid = (stack[band_index["red"]] == 0) & (stack[band_index["nir"]] == 0)
+        if assets.get("scl"):
+            invalid |= await read_cloud_mask(client, assets["scl"], grid)
+        stack[:, invalid] = np.nan
+        del invalid
+
+        ndvi = compute_indices(stack, band_index, ["ndvi"])["ndvi"]
+        del stack
+
+        # Zones are AOI indices + 1; overlapping AOIs are burned in separate
+        # layers but accumulate into the same per-zone statistics
+        acc = StatsAccumulator(n_zones=len(aois), value_range=value_range_for("ndvi"))
+        for layer in build_label_layers(projected, members):
+            labels = rasterize(
+                [(mapping(projected[idx]), idx + 1) for idx in layer],
+                out_shape=out_shape,
+                transform=grid.transform,
+                fill=0,
+                dtype="int32",
+            )
+            acc.update(ndvi, labels)
+        del ndvi
+
+        for idx in members:
+            aoi = aois[idx]
+            valid_pixel_ratio = acc.valid_ratio(idx + 1)
+            if valid_pixel_ratio < settings.min_valid_pixel_ratio:
+                no_data_rows.append(no_data_observation_row(aoi["tenant_id"], aoi["aoi_id"], year, week))
+                continue
+            stats = acc.result("ndvi", idx + 1, percentiles=(10, 50, 90))
+            stats["valid_pixel_ratio"] = valid_pixel_ratio
+            ok_rows.append(observation_row(
+                aoi["tenant_id"], aoi["aoi_id"], year, week, stats,
+                NDVI_BASELINE, stats["ndvi_mean"] - NDVI_BASELINE,
+            ))
+
+    save_observation_rows(db, ok_rows, no_data_rows)
+    return {"ok": len(ok_rows), "no_data": len(no_data_rows)}
+
+
+def save_observation_rows(db: Session, ok_rows: List[dict], no_data_rows: List[dict]):
+    """Upsert a batch of OK / NO_DATA observations in one transaction."""
+    upsert_rows(db, OBSERVATIONS_OK, ok_rows, commit=False)
+    upsert_rows(db, OBSERVATIONS_NO_DATA, no_data_rows, commit=False)
+    db.commit()
+
+
+async def process_scene_week_async(job_id: str, payload: dict, db: Session):
+    from worker.pipeline.stac_client import get_stac_client
+    from worker.pipeline.scene_catalog import find_scenes
+    from worker.shared.utils import get_week_date_range
+
+    year = payload["year"]
+    week = payload["week"]
+
+    aois = _load_aois(db, payload)
+    if not aois:
+        logger.info("process_scene_week_no_aois", job_id=job_id)
+        update_job_status(job_id, "DONE", db)
+        return
+
+    start_date, end_date = get_week_date_range(year, week)
+    client = get_stac_client()
+
+    union_geom = mapping(unary_union([shape(a["geom"]) for a in aois]))
+    scenes = await find_scenes(db, client, union_geom, start_date, end_date, settings.max_cloud_cover)
+    scenes = [s for s in scenes if s["cloud_cover"] <= settings.max_cloud_cover]
+
+    valid_fractions = None
+    if settings.cloud_prescreen_enabled and scenes:
+        valid_fractions = await screen_scenes(client, scenes, [a["geom"] for a in aois])
+
+    groups, unassigned = assign_aois_to_scenes(aois, scenes, valid_fractions)
+    logger.info(
+        "process_scene_week_grouped",
+        job_id=job_id,
+        aois=len(aois),
+        scenes=len(groups),
+        unassigned=len(unassigned),
+    )
+
+    totals = {"ok": 0, "no_data": len(unassigned)}
+    save_observation_rows(db, [], [
+        no_data_observation_row(aoi["tenant_id"], aoi["aoi_id"], year, week) for aoi in unassigned
+    ])
+
+    for scene_id, (scene, scene_aois) in groups.items():
+        counts = await _process_scene_group(client, scene, scene_aois, year, week, db)
+        logger.info("process_scene_group_done", scene_id=scene_id, **counts)
+        totals["ok"] += counts["ok"]
+        totals["no_data"] += counts["no_data"]
+
+    logger.info("process_scene_week_complete", job_id=job_id, **totals)
+    update_job_status(job_id, "DONE", db)
+
+
+def process_scene_week_handler(job_id: str, payload: dict, db: Session):
+    """
+    PROCESS_SCENE_WEEK job handler Wrapper. Errors propagate so that
+    process_message() retries the job or marks it FAILED on the last attempt.
+    """
+    logger.info("process_scene_week_start", job_id=job_id)
+    update_job_status(job_id, "RUNNING", db)
+    try:
+        run_async(process_scene_week_async(job_id, payload, db))
+    except Exception as e:
+        logger.error("process_scene_week_failed", job_id=job_id, exc_info=e)
+        raise
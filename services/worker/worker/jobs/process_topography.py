@@ -1,33 +1,17 @@
+import asyncio
 import structlog
 from sqlalchemy.orm import Session
 from worker.config import settings
 from worker.shared.aws_clients import S3Client
-import tempfile
-import os
-import rasterio
+from worker.shared.bulk_writer import once_per_process
 import numpy as np
+from worker.pipeline.raster_io import upload_rasters
+from worker.runtime import run_async
 from rasterio.enums import Resampling
 from datetime import datetime
 
 logger = structlog.get_logger()
 
-def export_cog(data: np.ndarray, output_path: str, profile: dict):
-    """Export data as Cloud Optimized GeoTIFF"""
-    cog_profile = profile.copy()
-    cog_profile.update({
-        "driver": "GTiff",
-        "dtype": "float32",
-        "count": 1,
-        "compress": "deflate",
-        "predictor": 2,
-        "tiled": True,
-        "blockxsize": 256,
-        "blockysize": 256
-    })
-    
-    with rasterio.open(output_path, 'w', **cog_profile) as dst:
-        dst.write(data.astype('float32'), 1)
-
 def calculate_slope_aspect(dem: np.ndarray, cell_size=30.0):
     """
     Calculate Slope and Aspect from DEM using numpy gradients.
@@ -40,8 +24,9 @@ def calculate_slope_aspect(dem: np.ndarray, cell_size=30.0):
     aspect = np.where(aspect < 0, aspect + 360, aspect)
     return slope, aspect
 
+@once_per_process
 def ensure_topo_table_exists(db: Session):
-    """Ensure derived_topography table exists"""
+    """Ensure derived_topography table exists (once per process)"""
     from sqlalchemy import text
     sql = text("""
         CREATE TABLE IF NOT EXISTS derived_topography (
@@ -112,11 +97,13 @@ def update_job_status(job_id: str, status: str, db: Session, error: str = None):
 
 # Job Handler
 async def process_topography_async(job_id: str, payload: dict, db: Session):
-    from worker.pipeline.stac_client import get_stac_client
+    from worker.pipeline.stac_client import get_stac_client, resolve_ingestion_mode
+    from worker.pipeline.scene_catalog import find_scenes
     from worker.shared.utils import get_week_date_range, get_aoi_geometry
     
     tenant_id = payload['tenant_id']
     aoi_id = payload['aoi_id']
+    ingestion_mode = resolve_ingestion_mode(payload)
     
     # Ensure table exists first
     ensure_topo_table_exists(db)
@@ -132,11 +119,12 @@ async def process_topography_async(job_id: str, payload: dict, db: Session):
     # It might not be time-indexed strictly, or has a specific timeframe.
     # Usually we just search for intersection.
     
-    scenes = await client.search_scenes(
-        aoi_geom, 
+    scenes = await find_scenes(
+        db, client, aoi_geom,
         start_date=datetime(2010, 1, 1), # GLO-30 is ~2015-2020 static, use wide range
         end_date=datetime.now(),
-        collections=["copernicus-dem-glo-30"]
+        max_cloud_cover=60.0,
+        collection="copernicus-dem-glo-30"
     )
     
     if not scenes:
@@ -147,100 +135,86 @@ async def process_topography_async(job_id: str, payload: dict, db: Session):
 
     best_scene = scenes[0]
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # Download DEM
-        # GLO-30 assets usually named 'data'
-        href = best_scene['assets'].get('data') # Check this mapping in stac_client
-        if not href:
-             # Fallback if stac_client mapping is rigid
-             # We might need to update stac_client to map 'data' -> 'dem'
-             # For now let's hope it's exposed or we access item directly.
-             # Actually `search_scenes` returns a dict with 'assets' keys: red, green... 
-             # We need to update search_scenes again to handle 'data' or generic assets.
-             # Or we access the raw items. 
-             # Let's assume stac_client is updated or we use a hack.
-             # Wait, I need to update stac_client to support 'dem' asset key.
-             href = best_scene['assets'].get('dem') 
-        
-        path = os.path.join(tmpdir, "dem.tif")
-        # Reuse download_and_clip
-        await client.download_and_clip_band(href, aoi_geom, path)
-        
-        with rasterio.open(path) as src:
-            dem = src.read(1)
-            profile = src.profile
-            
-            # Reproject or ensure meters?
-            # GLO-30 is usually WGS84 (degrees). Slope calculation on degrees is WRONG.
-            # We MUST reproject to UTM (meters) for valid Slope.
-            # download_and_clip_band does NOT reproject the output image, it only clips.
-            # Wait, stac_client.py:186 'aoi_projected = transform_geom("EPSG:4326", src.crs, aoi_geom)'
-            # It keeps original CRS. GLO-30 is EPSG:4326.
-            # We need to reproject the raster itself to meters (e.g. WebMercator or UTM).
-            
-            # For MVP simplicity, we approximate: 1 deg ~ 111km.
-            # Proper way: Warp to UTM.
-            # Let's do a simple lat-based scale factor for X: cos(lat).
-            
-            lat_mean = profile['transform'][5] # Approximate
-            scale_x = 111320 * np.cos(np.deg2rad(lat_mean))
-            scale_y = 111320
-            
-            # Calc Slope (using scaled gradients)
-            # np.gradient returns differences per index. We divide by cell size in meters.
-            dy, dx = np.gradient(dem)
-            
-            # Adjust dx/dy by pixel size in degrees
-            res_x_deg = profile['transform'][0]
-            res_y_deg = -profile['transform'][4] # Usually negative
-            
-            slope_rad = np.arctan(np.sqrt((dx / res_x_deg / scale_x)**2 + (dy / res_y_deg / scale_y)**2))
-            slope_deg = np.degrees(slope_rad)
-            
-            # Aspect (same logic)
-            # ... skipping aspect complexity, focusing on slope.
-            aspect_deg = np.zeros_like(slope_deg) # Placeholder
-            
-            # Stats
-            stats = {
-                "ele_min": float(np.nanmin(dem)),
-                "ele_max": float(np.nanmax(dem)),
-                "ele_mean": float(np.nanmean(dem)),
-                "slope_mean": float(np.nanmean(slope_deg))
-            }
+    # Download DEM
+    # GLO-30 assets usually named 'data'
+    href = best_scene['assets'].get('data') # Check this mapping in stac_client
+    if not href:
+         # Fallback if stac_client mapping is rigid
+         # We might need to update stac_client to map 'data' -> 'dem'
+         # For now let's hope it's exposed or we access item directly.
+         # Actually `search_scenes` returns a dict with 'assets' keys: red, green... 
+         # We need to update search_scenes again to handle 'data' or generic assets.
+         # Or we access the raw items. 
+         # Let's assume stac_client is updated or we use a hack.
+         # Wait, I need to update stac_client to support 'dem' asset key.
+         href = best_scene['assets'].get('dem') 
+    
+    # Clip in memory
+    dem, profile = await client.clip_band(href, aoi_geom, ingestion_mode)
+    
+    # Reproject or ensure meters?
+    # GLO-30 is usually WGS84 (degrees). Slope calculation on degrees is WRONG.
+    # We MUST reproject to UTM (meters) for valid Slope.
+    # download_and_clip_band does NOT reproject the output image, it only clips.
+    # Wait, stac_client.py:186 'aoi_projected = transform_geom("EPSG:4326", src.crs, aoi_geom)'
+    # It keeps original CRS. GLO-30 is EPSG:4326.
+    # We need to reproject the raster itself to meters (e.g. WebMercator or UTM).
+    
+    # For MVP simplicity, we approximate: 1 deg ~ 111km.
+    # Proper way: Warp to UTM.
+    # Let's do a simple lat-based scale factor for X: cos(lat).
+    
+    lat_mean = profile['transform'][5] # Approximate
+    scale_x = 111320 * np.cos(np.deg2rad(lat_mean))
+    scale_y = 111320
+    
+    # Calc Slope (using scaled gradients)
+    # np.gradient returns differences per index. We divide by cell size in meters.
+    dy, dx = np.gradient(dem)
+    
+    # Adjust dx/dy by pixel size in degrees
+    res_x_deg = profile['transform'][0]
+    res_y_deg = -profile['transform'][4] # Usually negative
+    
+    slope_rad = np.arctan(np.sqrt((dx / res_x_deg / scale_x)**2 + (dy / res_y_deg / scale_y)**2))
+    slope_deg = np.degrees(slope_rad)
+    
+    # Aspect (same logic)
+    # ... skipping aspect complexity, focusing on slope.
+    aspect_deg = np.zeros_like(slope_deg) # Placeholder
+    
+    # Stats
+    stats = {
+        "ele_min": float(np.nanmin(dem)),
+        "ele_max": float(np.nanmax(dem)),
+        "ele_mean": float(np.nanmean(dem)),
+        "slope_mean": float(np.nanmean(slope_deg))
+    }
 
-        # Export
-        s3 = S3Client()
-        prefix = f"tenant={tenant_id}/aoi={aoi_id}/static/topo/"
-        
-        def up(name, data):
-             p = os.path.join(tmpdir, f"{name}.tif")
-             export_cog(data, p, profile)
-             return s3.upload_file(p, prefix + f"{name}.tif")
-        
-        dem_uri = up("dem", dem)
-        slope_uri = up("slope", slope_deg)
-        
-        # Save DB
-        save_topo_assets(tenant_id, aoi_id, dem_uri, slope_uri, None, stats, db)
-        
-        # Update Job
-        from sqlalchemy import text
-        sql = text("UPDATE jobs SET status = 'DONE', updated_at = now() WHERE id = :job_id")
-        db.execute(sql, {"job_id": job_id})
-        db.commit()
+    # Export
+    s3 = S3Client()
+    prefix = f"tenant={tenant_id}/aoi={aoi_id}/static/topo/"
+    
+    uris = await asyncio.to_thread(upload_rasters, s3, [
+        ("dem", dem, profile, prefix + "dem.tif"),
+        ("slope", slope_deg, profile, prefix + "slope.tif"),
+    ])
+    dem_uri, slope_uri = uris["dem"], uris["slope"]
+    
+    # Save DB
+    save_topo_assets(tenant_id, aoi_id, dem_uri, slope_uri, None, stats, db)
+    
+    # Update Job
+    from sqlalchemy import text
+    sql = text("UPDATE jobs SET status = 'DONE', updated_at = now() WHERE id = :job_id")
+    db.execute(sql, {"job_id": job_id})
+    db.commit()
 
 def process_topography_handler(job_id: str, payload: dict, db: Session):
     """PROCESS_TOPOGRAPHY job wrapper"""
-    import asyncio
     update_job_status(job_id, "RUNNING", db)
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(process_topography_async(job_id, payload, db))
-        finally:
-            loop.close()
+        run_async(process_topography_async(job_id, payload, db))
     except Exception as e:
         logger.error("process_topo_failed", job_id=job_id, exc_info=e)
         update_job_status(job_id, "FAILED", db, error=str(e))
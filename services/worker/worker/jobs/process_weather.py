@@ -6,6 +6,8 @@ from datetime import datetime, timedelta, date
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from worker.config import settings
+from worker.runtime import run_async
+from worker.shared.bulk_writer import UpsertTarget, once_per_process, upsert_rows
 import numpy as np
 
 logger = structlog.get_logger()
@@ -14,8 +16,9 @@ logger = structlog.get_logger()
 # Database Utils
 # -----------------------------------------------------------------------------
 
+@once_per_process
 def ensure_weather_table_exists(db: Session):
-    """Ensure derived_weather_daily table exists"""
+    """Ensure derived_weather_daily table exists (once per process)"""
     sql = text("""
         CREATE TABLE IF NOT EXISTS derived_weather_daily (
             tenant_id UUID NOT NULL,
@@ -40,33 +43,23 @@ def ensure_weather_table_exists(db: Session):
     db.execute(text("ALTER TABLE derived_weather_daily ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();"))
     db.commit()
 
+WEATHER_DAILY = UpsertTarget(
+    table="derived_weather_daily",
+    columns=("tenant_id", "aoi_id", "date", "temp_max", "temp_min", "precip_sum", "et0_fao"),
+    key=("tenant_id", "aoi_id", "date"),
+    touch_updated_at=True,
+)
+
+
 def save_weather_batch(tenant_id: str, aoi_id: str, data: list, db: Session):
-    """Batch upsert weather data"""
+    """Batch upsert weather data (COPY for long histories, see shared/bulk_writer.py)"""
     if not data:
         return
 
     ensure_weather_table_exists(db)
     
-    # Construct massive upsert using execute many (fastest with drivers usually) or manual loop
-    # We will use simple loop with upsert for safety and simplicity in this context
-    
-    sql = text("""
-        INSERT INTO derived_weather_daily 
-        (tenant_id, aoi_id, date, temp_max, temp_min, precip_sum, et0_fao)
-        VALUES 
-        (:tenant_id, :aoi_id, :date, :temp_max, :temp_min, :precip_sum, :et0_fao)
-        ON CONFLICT (tenant_id, aoi_id, date) DO UPDATE
-        SET temp_max = EXCLUDED.temp_max,
-            temp_min = EXCLUDED.temp_min,
-            precip_sum = EXCLUDED.precip_sum,
-            et0_fao = EXCLUDED.et0_fao,
-            updated_at = NOW();
-    """)
-    
-    # Prepare list of dicts
-    params_list = []
-    for d in data:
-        params_list.append({
+    upsert_rows(db, WEATHER_DAILY, [
+        {
             "tenant_id": tenant_id,
             "aoi_id": aoi_id,
             "date": d['date'],
@@ -74,10 +67,9 @@ def save_weather_batch(tenant_id: str, aoi_id: str, data: list, db: Session):
             "temp_min": d['temp_min'],
             "precip_sum": d['precip_sum'],
             "et0_fao": d['et0_fao']
-        })
-        
-    db.execute(sql, params_list)
-    db.commit()
+        }
+        for d in data
+    ])
 
 # -----------------------------------------------------------------------------
 # Business Logic
@@ -201,12 +193,7 @@ def process_weather_history_handler(job_id: str, payload: dict, db: Session):
     logger.info("process_weather_history_start", job_id=job_id)
     update_job_status(job_id, "RUNNING", db)
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(process_weather_history_async(job_id, payload, db))
-        finally:
-            loop.close()
+        run_async(process_weather_history_async(job_id, payload, db))
     except Exception as e:
         logger.error("process_weather_failed", job_id=job_id, exc_info=e)
         update_job_status(job_id, "FAILED", db, error=str(e))
@@ -2,6 +2,7 @@ import structlog
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from worker.config import settings
+from worker.shared.utils import payload_weeks
 from datetime import datetime
 from worker.signals.features import (
     extract_features,
@@ -27,7 +28,9 @@ logger = structlog.get_logger()
 def signals_week_handler(job_id: str, payload: dict, db: Session):
     """
     SIGNALS_WEEK job handler.
-    Generates opportunity signals using change detection and scoring.
+    Generates opportunity signals using change detection and scoring, for a
+    week or for each week of a range job (payload["weeks"], see
+    payload_weeks()), then marks the job DONE once.
     
     Steps:
     1. Query observations_weekly (last N weeks)
@@ -43,121 +46,16 @@ def signals_week_handler(job_id: str, payload: dict, db: Session):
     
     tenant_id = payload['tenant_id']
     aoi_id = payload['aoi_id']
-    year = payload['year']
-    week = payload['week']
     
     try:
-        # Step 1: Query observations (last N weeks)
-        logger.info("step_1_query_observations")
-        observations = query_observations(tenant_id, aoi_id, year, week, db)
-        
-        if len(observations) < settings.signals_min_history_weeks:
-            logger.warning("insufficient_history", count=len(observations), required=settings.signals_min_history_weeks)
-            update_job_status(job_id, "DONE", db)
-            return
-        
-        # Get AOI info for use_type
-        aoi_info = get_aoi_info(aoi_id, db)
-        use_type = aoi_info['use_type']
-        
-        # Step 2: Extract features
-        logger.info("step_2_extract_features")
-        features = extract_features(observations)
-        
-        if not features:
-            logger.warning("no_features_extracted")
-            update_job_status(job_id, "DONE", db)
-            return
-        
-        # Step 3: Change detection
-        logger.info("step_3_change_detection", method=settings.signals_change_detection)
-        
-        if settings.signals_change_detection == "BFastLike":
-            change_detection = detect_change_bfast_like(
-                observations,
-                persistence_weeks=settings.signals_persistence_weeks
-            )
-        else:
-            change_detection = detect_change_simple(observations)
-        
-        # Step 4: Calculate scores
-        logger.info("step_4_calculate_scores")
-        
-        rule_score = calculate_rule_score(features, use_type)
-        change_score = calculate_change_score(change_detection)
-        ml_score = calculate_ml_score(features)
-        
-        final_score = calculate_final_score(rule_score, change_score, ml_score)
-        
-        logger.info("scores_calculated", 
-                   rule=rule_score, 
-                   change=change_score, 
-                   ml=ml_score, 
-                   final=final_score)
-        
-        # Check threshold
-        if final_score < settings.signals_score_threshold:
-            logger.info("score_below_threshold", score=final_score, threshold=settings.signals_score_threshold)
-            update_job_status(job_id, "DONE", db)
-            return
-        
-        # Step 5: Determine signal_type
-        logger.info("step_5_determine_signal_type")
-        signal_type = determine_signal_type(use_type, features, change_detection or {})
-        
-        # Step 6: Generate recommended_actions
-        logger.info("step_6_generate_actions")
-        recommended_actions = get_recommended_actions(signal_type)
-        
-        # Calculate severity and confidence
-        avg_valid_pixel_ratio = sum(o.get('valid_pixel_ratio', 0) for o in observations) / len(observations)
-        severity = determine_severity(final_score)
-        confidence = determine_confidence(final_score, avg_valid_pixel_ratio, len(observations))
-        
-        # Prepare evidence
-        evidence = {
-            'window_weeks': len(observations),
-            'baseline_ref': observations[0].get('baseline', 0),
-            'valid_pixel_ratio_summary': {
-                'mean': avg_valid_pixel_ratio,
-                'min': min(o.get('valid_pixel_ratio', 0) for o in observations)
-            },
-            'change_detection': change_detection or {}
-        }
-        
-        # Step 7: Check for existing signals (dedupe)
-        logger.info("step_7_check_dedupe")
-        existing_signal = check_existing_signal(tenant_id, aoi_id, year, week, signal_type, db)
-        
-        if existing_signal:
-            logger.info("updating_existing_signal", signal_id=existing_signal['id'])
-            update_signal(existing_signal['id'], final_score, evidence, features, db)
-        else:
-            # Step 8: Save new signal
-            logger.info("step_8_save_signal")
-            
-            # Use end of week as "detection/creation" date for correct timeline sorting
-            from worker.shared.utils import get_week_date_range
-            _, end_date = get_week_date_range(year, week)
-            
-            save_signal(
-                tenant_id=tenant_id,
-                aoi_id=aoi_id,
-                year=year,
-                week=week,
-                signal_type=signal_type,
-                severity=severity,
-                confidence=confidence,
-                score=final_score,
-                evidence=evidence,
-                features=features,
-                recommended_actions=recommended_actions,
-                db=db,
-                created_at=end_date
-            )
+        signals = []
+        for year, week in payload_weeks(payload):
+            signal = generate_week_signal(tenant_id, aoi_id, year, week, db)
+            if signal:
+                signals.append(signal)
         
         update_job_status(job_id, "DONE", db)
-        logger.info("signals_week_complete", job_id=job_id, signal_type=signal_type, score=final_score)
+        logger.info("signals_week_complete", job_id=job_id, signals=signals)
         
     except Exception as e:
         logger.error("signals_week_failed", job_id=job_id, exc_info=e)
@@ -165,6 +63,123 @@ def signals_week_handler(job_id: str, payload: dict, db: Session):
         raise
 
 
+def generate_week_signal(tenant_id: str, aoi_id: str, year: int, week: int, db: Session):
+    """
+    Steps 1-8 of SIGNALS_WEEK for one week.
+
+    Returns:
+        {"year", "week", "signal_type", "score"} of the saved signal, or None
+        if the week produced none
+    """
+    # Step 1: Query observations (last N weeks)
+    logger.info("step_1_query_observations")
+    observations = query_observations(tenant_id, aoi_id, year, week, db)
+    
+    if len(observations) < settings.signals_min_history_weeks:
+        logger.warning("insufficient_history", count=len(observations), required=settings.signals_min_history_weeks)
+        return None
+    
+    # Get AOI info for use_type
+    aoi_info = get_aoi_info(aoi_id, db)
+    use_type = aoi_info['use_type']
+    
+    # Step 2: Extract features
+    logger.info("step_2_extract_features")
+    features = extract_features(observations)
+    
+    if not features:
+        logger.warning("no_features_extracted")
+        return None
+    
+    # Step 3: Change detection
+    logger.info("step_3_change_detection", method=settings.signals_change_detection)
+    
+    if settings.signals_change_detection == "BFastLike":
+        change_detection = detect_change_bfast_like(
+            observations,
+            persistence_weeks=settings.signals_persistence_weeks
+        )
+    else:
+        change_detection = detect_change_simple(observations)
+    
+    # Step 4: Calculate scores
+    logger.info("step_4_calculate_scores")
+    
+    rule_score = calculate_rule_score(features, use_type)
+    change_score = calculate_change_score(change_detection)
+    ml_score = calculate_ml_score(features)
+    
+    final_score = calculate_final_score(rule_score, change_score, ml_score)
+    
+    logger.info("scores_calculated", 
+               rule=rule_score, 
+               change=change_score, 
+               ml=ml_score, 
+               final=final_score)
+    
+    # Check threshold
+    if final_score < settings.signals_score_threshold:
+        logger.info("score_below_threshold", score=final_score, threshold=settings.signals_score_threshold)
+        return None
+    
+    # Step 5: Determine signal_type
+    logger.info("step_5_determine_signal_type")
+    signal_type = determine_signal_type(use_type, features, change_detection or {})
+    
+    # Step 6: Generate recommended_actions
+    logger.info("step_6_generate_actions")
+    recommended_actions = get_recommended_actions(signal_type)
+    
+    # Calculate severity and confidence
+    avg_valid_pixel_ratio = sum(o.get('valid_pixel_ratio', 0) for o in observations) / len(observations)
+    severity = determine_severity(final_score)
+    confidence = determine_confidence(final_score, avg_valid_pixel_ratio, len(observations))
+    
+    # Prepare evidence
+    evidence = {
+        'window_weeks': len(observations),
+        'baseline_ref': observations[0].get('baseline', 0),
+        'valid_pixel_ratio_summary': {
+            'mean': avg_valid_pixel_ratio,
+            'min': min(o.get('valid_pixel_ratio', 0) for o in observations)
+        },
+        'change_detection': change_detection or {}
+    }
+    
+    # Step 7: Check for existing signals (dedupe)
+    logger.info("step_7_check_dedupe")
+    existing_signal = check_existing_signal(tenant_id, aoi_id, year, week, signal_type, db)
+    
+    if existing_signal:
+        logger.info("updating_existing_signal", signal_id=existing_signal['id'])
+        update_signal(existing_signal['id'], final_score, evidence, features, db)
+    else:
+        # Step 8: Save new signal
+        logger.info("step_8_save_signal")
+        
+        # Use end of week as "detection/creation" date for correct timeline sorting
+        from worker.shared.utils import get_week_date_range
+        _, end_date = get_week_date_range(year, week)
+        
+        save_signal(
+            tenant_id=tenant_id,
+            aoi_id=aoi_id,
+            year=year,
+            week=week,
+            signal_type=signal_type,
+            severity=severity,
+            confidence=confidence,
+            score=final_score,
+            evidence=evidence,
+            features=features,
+            recommended_actions=recommended_actions,
+            db=db,
+            created_at=end_date
+        )
+    
+    return {"year": year, "week": week, "signal_type": signal_type, "score": final_score}
+
+
 def query_observations(tenant_id: str, aoi_id: str, year: int, week: int, db: Session):
     """Query last N observations for AOI"""
     sql = text("""
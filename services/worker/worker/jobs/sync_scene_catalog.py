@@ -0,0 +1,101 @@
+"""
+SYNC_SCENE_CATALOG Job
+
+Incrementally mirrors STAC scenes into the local stac_scenes table so the
+pipeline jobs resolve scenes with one local PostGIS query
+(pipeline/scene_catalog.find_scenes) instead of a remote STAC search.
+
+Each run pages through the new time range one day at a time over
+settings.scene_catalog_bbox, upserts the scenes and advances
+stac_catalog_sync. Runs re-read the last scene_catalog_overlap_days so
+late-published scenes are picked up.
+
+Payload (all optional):
+    collections: list[str] - default settings.scene_catalog_collections
+    start_date: str - ISO date; default continue from the last sync
+    end_date: str - ISO date; default now
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import structlog
+from sqlalchemy.orm import Session
+
+from worker.config import settings
+from worker.jobs.process_week import update_job_status
+from worker.pipeline.scene_catalog import get_sync_state, save_sync_state, upsert_scenes
+
+logger = structlog.get_logger()
+
+# Time range fetched per STAC search
+SYNC_CHUNK = timedelta(days=1)
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def sync_collection(
+    client,
+    db: Session,
+    collection: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> int:
+    """Sync one collection into the catalog. Returns the number of scenes upserted."""
+    bbox = settings.scene_catalog_bbox
+    end = end or datetime.now(timezone.utc)
+    state = get_sync_state(db, collection)
+
+    if start is None:
+        if state:
+            start = state["synced_through"] - timedelta(days=settings.scene_catalog_overlap_days)
+        else:
+            start = end - timedelta(days=settings.scene_catalog_lookback_days)
+
+    # Extend the synced range when the new one touches it, otherwise restart it
+    contiguous = bool(state) and start <= state["synced_through"] and end >= state["synced_from"]
+    synced_from = min(start, state["synced_from"]) if contiguous else start
+    synced_through = state["synced_through"] if contiguous else start
+
+    total = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + SYNC_CHUNK, end)
+        added = upsert_scenes(db, client.iter_scenes(collection, bbox, chunk_start, chunk_end))
+        total += added
+
+        # Persist progress per chunk so an interrupted run resumes here
+        synced_through = max(synced_through, chunk_end)
+        save_sync_state(db, collection, bbox, synced_from, synced_through, added)
+        chunk_start = chunk_end
+
+    logger.info(
+        "scene_catalog_synced",
+        collection=collection,
+        start=start.isoformat(),
+        end=end.isoformat(),
+        scenes=total,
+    )
+    return total
+
+
+def sync_scene_catalog_handler(job_id: str, payload: dict, db: Session):
+    """SYNC_SCENE_CATALOG job handler"""
+    from worker.pipeline.stac_client import get_stac_client
+
+    logger.info("sync_scene_catalog_start", job_id=job_id)
+    update_job_status(job_id, "RUNNING", db)
+    try:
+        client = get_stac_client()
+        start = _parse_date(payload.get("start_date"))
+        end = _parse_date(payload.get("end_date"))
+        for collection in payload.get("collections") or settings.scene_catalog_collections:
+            sync_collection(client, db, collection, start, end)
+        update_job_status(job_id, "DONE", db)
+    except Exception as e:
+        logger.error("sync_scene_catalog_failed", job_id=job_id, exc_info=e)
+        update_job_status(job_id, "FAILED", db, error=str(e))
@@ -24,6 +24,7 @@ from shapely import wkt
 from shapely.geometry import shape
 
 from worker.config import settings
+from worker.runtime import run_async
 
 logger = structlog.get_logger()
 
@@ -199,4 +200,4 @@ async def warm_cache_handler(job: dict, db: Session) -> dict:
 def warm_cache_sync_handler(job_id: str, payload: dict, db: Session) -> dict:
     """Sync wrapper for warm_cache_handler."""
     job = {"id": job_id, "payload": payload}
-    return asyncio.run(warm_cache_handler(job, db))
+    return run_async(warm_cache_handler(job, db))
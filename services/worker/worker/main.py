@@ -2,14 +2,21 @@ import asyncio
 import json
 import hashlib
 import os
-from concurrent.futures import ThreadPoolExecutor, wait
+import time
 from datetime import datetime
 from uuid import UUID
 import structlog
 from sqlalchemy.orm import Session
+from worker.config import settings
 from worker.database import get_db
-from worker.shared.aws_clients import SQSClient
+from worker.admission import MemoryAdmission, estimate_job_memory, host_memory_budget
+from worker import metrics, profiling
+from worker.scheduling import priority_class
+from worker.runtime import JobHandler, WorkerRuntime, run_async
+from worker.pipeline.cpu_pool import cpu_mode
+from worker.shared.job_queue import claim_job, enqueue_jobs, get_queue_client, release_dependents
 from worker.jobs.process_week import process_week_handler
+from worker.jobs.process_scene import process_scene_week_handler
 from worker.jobs.alerts_week import handle_alerts_week
 from worker.jobs.signals_week import signals_week_handler
 from worker.jobs.forecast_week import handle_forecast_week
@@ -21,17 +28,19 @@ from worker.jobs.create_mosaic import create_mosaic_handler
 from worker.jobs.calculate_stats import calculate_stats_handler, calculate_stats_sync_handler
 from worker.jobs.warm_cache import warm_cache_handler, warm_cache_sync_handler
 from worker.jobs.detect_harvest import detect_harvest_handler
+from worker.jobs.sync_scene_catalog import sync_scene_catalog_handler
 
 logger = structlog.get_logger()
 
 # Concurrency settings (defaults to 2)
 WORKER_CONCURRENCY = max(1, int(os.getenv("WORKER_CONCURRENCY", "2")))
-MAX_MESSAGES = min(10, WORKER_CONCURRENCY)
 
-# Job type to handler mapping
+# Job type to handler mapping; wrap a handler in JobHandler to choose how its
+# CPU-bound raster stages run (default: threads)
 JOB_HANDLERS = {
     # Existing handlers (legacy COG-based processing)
-    "PROCESS_WEEK": process_week_handler,
+    "PROCESS_WEEK": JobHandler(process_week_handler, cpu_mode="process"),
+    "PROCESS_SCENE_WEEK": process_scene_week_handler,
     "PROCESS_RADAR_WEEK": process_radar_week_handler,
     "PROCESS_TOPOGRAPHY": process_topography_handler,
     "PROCESS_WEATHER": process_weather_handler,
@@ -44,6 +53,7 @@ JOB_HANDLERS = {
     "CALCULATE_STATS": calculate_stats_handler,
     "WARM_CACHE": warm_cache_handler,
     "DETECT_HARVEST": detect_harvest_handler,
+    "SYNC_SCENE_CATALOG": sync_scene_catalog_handler,
 }
 
 
@@ -51,6 +61,12 @@ def run_handler(handler, job_id: str, payload: dict, db: Session):
     """
     Run sync or async job handlers with a consistent wrapper.
     """
+    spec = handler if isinstance(handler, JobHandler) else JobHandler(handler)
+    with cpu_mode(spec.cpu_mode):
+        return _call_handler(spec.handler, job_id, payload, db)
+
+
+def _call_handler(handler, job_id: str, payload: dict, db: Session):
     if asyncio.iscoroutinefunction(handler):
         job = {
             "id": job_id,
@@ -58,7 +74,7 @@ def run_handler(handler, job_id: str, payload: dict, db: Session):
             "aoi_id": payload.get("aoi_id"),
             "payload": payload,
         }
-        return asyncio.run(handler(job, db))
+        return run_async(handler(job, db))
 
     return handler(job_id=job_id, payload=payload, db=db)
 
@@ -72,19 +88,59 @@ def calculate_job_key(tenant_id: str, aoi_id: str, year: int, week: int, job_typ
     return hashlib.sha256(data.encode()).hexdigest()
 
 
-def _mark_job_failed(db: Session, job_id: str, error: str):
+def _mark_job_failed(db: Session, job_id: str, error: str, final: bool = True):
+    """
+    Record a failed attempt. Only the last attempt marks the job FAILED; an
+    earlier one leaves it RUNNING with the error until the message is
+    redelivered, so FAILED is always final (see release_dependents()).
+    """
     from sqlalchemy import text
-    sql = text("UPDATE jobs SET status = 'FAILED', error_message = :error, updated_at = now() WHERE id = :job_id")
-    db.execute(sql, {"job_id": job_id, "error": error})
+    sql = text("UPDATE jobs SET status = :status, error_message = :error, updated_at = now() WHERE id = :job_id")
+    db.execute(sql, {"job_id": job_id, "status": "FAILED" if final else "RUNNING", "error": error})
     db.commit()
 
 
-def process_message(message: dict, db: Session):
+def _mark_job_done(db: Session, job_id: str):
+    """Mark a job whose handler returned DONE, unless the handler already set a final status."""
+    from sqlalchemy import text
+    sql = text("""
+        UPDATE jobs SET status = 'DONE', error_message = NULL, updated_at = now()
+        WHERE id = :job_id AND status NOT IN ('DONE', 'FAILED', 'CANCELLED')
+    """)
+    db.execute(sql, {"job_id": job_id})
+    db.commit()
+
+
+def dispatch_dependents(db: Session, sqs, job_id: str):
+    """Enqueue the jobs that were waiting for job_id to finish (job DAG)."""
+    try:
+        released = release_dependents(db, job_id)
+        enqueue_jobs(sqs, released)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def process_message(message: dict, db: Session, sqs=None):
     """
     Process a single SQS message.
+
+    A message whose job is already DONE, or being run by another worker, is
+    skipped (claim_job()).
+
+    A handler that returns leaves its job DONE unless it set a final status
+    itself (e.g. FAILED after catching its own error); one that raises marks
+    the job FAILED on the message's last attempt (settings.sqs_max_receive_count).
+
+    With a queue client (sqs), a job that reached a final status then dispatches its released dependents; if that
+    fails the error propagates so the message is redelivered and the release
+    retried (handlers are idempotent).
     """
     body = None
     job_id = None
+    attempt = int((message.get("Attributes") or {}).get("ApproximateReceiveCount") or 1)
+    final = attempt >= settings.sqs_max_receive_count
     try:
         # Parse message body (can be JSON string or already a dict in local/dev)
         raw_body = message.get('Body')
@@ -105,8 +161,26 @@ def process_message(message: dict, db: Session):
             logger.error("unknown_job_type", job_type=job_type)
             return
         
-        # Execute handler
-        run_handler(handler, job_id, payload, db)
+        # Execute handler, unless the job is already done or running elsewhere
+        with claim_job(db, job_id) as claimed:
+            if not claimed:
+                logger.info("job_coalesced", job_id=job_id, job_type=job_type)
+                metrics.job_duration.labels(job_type, "skipped").observe(0)
+                return
+            metrics.observe_message(job_type, priority_class(payload), message)
+            token = metrics.current_job_type.set(job_type)
+            started = time.perf_counter()
+            try:
+                with profiling.profile_job(db, job_id, payload, attempt):
+                    run_handler(handler, job_id, payload, db)
+            except Exception:
+                metrics.job_duration.labels(job_type, "failed").observe(time.perf_counter() - started)
+                raise
+            finally:
+                metrics.current_job_type.reset(token)
+            metrics.job_duration.labels(job_type, "completed").observe(time.perf_counter() - started)
+            if job_id:
+                _mark_job_done(db, job_id)
         
         logger.info("job_completed", job_id=job_id, job_type=job_type)
         
@@ -114,11 +188,18 @@ def process_message(message: dict, db: Session):
         logger.error("job_failed", exc_info=e, message_id=message.get('MessageId'))
         if job_id:
             try:
-                _mark_job_failed(db, job_id, str(e))
+                db.rollback()
+                _mark_job_failed(db, job_id, str(e), final)
+                if final and sqs is not None:
+                    # No retry follows: its dependents are released, or fail with it
+                    dispatch_dependents(db, sqs, job_id)
             except Exception as mark_error:
                 logger.error("job_failed_mark_error", exc_info=mark_error, job_id=job_id)
         raise
 
+    if job_id and sqs is not None:
+        dispatch_dependents(db, sqs, job_id)
+
 
 def main():
     """
@@ -136,60 +217,47 @@ def main():
     )
     
     logger.info("worker_starting")
+    metrics.start_metrics_server()
     
-    # Initialize SQS client
-    sqs = SQSClient()
-    
-    # Main loop
-    executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY)
-    while True:
+    # Initialize the queue backend (SQS or the jobs table)
+    sqs = get_queue_client()
+
+    def process_one(msg: dict, source_queue: str) -> bool:
+        """Run one message's job; True = delete the message (the runtime batches deletes)."""
+        db = get_db()
         try:
-            # 1. Try High Priority Queue first (Short poll)
-            # Use short wait time to avoid blocking too long if empty, 
-            # but long enough to catch messages if bursty.
-            high_messages = sqs.receive_messages(
-                queue_url=sqs.queue_high_url, 
-                max_messages=MAX_MESSAGES, 
-                wait_time=2
-            )
-            
-            if high_messages:
-                messages = high_messages
-                logger.info("processing_high_priority_job")
-            else:
-                # 2. If no high priority, check Default Queue (Long polling)
-                # Only check default if high is empty
-                messages = sqs.receive_messages(
-                    queue_url=sqs.queue_url, 
-                    max_messages=MAX_MESSAGES, 
-                    wait_time=20
-                )
-            
-            if not messages:
-                continue
-            
-            source_queue = sqs.queue_high_url if high_messages else sqs.queue_url
-
-            def process_one(msg: dict):
-                db = get_db()
-                try:
-                    process_message(msg, db)
-                    sqs.delete_message(msg['ReceiptHandle'], queue_url=source_queue)
-                except Exception as e:
-                    logger.error("message_processing_failed", exc_info=e)
-                finally:
-                    db.close()
-
-            futures = [executor.submit(process_one, message) for message in messages]
-            wait(futures)
-        
-        except KeyboardInterrupt:
-            logger.info("worker_shutdown")
-            break
+            process_message(msg, db, sqs)
+            return True
         except Exception as e:
-            logger.error("worker_error", exc_info=e)
-            import time
-            time.sleep(1) # Prevent tight loop on error
+            logger.error("message_processing_failed", exc_info=e)
+            return False
+        finally:
+            db.close()
+
+    def estimate(job_type, payload):
+        db = get_db()
+        try:
+            return estimate_job_memory(job_type, payload, db)
+        finally:
+            db.close()
+
+    admission = None
+    if settings.memory_admission_enabled:
+        admission = MemoryAdmission(host_memory_budget(), estimate)
+        logger.info("memory_admission_enabled", budget_mb=admission.budget // (1024 * 1024))
+
+    # Continuous receive -> dispatch on one long-lived event loop
+    runtime = WorkerRuntime(
+        sqs,
+        process_one,
+        concurrency=WORKER_CONCURRENCY,
+        job_type_limits=settings.job_type_concurrency,
+        admission=admission,
+    )
+    try:
+        asyncio.run(runtime.run())
+    except KeyboardInterrupt:
+        logger.info("worker_shutdown")
 
 
 if __name__ == "__main__":
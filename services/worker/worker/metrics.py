@@ -0,0 +1,120 @@
+"""
+Worker Prometheus metrics.
+
+main() serves them on settings.metrics_port (/metrics, 0 = off). Jobs are
+labelled by job type; stage timings come from the stage() context manager
+around the pipeline steps (search, read, mask, indices, encode, upload,
+db), which picks the job type up from the job's context, so the pipeline
+modules don't need to pass it around.
+
+Bytes read are the decoded pixels of raster reads plus S3 objects fetched;
+bytes written are the objects uploaded to S3.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import structlog
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from worker.config import settings
+
+logger = structlog.get_logger()
+
+# Job type of the job running in this context (set by process_message)
+current_job_type: contextvars.ContextVar[str] = contextvars.ContextVar("current_job_type", default="none")
+# JobProfile of the job running in this context, if it is profiled (worker/profiling.py)
+active_profile: contextvars.ContextVar[Optional[object]] = contextvars.ContextVar("active_profile", default=None)
+
+_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+job_duration = Histogram(
+    'vivacampo_worker_job_duration_seconds',
+    'Job handler duration in seconds',
+    ['job_type', 'status'],
+    buckets=_DURATION_BUCKETS,
+)
+
+stage_duration = Histogram(
+    'vivacampo_worker_stage_duration_seconds',
+    'Pipeline stage duration in seconds',
+    ['job_type', 'stage'],
+    buckets=_DURATION_BUCKETS,
+)
+
+queue_wait = Histogram(
+    'vivacampo_worker_queue_wait_seconds',
+    'Time from enqueue to job start in seconds',
+    ['job_type', 'priority_class'],
+    buckets=_DURATION_BUCKETS + (7200, 21600, 86400),
+)
+
+bytes_read = Counter(
+    'vivacampo_worker_bytes_read_total',
+    'Bytes read: decoded raster pixels and S3 objects',
+    ['job_type'],
+)
+
+bytes_written = Counter(
+    'vivacampo_worker_bytes_written_total',
+    'Bytes uploaded to S3',
+    ['job_type'],
+)
+
+job_retries = Counter(
+    'vivacampo_worker_job_retries_total',
+    'Jobs started from a message received more than once',
+    ['job_type'],
+)
+
+jobs_in_flight = Gauge(
+    'vivacampo_worker_jobs_in_flight',
+    'Jobs whose handler is running',
+)
+
+jobs_waiting = Gauge(
+    'vivacampo_worker_jobs_waiting',
+    'Received messages waiting in the scheduler for a slot',
+)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a pipeline stage of the current job (and its peak memory, if profiled)."""
+    profile = active_profile.get()
+    if profile is not None:
+        profile.stage_started()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.labels(current_job_type.get(), name).observe(time.perf_counter() - start)
+        if profile is not None:
+            profile.stage_finished(name)
+
+
+def count_read(nbytes: int):
+    bytes_read.labels(current_job_type.get()).inc(nbytes)
+
+
+def count_written(nbytes: int):
+    bytes_written.labels(current_job_type.get()).inc(nbytes)
+
+
+def observe_message(job_type: str, priority_class: str, message: dict):
+    """Queue wait and retry of a message whose job is starting."""
+    attributes = message.get("Attributes") or {}
+    sent_ms: Optional[str] = attributes.get("SentTimestamp")
+    if sent_ms:
+        queue_wait.labels(job_type, priority_class).observe(max(0.0, time.time() - int(sent_ms) / 1000))
+    if int(attributes.get("ApproximateReceiveCount") or 1) > 1:
+        job_retries.labels(job_type).inc()
+
+
+def start_metrics_server(port: Optional[int] = None):
+    """Serve /metrics (no-op when the port is 0)."""
+    port = settings.metrics_port if port is None else port
+    if port:
+        start_http_server(port)
+        logger.info("metrics_server_started", port=port)
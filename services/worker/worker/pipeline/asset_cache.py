@@ -0,0 +1,235 @@
+"""
+Host-local on-disk cache for source raster assets.
+
+Many AOIs fall inside the same Sentinel-2 MGRS tile, so PROCESS_WEEK,
+PROCESS_RADAR_WEEK and PROCESS_TOPOGRAPHY jobs running on one host keep
+fetching the same bands. This cache stores fetched assets (whole files, or
+block-aligned windows of a file) in a shared directory so every worker thread
+and process on the host can reuse them.
+
+- Keys: the unsigned asset href, plus the byte range / window when only part
+  of the asset was read.
+- Concurrency: fills are serialized per key with an flock() on a sidecar lock
+  file and published with an atomic rename, so readers never see partial data.
+- Eviction: least-recently-used by mtime (touched on every hit) once the
+  directory grows past the size budget. An entry's lock file is removed with
+  it, under its lock.
+- The budget is soft: entries used in the last EVICTION_GRACE_SECONDS are
+  never evicted (their paths may just have been handed out), so a burst of
+  fills can take the cache past max_bytes until they age out;
+  "asset_cache_over_budget" is logged when that happens.
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import structlog
+
+from worker.config import settings
+
+logger = structlog.get_logger()
+
+DATA_SUFFIX = ".tif"
+LOCK_SUFFIX = ".lock"
+PART_SUFFIX = ".part"
+EVICT_LOCK_NAME = ".evict.lock"
+
+# Entries used this recently are never evicted, so a path handed to a caller
+# cannot disappear before it is opened.
+EVICTION_GRACE_SECONDS = 300
+
+# Evict down to this fraction of the budget to avoid evicting on every fill.
+EVICTION_LOW_WATERMARK = 0.9
+
+
+class AssetCache:
+    """Size-bounded, LRU-evicted asset cache shared by all processes on a host."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def make_key(href: str, byte_range: Optional[str] = None) -> str:
+        """Cache key for an asset href and, optionally, the part of it that was read."""
+        raw = href if byte_range is None else f"{href}|{byte_range}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + DATA_SUFFIX)
+
+    @contextmanager
+    def _lock(self, name: str, blocking: bool = True):
+        path = os.path.join(self.root, name)
+        while True:
+            fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(fd, flags)
+            except BlockingIOError:
+                os.close(fd)
+                yield False
+                return
+            # Eviction removes lock files: make sure we locked the current one
+            try:
+                current = os.fstat(fd).st_ino == os.stat(path).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                break
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _remove_entry(self, key: str, orphan_lock: bool = False) -> bool:
+        """
+        Remove a key's data file and lock file, unless the key is being filled.
+        orphan_lock: only remove the lock file, and only if there is no data file.
+        """
+        with self._lock(key + LOCK_SUFFIX, blocking=False) as acquired:
+            if not acquired:
+                return False
+            if orphan_lock and os.path.exists(self._path(key)):
+                return False
+            if not orphan_lock:
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            # Removed while held: waiters notice and lock the next file
+            os.remove(os.path.join(self.root, key + LOCK_SUFFIX))
+        return True
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Return the cached path for key (marking it recently used) or None."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_or_fill(
+        self,
+        href: str,
+        fill: Callable[[str], None],
+        byte_range: Optional[str] = None,
+    ) -> str:
+        """
+        Return a local path holding the asset, calling fill(tmp_path) on a miss.
+
+        Concurrent callers for the same key wait on the per-key lock and then
+        reuse the file written by whoever filled it first. The returned path is
+        owned by the cache and must not be deleted by the caller.
+        """
+        key = self.make_key(href, byte_range)
+        path = self.lookup(key)
+        if path:
+            logger.info("asset_cache_hit", href=href[:80], byte_range=byte_range)
+            return path
+
+        with self._lock(key + LOCK_SUFFIX):
+            path = self.lookup(key)
+            if path:
+                logger.info("asset_cache_hit_after_wait", href=href[:80], byte_range=byte_range)
+                return path
+
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}{PART_SUFFIX}"
+            try:
+                fill(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        logger.info(
+            "asset_cache_filled",
+            href=href[:80],
+            byte_range=byte_range,
+            size_bytes=os.path.getsize(path),
+        )
+        self.evict()
+        return path
+
+    def evict(self) -> int:
+        """Remove least-recently-used entries until the cache fits its budget."""
+        with self._lock(EVICT_LOCK_NAME, blocking=False) as acquired:
+            if not acquired:
+                # Another thread/process is already evicting
+                return 0
+
+            entries = []
+            total = 0
+            stale_part_cutoff = time.time() - 3600
+            for entry in os.scandir(self.root):
+                if entry.name.endswith(PART_SUFFIX):
+                    # Left behind by a worker that died mid-fill
+                    try:
+                        if entry.stat().st_mtime < stale_part_cutoff:
+                            os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if entry.name.endswith(LOCK_SUFFIX) and entry.name != EVICT_LOCK_NAME:
+                    # Lock of a fill that failed (no data file)
+                    try:
+                        if entry.stat().st_mtime < stale_part_cutoff:
+                            self._remove_entry(entry.name[:-len(LOCK_SUFFIX)], orphan_lock=True)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if not entry.name.endswith(DATA_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            if total <= self.max_bytes:
+                return 0
+
+            target = int(self.max_bytes * EVICTION_LOW_WATERMARK)
+            cutoff = time.time() - EVICTION_GRACE_SECONDS
+            removed = 0
+            for mtime, size, path in sorted(entries):
+                if total <= target:
+                    break
+                if mtime > cutoff:
+                    break
+                if not self._remove_entry(os.path.basename(path)[:-len(DATA_SUFFIX)]):
+                    continue
+                total -= size
+                removed += 1
+
+            logger.info("asset_cache_evicted", removed=removed, size_bytes=total)
+            if total > self.max_bytes:
+                logger.warning("asset_cache_over_budget", size_bytes=total, max_bytes=self.max_bytes)
+            return removed
+
+
+# Global cache instance
+_asset_cache = None
+
+
+def get_asset_cache() -> Optional[AssetCache]:
+    """Get the host asset cache, or None when caching is disabled."""
+    global _asset_cache
+    if not settings.asset_cache_enabled:
+        return None
+    if _asset_cache is None:
+        root = settings.asset_cache_dir or os.path.join(tempfile.gettempdir(), "vivacampo-asset-cache")
+        _asset_cache = AssetCache(root, settings.asset_cache_max_mb * 1024 * 1024)
+    return _asset_cache
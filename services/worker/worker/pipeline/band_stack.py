@@ -0,0 +1,187 @@
+"""
+Aligned multi-resolution band stack reader.
+
+Sentinel-2 bands come at 10m (B02/B03/B04/B08) and 20m (B05/B11/B12/SCL).
+AOIGrid fixes one output grid per job - the reference (10m) band's pixel
+grid, cropped to the AOI - and computes the AOI reprojection, window and
+inside-AOI mask once. read_band_stack() then reads every requested band
+straight onto that grid (20m bands are resampled during the read) into one
+preallocated (bands, H, W) float32 buffer.
+"""
+import asyncio
+import math
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, bounds as window_bounds, transform as window_transform
+from shapely.geometry import mapping, shape
+
+logger = structlog.get_logger()
+
+# Sentinel-2 SCL classes treated as invalid: no data, saturated, cloud shadow,
+# cloud medium/high probability, thin cirrus
+SCL_INVALID_CLASSES = [0, 1, 3, 8, 9, 10]
+
+# Concurrent band reads per stack
+BAND_READ_CONCURRENCY = 4
+
+
+def pixel_window(geom_bounds: tuple, transform, width: int, height: int) -> Window:
+    """Pixel window (snapped outwards, clamped to the raster) covering projected bounds."""
+    minx, miny, maxx, maxy = geom_bounds
+    col0 = max(0, math.floor((minx - transform.c) / transform.a))
+    col1 = min(width, math.ceil((maxx - transform.c) / transform.a))
+    row0 = max(0, math.floor((maxy - transform.f) / transform.e))
+    row1 = min(height, math.ceil((miny - transform.f) / transform.e))
+    return Window(col0, row0, max(0, col1 - col0), max(0, row1 - row0))
+
+
+@dataclass
+class AOIGrid:
+    """Output pixel grid for one AOI (or group of AOIs) in the reference band CRS."""
+    crs: Any
+    transform: Any
+    width: int
+    height: int
+    geometry: Any = None  # projected shapely geometry, if the grid was built from one
+
+    @classmethod
+    def from_header(cls, header: Dict[str, Any], aoi_geom: Dict[str, Any]) -> "AOIGrid":
+        """Grid covering a (EPSG:4326) AOI on the pixel grid described by a read_header() result."""
+        projected = shape(transform_geom("EPSG:4326", header["crs"], aoi_geom))
+        window = pixel_window(projected.bounds, header["transform"], header["width"], header["height"])
+        return cls.from_window(header, window, projected)
+
+    @classmethod
+    def from_window(cls, header: Dict[str, Any], window: Window, geometry=None) -> "AOIGrid":
+        return cls(
+            crs=header["crs"],
+            transform=window_transform(window, header["transform"]),
+            width=int(window.width),
+            height=int(window.height),
+            geometry=geometry,
+        )
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (self.height, self.width)
+
+    @property
+    def bounds(self) -> tuple:
+        return window_bounds(Window(0, 0, self.width, self.height), self.transform)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.width == 0 or self.height == 0
+
+    def coarsened(self, resolution: float) -> "AOIGrid":
+        """Same area on a coarser grid with pixels of roughly `resolution` CRS units."""
+        factor = max(1, int(round(resolution / abs(self.transform.a))))
+        return replace(
+            self,
+            transform=self.transform * Affine.scale(factor),
+            width=math.ceil(self.width / factor),
+            height=math.ceil(self.height / factor),
+        )
+
+    def subgrid(self, window: Window) -> "AOIGrid":
+        """Part of this grid (same pixels and AOI geometry) covered by a window."""
+        return replace(
+            self,
+            transform=window_transform(window, self.transform),
+            width=int(window.width),
+            height=int(window.height),
+        )
+
+    def inside_mask(self) -> np.ndarray:
+        """True for pixels whose centre falls inside the AOI geometry."""
+        if self.geometry is None:
+            return np.ones(self.shape, dtype=bool)
+        return geometry_mask(
+            [mapping(self.geometry)], out_shape=self.shape, transform=self.transform, invert=True
+        )
+
+    def profile(self) -> Dict[str, Any]:
+        """GeoTIFF profile for single-band outputs on this grid."""
+        return {
+            "driver": "GTiff",
+            "height": self.height,
+            "width": self.width,
+            "count": 1,
+            "dtype": "float32",
+            "crs": self.crs,
+            "transform": self.transform,
+        }
+
+
+async def read_grid_band(
+    client,
+    href: str,
+    grid: AOIGrid,
+    ingestion_mode: Optional[str] = None,
+    resampling: Resampling = Resampling.nearest,
+) -> np.ndarray:
+    """Read one asset onto the grid (native dtype)."""
+    return await asyncio.to_thread(
+        client.read_grid_window, href, grid.bounds, grid.shape, resampling, ingestion_mode
+    )
+
+
+async def read_band_stack(
+    client,
+    assets: Dict[str, Optional[str]],
+    bands: List[str],
+    grid: AOIGrid,
+    ingestion_mode: Optional[str] = None,
+    required: Tuple[str, ...] = (),
+    out: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, Dict[str, int]]:
+    """
+    Read bands onto the grid into one preallocated float32 (bands, H, W) stack.
+
+    Bands without an asset or whose read fails are left out of the returned
+    band index (their slot is NaN); a failing band listed in required raises.
+    out, if given, is a float32 (len(bands), H, W) buffer to read into (e.g.
+    shared memory); the stack returned is its leading slice.
+
+    Returns:
+        (stack, {band name: position in stack})
+    """
+    bands = [b for b in bands if assets.get(b)]
+    if out is not None:
+        stack = out[:len(bands)]
+    else:
+        stack = np.empty((len(bands),) + grid.shape, dtype=np.float32)
+    band_index: Dict[str, int] = {}
+    sem = asyncio.Semaphore(BAND_READ_CONCURRENCY)
+
+    async def read_into(i: int, band: str):
+        async with sem:
+            try:
+                stack[i] = await read_grid_band(client, assets[band], grid, ingestion_mode)
+                band_index[band] = i
+            except Exception as e:
+                if band in required:
+                    raise
+                logger.error("band_read_failed", band=band, error=str(e))
+                stack[i] = np.nan
+
+    await asyncio.gather(*[read_into(i, b) for i, b in enumerate(bands)])
+    return stack, {b: band_index[b] for b in bands if b in band_index}
+
+
+async def read_cloud_mask(
+    client,
+    scl_href: str,
+    grid: AOIGrid,
+    ingestion_mode: Optional[str] = None,
+) -> np.ndarray:
+    """Boolean mask of SCL-invalid pixels on the grid."""
+    scl = await read_grid_band(client, scl_href, grid, ingestion_mode)
+    return np.isin(scl, SCL_INVALID_CLASSES)
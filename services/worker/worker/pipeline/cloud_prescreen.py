@@ -0,0 +1,145 @@
+"""
+AOI-local cloud pre-screening.
+
+Scene-level eo:cloud_cover says little about one AOI: a 20% cloudy tile can
+be clear over the field, or the field can sit under the only cloud. Before
+any band is fetched, each candidate scene's SCL band is read at a coarse
+resolution (settings.cloud_prescreen_resolution_m, served from the COG
+overviews) over the AOI window, and the fraction of AOI pixels that are not
+cloud, shadow or no-data ranks the candidates. Only the winner's bands are
+then read at full resolution.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+from rasterio.features import rasterize
+from rasterio.warp import transform_geom
+from shapely.geometry import mapping, shape
+from shapely.ops import unary_union
+
+from worker.config import settings
+from worker.pipeline.band_stack import SCL_INVALID_CLASSES, AOIGrid, pixel_window
+
+logger = structlog.get_logger()
+
+# Concurrent SCL overview reads
+PRESCREEN_CONCURRENCY = 4
+
+
+def estimated_valid_fraction(scene: Dict[str, Any]) -> float:
+    """Valid fraction implied by scene-level cloud cover (used when SCL can't be screened)."""
+    return max(0.0, 1.0 - (scene.get("cloud_cover") or 0) / 100.0)
+
+
+def valid_fractions(
+    scl: np.ndarray,
+    labels: np.ndarray,
+    n_zones: int,
+) -> List[Optional[float]]:
+    """
+    Fraction of SCL-valid pixels per zone (labels 1..n_zones; 0 = outside).
+    None for zones without any pixel on the grid.
+    """
+    valid = ~np.isin(scl, SCL_INVALID_CLASSES)
+    flat = labels.ravel()
+    totals = np.bincount(flat, minlength=n_zones + 1)
+    valid_counts = np.bincount(flat, weights=valid.ravel(), minlength=n_zones + 1)
+    return [
+        float(valid_counts[z] / totals[z]) if totals[z] else None
+        for z in range(1, n_zones + 1)
+    ]
+
+
+async def screen_scene(
+    client,
+    scene: Dict[str, Any],
+    aoi_geoms: List[Dict[str, Any]],
+    resolution: Optional[float] = None,
+) -> List[Optional[float]]:
+    """
+    AOI-local valid fraction of one scene for each (EPSG:4326) AOI geometry,
+    from a single coarse SCL read over the AOIs' combined window.
+    None where the scene could not be screened for that AOI.
+    """
+    scl_href = scene["assets"].get("scl")
+    if not scl_href:
+        return [None] * len(aoi_geoms)
+
+    header = await asyncio.to_thread(client.read_header, scl_href)
+    projected = [shape(transform_geom("EPSG:4326", header["crs"], g)) for g in aoi_geoms]
+    window = pixel_window(
+        unary_union(projected).bounds, header["transform"], header["width"], header["height"]
+    )
+    grid = AOIGrid.from_window(header, window).coarsened(
+        resolution or settings.cloud_prescreen_resolution_m
+    )
+    if grid.is_empty:
+        return [None] * len(aoi_geoms)
+
+    scl = await asyncio.to_thread(client.read_overview, scl_href, grid.bounds, grid.shape)
+    # all_touched so AOIs smaller than a coarse pixel still get one
+    labels = rasterize(
+        [(mapping(g), i + 1) for i, g in enumerate(projected)],
+        out_shape=grid.shape,
+        transform=grid.transform,
+        fill=0,
+        all_touched=True,
+        dtype="int32",
+    )
+    return valid_fractions(scl, labels, len(projected))
+
+
+async def screen_scenes(
+    client,
+    scenes: List[Dict[str, Any]],
+    aoi_geoms: List[Dict[str, Any]],
+) -> Dict[str, List[Optional[float]]]:
+    """screen_scene() for several scenes concurrently: {scene_id: [fraction per AOI]}"""
+    sem = asyncio.Semaphore(PRESCREEN_CONCURRENCY)
+
+    async def screen(scene):
+        async with sem:
+            try:
+                return await screen_scene(client, scene, aoi_geoms)
+            except Exception as e:
+                logger.warning("cloud_prescreen_failed", scene_id=scene["id"], error=str(e))
+                return [None] * len(aoi_geoms)
+
+    results = await asyncio.gather(*[screen(s) for s in scenes])
+    return {scene["id"]: fractions for scene, fractions in zip(scenes, results)}
+
+
+async def pick_best_scene(
+    client,
+    scenes: List[Dict[str, Any]],
+    aoi_geom: Dict[str, Any],
+) -> Tuple[Dict[str, Any], Optional[float]]:
+    """
+    Best scene for one AOI by AOI-local valid fraction.
+
+    Returns:
+        (scene, measured valid fraction or None if it could not be screened)
+    """
+    by_cloud = sorted(scenes, key=lambda s: s["cloud_cover"])
+    if not settings.cloud_prescreen_enabled:
+        return by_cloud[0], None
+
+    candidates = by_cloud[: settings.cloud_prescreen_max_scenes]
+    fractions = await screen_scenes(client, candidates, [aoi_geom])
+
+    def score(scene):
+        measured = fractions[scene["id"]][0]
+        return measured if measured is not None else estimated_valid_fraction(scene)
+
+    # max() keeps the first (lowest cloud cover) scene on ties
+    best = max(candidates, key=score)
+    logger.info(
+        "cloud_prescreen_complete",
+        candidates=len(candidates),
+        scene_id=best["id"],
+        valid_fraction=fractions[best["id"]][0],
+        scene_cloud_cover=best["cloud_cover"],
+    )
+    return best, fractions[best["id"]][0]
@@ -0,0 +1,271 @@
+"""
+Process pool for CPU-bound raster stages.
+
+Network and file I/O (band reads, uploads, DB) stay on the job's event loop
+and the shared raster thread pool. Pure numpy stages that hold the GIL for
+most of their runtime - index kernels and their statistics - can instead be
+spread over a pool of worker processes.
+
+Band stacks and index outputs are not pickled to the pool: a job allocates
+them in a CpuWorkspace, which backs arrays with multiprocessing shared memory
+when the job runs in "process" CPU mode. Pool processes attach to the
+segments by name, compute their row range in place and send back only small
+mergeable StatsAccumulator partials.
+
+The CPU mode is chosen per job type in main.JOB_HANDLERS (JobHandler.cpu_mode)
+and set for the duration of the handler with cpu_mode(); in "thread" mode (the
+default) a workspace is plain numpy and computes in the calling thread.
+"""
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+from worker.config import settings
+from worker.pipeline.indices import DEFAULT_BLOCK_ROWS, compute_indices
+from worker.pipeline.zonal_stats import StatsAccumulator, value_range_for
+
+logger = structlog.get_logger()
+
+CPU_MODES = ("thread", "process")
+
+# Row ranges handed to the pool per worker process (load balancing)
+CHUNKS_PER_PROCESS = 2
+
+_cpu_mode: contextvars.ContextVar[str] = contextvars.ContextVar("cpu_mode", default="thread")
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_cpu_pool_lock = threading.Lock()
+
+# (segment name, shape, dtype str, byte offset)
+ArraySpec = Tuple[str, Tuple[int, ...], str, int]
+
+
+def current_cpu_mode() -> str:
+    """CPU mode of the running job ("process" only if the pool is enabled)."""
+    mode = _cpu_mode.get()
+    return mode if settings.cpu_pool_enabled else "thread"
+
+
+@contextmanager
+def cpu_mode(mode: str):
+    """Run the enclosed job code in the given CPU mode."""
+    if mode not in CPU_MODES:
+        raise ValueError(f"Unknown CPU mode: {mode}")
+    token = _cpu_mode.set(mode)
+    try:
+        yield
+    finally:
+        _cpu_mode.reset(token)
+
+
+def cpu_pool_size() -> int:
+    return settings.cpu_pool_processes or os.cpu_count() or 1
+
+
+def get_cpu_pool() -> ProcessPoolExecutor:
+    """
+    Process-wide pool for CPU-bound stages.
+
+    Processes are spawned, not forked: the worker runs GDAL and many threads,
+    neither of which survives fork() reliably.
+    """
+    global _cpu_pool
+    if _cpu_pool is None:
+        with _cpu_pool_lock:
+            if _cpu_pool is None:
+                _cpu_pool = ProcessPoolExecutor(
+                    max_workers=cpu_pool_size(),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info("cpu_pool_started", processes=cpu_pool_size())
+    return _cpu_pool
+
+
+def _reset_cpu_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool (e.g. a process was OOM-killed) so the next job gets a new one."""
+    global _cpu_pool
+    with _cpu_pool_lock:
+        if _cpu_pool is pool:
+            _cpu_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SharedArray:
+    """numpy array backed by a multiprocessing shared memory segment."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, array: np.ndarray, owner: bool):
+        self.shm = shm
+        self.array = array
+        self.owner = owner
+
+    @classmethod
+    def create(cls, shape: Tuple[int, ...], dtype=np.float32) -> "SharedArray":
+        dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        return cls(shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf), owner=True)
+
+    @classmethod
+    def attach(cls, spec: ArraySpec) -> "SharedArray":
+        name, shape, dtype, offset = spec
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset), owner=False)
+
+    def spec_of(self, view: np.ndarray) -> Optional[ArraySpec]:
+        """Spec of a C-contiguous view into this segment (None if it isn't one)."""
+        if self.array is None or not view.flags.c_contiguous or not np.shares_memory(view, self.array):
+            return None
+        offset = view.__array_interface__["data"][0] - self.array.__array_interface__["data"][0]
+        return (self.shm.name, view.shape, view.dtype.str, offset)
+
+    def close(self):
+        """Release this mapping; the owner also removes the segment."""
+        self.array = None
+        if self.owner:
+            self.shm.unlink()
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views are still referenced (e.g. by an exception traceback);
+            # the mapping goes away with them, the segment is already unlinked
+            pass
+
+
+def _index_rows(
+    stack_spec: ArraySpec,
+    out_specs: Dict[str, ArraySpec],
+    band_index: Dict[str, int],
+    start: int,
+    stop: int,
+) -> Dict[str, StatsAccumulator]:
+    """Pool task: compute indices for rows [start, stop) in place, return their stats partials."""
+    shared = [SharedArray.attach(stack_spec)] + [SharedArray.attach(s) for s in out_specs.values()]
+    try:
+        rows = slice(start, stop)
+        stack = shared[0].array[:, rows]
+        out = {name: s.array[rows] for name, s in zip(out_specs, shared[1:])}
+        compute_indices(stack, band_index, list(out), out=out)
+        partials = {
+            name: StatsAccumulator(value_range=value_range_for(name)).update(values)
+            for name, values in out.items()
+        }
+        del stack, out
+        return partials
+    finally:
+        for s in shared:
+            s.close()
+
+
+def row_chunks(height: int, n_chunks: int, block_rows: int = DEFAULT_BLOCK_ROWS) -> List[Tuple[int, int]]:
+    """Split rows into at most n_chunks ranges aligned to index blocks."""
+    blocks = -(-height // block_rows)
+    per_chunk = max(1, -(-blocks // max(1, n_chunks))) * block_rows
+    return [(start, min(start + per_chunk, height)) for start in range(0, height, per_chunk)]
+
+
+class CpuWorkspace:
+    """
+    Arrays and CPU stages of one job.
+
+    Usage:
+        with CpuWorkspace() as workspace:
+            stack = workspace.empty((bands, rows, cols))
+            ...
+            indices, stats = await workspace.indices_with_stats(stack, band_index, names)
+
+    Arrays from the workspace are only valid inside the with block.
+    """
+
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = mode or current_cpu_mode()
+        self._shared: List[SharedArray] = []
+
+    def __enter__(self) -> "CpuWorkspace":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for shared in self._shared:
+            shared.close()
+        self._shared = []
+
+    def empty(self, shape: Tuple[int, ...], dtype=np.float32) -> np.ndarray:
+        """Uninitialised array; shared memory in process mode."""
+        if self.mode != "process":
+            return np.empty(shape, dtype=dtype)
+        shared = SharedArray.create(shape, dtype)
+        self._shared.append(shared)
+        return shared.array
+
+    def _spec(self, array: np.ndarray) -> ArraySpec:
+        for shared in self._shared:
+            spec = shared.spec_of(array)
+            if spec is not None:
+                return spec
+        # Not one of ours: copy it into shared memory once
+        copy = self.empty(array.shape, array.dtype)
+        copy[...] = array
+        return self._shared[-1].spec_of(copy)
+
+    async def indices_with_stats(
+        self,
+        stack: np.ndarray,
+        band_index: Dict[str, int],
+        names: Iterable[str],
+        percentiles: Optional[Dict[str, Tuple[int, ...]]] = None,
+        block_rows: int = DEFAULT_BLOCK_ROWS,
+    ) -> Tuple[Dict[str, np.ndarray], Dict[str, float]]:
+        """
+        compute_indices() plus single-pass stats for each index.
+
+        Returns:
+            ({index name: float32 array}, {"{index}_mean": ..., ...})
+        """
+        names = list(names)
+        percentiles = percentiles or {}
+        _, height, width = stack.shape
+        chunks = row_chunks(height, cpu_pool_size() * CHUNKS_PER_PROCESS, block_rows)
+
+        if self.mode != "process" or len(chunks) < 2:
+            indices = compute_indices(stack, band_index, names, block_rows=block_rows)
+            accumulators = {
+                name: StatsAccumulator(value_range=value_range_for(name)).update(indices[name])
+                for name in names
+            }
+        else:
+            indices = {name: self.empty((height, width)) for name in names}
+            stack_spec = self._spec(stack)
+            out_specs = {name: self._spec(indices[name]) for name in names}
+            loop = asyncio.get_running_loop()
+            pool = get_cpu_pool()
+            try:
+                partials = await asyncio.gather(*[
+                    loop.run_in_executor(
+                        pool, partial(_index_rows, stack_spec, out_specs, band_index, start, stop)
+                    )
+                    for start, stop in chunks
+                ])
+            except BrokenProcessPool:
+                _reset_cpu_pool(pool)
+                raise
+            accumulators = partials[0]
+            for part in partials[1:]:
+                for name in names:
+                    accumulators[name].merge(part[name])
+
+        stats: Dict[str, float] = {}
+        for name in names:
+            stats.update(accumulators[name].result(name, percentiles=percentiles.get(name, ())))
+        return indices, stats
@@ -0,0 +1,244 @@
+"""
+Spectral index engine.
+
+Single place where the vegetation / moisture / soil indices produced by the
+worker are defined. Each index declares the bands it needs, a block kernel
+used for local computation and, where TiTiler can evaluate it, the band-math
+expression used by the dynamic-tiling pipeline (CALCULATE_STATS).
+
+compute_indices() evaluates every requested index in one block-wise pass over
+an aligned float32 band stack:
+
+- bands are read from the stack once per block (no reloading from disk)
+- shared sub-expressions (e.g. NIR+Red used by NDVI, SAVI) are computed once
+  per block and reused by every index that needs them
+- temporaries are bounded by the block size, outputs are preallocated
+
+Kernels preserve the formulas (including epsilons and clipping) of the
+original per-index implementation in PROCESS_WEEK.
+"""
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Baseline NDVI used for the weekly anomaly map
+NDVI_BASELINE = 0.60
+
+# Epsilon used by the ratio indices to avoid division by zero
+EPS = 1e-6
+
+# Rows per block; with 8 bands and ~10 live temporaries a 10k-pixel-wide AOI
+# keeps block temporaries around 10 MB.
+DEFAULT_BLOCK_ROWS = 256
+
+
+class _Block:
+    """Lazily computed, cached sub-expressions for one row block."""
+
+    def __init__(self, stack: np.ndarray, band_index: Dict[str, int], rows: slice):
+        self._stack = stack
+        self._band_index = band_index
+        self._rows = rows
+        self._cache: Dict[Tuple, np.ndarray] = {}
+        self.indices: Dict[str, np.ndarray] = {}
+
+    def _cached(self, key: Tuple, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        value = self._cache.get(key)
+        if value is None:
+            value = compute()
+            self._cache[key] = value
+        return value
+
+    def band(self, name: str) -> np.ndarray:
+        return self._stack[self._band_index[name], self._rows]
+
+    def add(self, a: str, b: str) -> np.ndarray:
+        a, b = sorted((a, b))
+        return self._cached(("add", a, b), lambda: self.band(a) + self.band(b))
+
+    def sub(self, a: str, b: str) -> np.ndarray:
+        return self._cached(("sub", a, b), lambda: self.band(a) - self.band(b))
+
+    def plus_eps(self, a: str) -> np.ndarray:
+        return self._cached(("plus_eps", a), lambda: self.band(a) + EPS)
+
+    def recip(self, a: str) -> np.ndarray:
+        return self._cached(("recip", a), lambda: 1 / self.plus_eps(a))
+
+    def normalized_difference(self, a: str, b: str) -> np.ndarray:
+        """(a - b) / (a + b + EPS)"""
+        return self.sub(a, b) / (self.add(a, b) + EPS)
+
+
+def _safe_normalized_difference(block: _Block, a: str, b: str) -> np.ndarray:
+    """(a - b) / (a + b) with zero denominators replaced, clipped to [-1, 1]."""
+    denom = block.add(a, b)
+    denom = np.where(denom == 0, 0.0001, denom)
+    return np.clip(block.sub(a, b) / denom, -1, 1)
+
+
+def _ndvi(block: _Block) -> np.ndarray:
+    return _safe_normalized_difference(block, "nir", "red")
+
+
+def _savi(block: _Block, L: float = 0.5) -> np.ndarray:
+    denom = block.add("nir", "red") + L
+    denom = np.where(denom == 0, 0.0001, denom)
+    return np.clip((block.sub("nir", "red") / denom) * (1 + L), -1, 1)
+
+
+def _ndwi(block: _Block) -> np.ndarray:
+    return _safe_normalized_difference(block, "green", "nir")
+
+
+def _ndmi(block: _Block) -> np.ndarray:
+    return _safe_normalized_difference(block, "nir", "swir")
+
+
+def _anomaly(block: _Block) -> np.ndarray:
+    return block.indices["ndvi"] - NDVI_BASELINE
+
+
+def _ndre(block: _Block) -> np.ndarray:
+    return block.normalized_difference("nir", "rededge")
+
+
+def _reci(block: _Block) -> np.ndarray:
+    return block.band("nir") / block.plus_eps("rededge") - 1
+
+
+def _ari(block: _Block) -> np.ndarray:
+    return block.recip("green") - block.recip("rededge")
+
+
+def _gndvi(block: _Block) -> np.ndarray:
+    return block.normalized_difference("nir", "green")
+
+
+def _evi(block: _Block) -> np.ndarray:
+    nir, red, blue = block.band("nir"), block.band("red"), block.band("blue")
+    return 2.5 * (block.sub("nir", "red") / (nir + 6 * red - 7.5 * blue + 1 + EPS))
+
+
+def _bsi(block: _Block) -> np.ndarray:
+    soil = block.add("swir", "red")
+    veg = block.add("nir", "blue")
+    return (soil - veg) / (soil + veg + EPS)
+
+
+def _cri(block: _Block) -> np.ndarray:
+    return block.recip("blue") - block.recip("green")
+
+
+def _msi(block: _Block) -> np.ndarray:
+    return block.band("swir") / block.plus_eps("nir")
+
+
+def _nbr(block: _Block) -> np.ndarray:
+    return block.normalized_difference("nir", "swir2")
+
+
+@dataclass(frozen=True)
+class IndexDefinition:
+    name: str
+    bands: Tuple[str, ...]
+    kernel: Callable[[_Block], np.ndarray]
+    depends_on: Tuple[str, ...] = ()
+    # TiTiler band-math expression (Sentinel-2 band names), if supported
+    expression: Optional[str] = None
+
+
+# Evaluation order matters only for depends_on (anomaly after ndvi).
+INDEX_DEFINITIONS: Dict[str, IndexDefinition] = {
+    d.name: d
+    for d in [
+        IndexDefinition("ndvi", ("red", "nir"), _ndvi, expression="(B08-B04)/(B08+B04)"),
+        IndexDefinition("savi", ("red", "nir"), _savi, expression="1.5*(B08-B04)/(B08+B04+0.5)"),
+        IndexDefinition("ndwi", ("green", "nir"), _ndwi, expression="(B03-B08)/(B03+B08)"),
+        IndexDefinition("ndmi", ("nir", "swir"), _ndmi, expression="(B08-B11)/(B08+B11)"),
+        IndexDefinition("anomaly", ("red", "nir"), _anomaly, depends_on=("ndvi",)),
+        IndexDefinition("ndre", ("nir", "rededge"), _ndre, expression="(B08-B05)/(B08+B05)"),
+        IndexDefinition("reci", ("nir", "rededge"), _reci),
+        IndexDefinition("ari", ("green", "rededge"), _ari),
+        IndexDefinition("gndvi", ("nir", "green"), _gndvi, expression="(B08-B03)/(B08+B03)"),
+        IndexDefinition(
+            "evi", ("nir", "red", "blue"), _evi, expression="2.5*(B08-B04)/(B08+6*B04-7.5*B02+1)"
+        ),
+        IndexDefinition("bsi", ("swir", "red", "nir", "blue"), _bsi),
+        IndexDefinition("cri", ("blue", "green"), _cri),
+        IndexDefinition("msi", ("swir", "nir"), _msi),
+        IndexDefinition("nbr", ("nir", "swir2"), _nbr),
+    ]
+}
+
+
+def available_indices(bands: Iterable[str], requested: Optional[Iterable[str]] = None) -> List[str]:
+    """Indices (in evaluation order) computable from the given bands."""
+    bands = set(bands)
+    requested = set(requested) if requested is not None else set(INDEX_DEFINITIONS)
+    return [
+        name for name, d in INDEX_DEFINITIONS.items()
+        if name in requested and bands.issuperset(d.bands)
+    ]
+
+
+def titiler_expressions(names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+    """TiTiler band-math expressions for the given (default: all supported) indices."""
+    names = list(names) if names is not None else list(INDEX_DEFINITIONS)
+    return {
+        name: INDEX_DEFINITIONS[name].expression
+        for name in names
+        if INDEX_DEFINITIONS[name].expression is not None
+    }
+
+
+def compute_indices(
+    stack: np.ndarray,
+    band_index: Dict[str, int],
+    names: Iterable[str],
+    block_rows: int = DEFAULT_BLOCK_ROWS,
+    out: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Evaluate indices over an aligned (bands, rows, cols) float32 stack.
+
+    Args:
+        stack: Band stack; masked pixels should be NaN
+        band_index: Band name -> position in the stack
+        names: Indices to compute (see INDEX_DEFINITIONS)
+        block_rows: Rows evaluated per block
+        out: Preallocated float32 (rows, cols) outputs by index name (e.g.
+            shared memory); indices not in it are allocated here
+
+    Returns:
+        {index name: float32 (rows, cols) array}
+    """
+    names = list(names)
+    # Pull in dependencies (e.g. anomaly needs ndvi) and keep definition order
+    wanted = set(names)
+    for name in names:
+        wanted.update(INDEX_DEFINITIONS[name].depends_on)
+    order = [name for name in INDEX_DEFINITIONS if name in wanted]
+
+    missing = {b for name in order for b in INDEX_DEFINITIONS[name].bands} - set(band_index)
+    if missing:
+        raise ValueError(f"Missing bands for requested indices: {sorted(missing)}")
+
+    _, height, width = stack.shape
+    out = out or {}
+    outputs = {
+        name: out[name] if name in out else np.empty((height, width), dtype=np.float32)
+        for name in order
+    }
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for start in range(0, height, block_rows):
+            rows = slice(start, min(start + block_rows, height))
+            block = _Block(stack, band_index, rows)
+            for name in order:
+                result = INDEX_DEFINITIONS[name].kernel(block)
+                outputs[name][rows] = result
+                block.indices[name] = outputs[name][rows]
+
+    return {name: outputs[name] for name in names}
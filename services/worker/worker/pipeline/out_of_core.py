@@ -0,0 +1,221 @@
+"""
+Out-of-core (block-wise) AOI processing.
+
+The in-memory path of PROCESS_WEEK holds every band of the AOI grid and every
+index output at once, so its peak memory grows with AOI area. Jobs admitted
+with processing_mode "out_of_core" (worker/admission.py) instead walk the AOI
+grid in blocks of settings.out_of_core_block_size pixels, aligned to the
+source COG's internal tiles so every tile is range-read once. Per block the
+bands are read, masked, turned into indices, folded into streaming
+StatsAccumulators and written to local output files; the next block's reads
+run while the current one is computed. Peak memory is about two blocks of
+bands plus indices, whatever the AOI size.
+
+Outputs and statistics match the in-memory path, except that pixels outside
+the AOI polygon are NaN in the radar rasters as well.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+from rasterio.windows import Window
+
+from worker.config import settings
+from worker.pipeline.band_stack import AOIGrid, read_band_stack, read_cloud_mask, read_grid_band
+from worker.pipeline.indices import available_indices, compute_indices
+from worker.pipeline.raster_io import BlockIndexStackWriter, BlockRasterWriter
+from worker.pipeline.zonal_stats import StatsAccumulator, value_range_for
+
+logger = structlog.get_logger()
+
+
+def aligned_blocks(length: int, offset: int, size: int) -> List[Tuple[int, int]]:
+    """
+    Split [0, length) into ranges of at most size whose boundaries fall on
+    multiples of size in source coordinates (grid position + offset).
+    """
+    ranges = []
+    start = 0
+    while start < length:
+        stop = min(length, (((start + offset) // size) + 1) * size - offset)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def grid_blocks(grid: AOIGrid, header: Dict[str, Any], block_size: Optional[int] = None) -> List[Window]:
+    """Windows covering the grid, aligned to the source asset's internal tiles."""
+    size = block_size or settings.out_of_core_block_size
+    tile_rows, tile_cols = header.get("block_shape") or (size, size)
+    # Whole source tiles per block
+    rows = max(tile_rows, size // tile_rows * tile_rows)
+    cols = max(tile_cols, size // tile_cols * tile_cols)
+    src = header["transform"]
+    row_offset = int(round((grid.transform.f - src.f) / src.e))
+    col_offset = int(round((grid.transform.c - src.c) / src.a))
+    return [
+        Window(c0, r0, c1 - c0, r1 - r0)
+        for r0, r1 in aligned_blocks(grid.height, row_offset, rows)
+        for c0, c1 in aligned_blocks(grid.width, col_offset, cols)
+    ]
+
+
+async def _prefetched(windows: List[Window], read):
+    """Yield (window, read(window) result), reading the next block while the caller works."""
+    pending = asyncio.ensure_future(read(windows[0])) if windows else None
+    for i, window in enumerate(windows):
+        result = await pending
+        pending = asyncio.ensure_future(read(windows[i + 1])) if i + 1 < len(windows) else None
+        try:
+            yield window, result
+        except BaseException:
+            if pending is not None:
+                pending.cancel()
+            raise
+
+
+@dataclass
+class OpticalResult:
+    valid_pixel_ratio: float
+    stats: Dict[str, float] = field(default_factory=dict)
+    uris: Dict[str, str] = field(default_factory=dict)
+    band_map: Optional[Dict[str, Dict[str, float]]] = None
+
+
+async def process_optical_blocks(
+    client,
+    s3,
+    assets: Dict[str, Optional[str]],
+    bands: List[str],
+    grid: AOIGrid,
+    header: Dict[str, Any],
+    prefix: str,
+    percentiles: Optional[Dict[str, Tuple[int, ...]]] = None,
+    block_size: Optional[int] = None,
+) -> OpticalResult:
+    """
+    Optical indices, their stats and index COGs for a grid, one block at a time.
+
+    Outputs are only uploaded when the AOI's valid pixel ratio reaches
+    settings.min_valid_pixel_ratio (otherwise the result has no uris/stats).
+    """
+    percentiles = percentiles or {}
+    windows = grid_blocks(grid, header, block_size)
+    # Range reads: "download" ingestion would fetch whole assets once per block
+    ingestion_mode = "windowed"
+
+    async def read(window: Window):
+        sub = grid.subgrid(window)
+        stack, _ = await read_band_stack(
+            client, assets, bands, sub, ingestion_mode, required=('red', 'nir')
+        )
+        invalid = ~sub.inside_mask()
+        aoi_pixels = invalid.size - int(invalid.sum())
+        if assets.get('scl'):
+            try:
+                invalid |= await read_cloud_mask(client, assets['scl'], sub, ingestion_mode)
+            except Exception as e:
+                logger.error("band_read_failed", band='scl', error=str(e))
+        return stack, invalid, aoi_pixels
+
+    profile = grid.profile()
+    # Positions in every block's stack are the same (bands with an asset, in
+    # order); a band whose read fails in one block is NaN there
+    band_index = {b: i for i, b in enumerate(b for b in bands if assets.get(b))}
+    names = available_indices(band_index)
+    accumulators = {name: StatsAccumulator(value_range=value_range_for(name)) for name in names}
+    multiband = settings.index_output_mode == "multiband"
+    writer_cls = BlockIndexStackWriter if multiband else BlockRasterWriter
+    aoi_pixels = valid_pixels = 0
+
+    def compute(window: Window, stack: np.ndarray, invalid: np.ndarray) -> int:
+        stack[:, invalid] = np.nan
+        valid = int((~(np.isnan(stack[band_index['red']]) | np.isnan(stack[band_index['nir']]))).sum())
+        indices = compute_indices(stack, band_index, names)
+        for name in names:
+            accumulators[name].update(indices[name])
+        writer.write(window, indices)
+        return valid
+
+    with writer_cls(names, profile) as writer:
+        async for window, (stack, invalid, block_aoi_pixels) in _prefetched(windows, read):
+            aoi_pixels += block_aoi_pixels
+            valid_pixels += await asyncio.to_thread(compute, window, stack, invalid)
+            del stack, invalid
+
+        valid_pixel_ratio = valid_pixels / aoi_pixels if aoi_pixels > 0 else 0
+        logger.info("out_of_core_blocks_done", blocks=len(windows), valid_pixel_ratio=valid_pixel_ratio)
+        if valid_pixel_ratio < settings.min_valid_pixel_ratio:
+            return OpticalResult(valid_pixel_ratio)
+
+        result = OpticalResult(valid_pixel_ratio)
+        for name in names:
+            result.stats.update(accumulators[name].result(name, percentiles=percentiles.get(name, ())))
+        if multiband:
+            result.uris['indices'], result.band_map = await asyncio.to_thread(
+                writer.upload, s3, prefix + "indices.tif"
+            )
+        else:
+            result.uris.update(await asyncio.to_thread(
+                writer.upload, s3, {name: prefix + f"{name}.tif" for name in names}
+            ))
+        return result
+
+
+# Output name -> S3 file name of the radar products (as in PROCESS_WEEK)
+RADAR_OUTPUTS = {"rvi": "rvi.tif", "ratio": "radar_ratio.tif", "vv": "vv.tif", "vh": "vh.tif"}
+
+
+async def process_radar_blocks(
+    client,
+    s3,
+    assets: Dict[str, str],
+    aoi_geom: Dict[str, Any],
+    prefix: str,
+    block_size: Optional[int] = None,
+) -> Tuple[Dict[str, str], Dict[str, float]]:
+    """
+    RVI / VH:VV ratio stats and the radar rasters for an AOI, one block at a time.
+
+    Returns:
+        ({output name: S3 URI}, stats)
+    """
+    header = await asyncio.to_thread(client.read_header, assets['vv'])
+    grid = AOIGrid.from_header(header, aoi_geom)
+    windows = grid_blocks(grid, header, block_size)
+
+    async def read(window: Window):
+        sub = grid.subgrid(window)
+        vv, vh = await asyncio.gather(
+            read_grid_band(client, assets['vv'], sub, "windowed"),
+            read_grid_band(client, assets['vh'], sub, "windowed"),
+        )
+        return vv, vh, ~sub.inside_mask()
+
+    accumulators = {name: StatsAccumulator(value_range=value_range_for(name)) for name in ("rvi", "ratio")}
+
+    async def compute(window: Window, vv: np.ndarray, vh: np.ndarray, outside: np.ndarray):
+        vv = vv.astype(np.float32)
+        vh = vh.astype(np.float32)
+        vv[outside] = np.nan
+        vh[outside] = np.nan
+        rvi = await client.calculate_rvi(vv, vh)
+        ratio = await client.calculate_radar_ratio(vv, vh)
+        accumulators["rvi"].update(rvi)
+        accumulators["ratio"].update(ratio)
+        writer.write(window, {"rvi": rvi, "ratio": ratio, "vv": vv, "vh": vh})
+
+    with BlockRasterWriter(RADAR_OUTPUTS, grid.profile()) as writer:
+        async for window, (vv, vh, outside) in _prefetched(windows, read):
+            await compute(window, vv, vh, outside)
+            del vv, vh, outside
+        uris = await asyncio.to_thread(
+            writer.upload, s3, {name: prefix + filename for name, filename in RADAR_OUTPUTS.items()}
+        )
+
+    stats = {}
+    stats.update(accumulators["rvi"].result("rvi"))
+    stats.update(accumulators["ratio"].result("ratio"))
+    return uris, stats
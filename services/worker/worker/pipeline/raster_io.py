@@ -0,0 +1,317 @@
+"""
+In-memory raster output.
+
+Derived rasters (indices, radar products, DEM derivatives) are encoded as
+tiled, deflate-compressed GeoTIFFs in a rasterio MemoryFile and uploaded to
+S3 straight from the buffer. Rasters larger than
+settings.in_memory_raster_max_mb spill to a temporary file instead, so one
+very large AOI cannot hold an encoded copy of every output in memory.
+upload_rasters() encodes several outputs one after another while the
+previous ones upload on the shared S3 I/O pool (shared/aws_clients.py).
+
+With settings.index_output_mode == "multiband" all indices of an AOI-week go
+into one COG instead: one int16 band per index with a per-band scale/offset
+(value = raw * scale + offset), a nodata value and internal overviews.
+
+Out-of-core jobs (pipeline/out_of_core.py) can't hold a whole output in
+memory; BlockRasterWriter and BlockIndexStackWriter write the same outputs
+window by window to local files and upload those.
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+import structlog
+from rasterio.io import MemoryFile
+from rasterio.windows import Window
+
+from worker.config import settings
+from worker.metrics import stage
+from worker.pipeline.zonal_stats import value_range_for
+from worker.shared.aws_clients import submit_io
+
+logger = structlog.get_logger()
+
+# Multi-band index COG encoding
+QUANTIZED_NODATA = -32768
+QUANTIZED_MAX = 32767
+
+
+def cog_profile(profile: dict, count: int = 1) -> dict:
+    """Output profile for float32 COGs derived from a source band profile."""
+    out = profile.copy()
+    out.update({
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": count,
+        "compress": "deflate",
+        "predictor": 2,
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256,
+    })
+    return out
+
+
+def encode_cog(data: np.ndarray, profile: dict) -> bytes:
+    """Encode a 2D array as COG bytes without touching disk."""
+    with MemoryFile() as memfile:
+        with memfile.open(**cog_profile(profile)) as dst:
+            dst.write(data.astype("float32", copy=False), 1)
+        return memfile.read()
+
+
+def _encode_raster(data: np.ndarray, profile: dict, s3_key: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """(COG bytes, None), or (None, temp file path) for rasters spilled to disk."""
+    if data.nbytes <= settings.in_memory_raster_max_mb * 1024 * 1024:
+        with stage("encode"):
+            return encode_cog(data, profile), None
+
+    logger.info("raster_spilled_to_disk", s3_key=s3_key, size_bytes=data.nbytes)
+    fd, path = tempfile.mkstemp(suffix=".tif")
+    os.close(fd)
+    try:
+        with stage("encode"):
+            with rasterio.open(path, "w", **cog_profile(profile)) as dst:
+                dst.write(data.astype("float32", copy=False), 1)
+    except BaseException:
+        os.remove(path)
+        raise
+    return None, path
+
+
+def _upload_encoded(s3, encoded: Tuple[Optional[bytes], Optional[str]], s3_key: str) -> str:
+    body, path = encoded
+    with stage("upload"):
+        if path is None:
+            return s3.upload_bytes(body, s3_key)
+        try:
+            return s3.upload_file(path, s3_key)
+        finally:
+            os.remove(path)
+
+
+def upload_raster(s3, data: np.ndarray, profile: dict, s3_key: str) -> str:
+    """
+    Encode data as a COG and upload it to s3_key.
+
+    Returns:
+        S3 URI of the uploaded object
+    """
+    return _upload_encoded(s3, _encode_raster(data, profile, s3_key), s3_key)
+
+
+def upload_rasters(s3, rasters: Iterable[Tuple[str, np.ndarray, dict, str]]) -> Dict[str, str]:
+    """
+    upload_raster() for several (name, data, profile, s3_key) outputs. Each
+    is encoded in the calling thread while the ones before it upload on the
+    S3 I/O pool; at most settings.s3_job_upload_concurrency encoded outputs
+    are waiting or uploading at a time.
+
+    Returns:
+        {name: S3 URI}, in input order
+    """
+    limit = max(1, settings.s3_job_upload_concurrency)
+    futures: Dict[str, Future] = {}
+    try:
+        for name, data, profile, s3_key in rasters:
+            while sum(not f.done() for f in futures.values()) >= limit:
+                wait([f for f in futures.values() if not f.done()], return_when=FIRST_COMPLETED)
+            for future in futures.values():
+                if future.done():
+                    future.result()  # fail fast
+            futures[name] = submit_io(_upload_encoded, s3, _encode_raster(data, profile, s3_key), s3_key)
+        return {name: future.result() for name, future in futures.items()}
+    finally:
+        # Never leave uploads (and their temp files) behind on errors
+        wait(list(futures.values()))
+
+
+def quantization_for(name: str) -> Tuple[float, float]:
+    """
+    (scale, offset) mapping an index to int16. Covers twice the index's
+    histogram range (pipeline/zonal_stats.py) so ordinary outliers are kept;
+    values beyond it are clipped.
+    """
+    lo, hi = value_range_for(name)
+    return (hi - lo) / QUANTIZED_MAX, (lo + hi) / 2
+
+
+def quantize(data: np.ndarray, scale: float, offset: float) -> np.ndarray:
+    """float -> int16 (NaN -> QUANTIZED_NODATA)."""
+    raw = np.rint((data - offset) / scale)
+    np.clip(raw, -QUANTIZED_MAX, QUANTIZED_MAX, out=raw)
+    raw[np.isnan(raw)] = QUANTIZED_NODATA
+    return raw.astype(np.int16)
+
+
+def multiband_cog_profile(profile: dict, count: int) -> dict:
+    """Output profile for the quantized multi-band index COG."""
+    out = {k: v for k, v in profile.items() if k not in ("blockxsize", "blockysize", "tiled", "interleave")}
+    out.update({
+        "driver": "COG",
+        "dtype": "int16",
+        "count": count,
+        "nodata": QUANTIZED_NODATA,
+        "compress": "deflate",
+        "predictor": 2,
+        "blocksize": 256,
+        "overview_resampling": "average",
+    })
+    return out
+
+
+def _write_index_bands(dst, indices: Dict[str, np.ndarray]) -> Dict[str, Dict[str, float]]:
+    band_map = {}
+    scales, offsets = [], []
+    for i, (name, data) in enumerate(indices.items(), start=1):
+        scale, offset = quantization_for(name)
+        dst.write(quantize(data, scale, offset), i)
+        scales.append(scale)
+        offsets.append(offset)
+        band_map[name] = {"band": i, "scale": scale, "offset": offset}
+    dst.scales = scales
+    dst.offsets = offsets
+    dst.descriptions = tuple(indices)
+    return band_map
+
+
+def encode_index_cog(indices: Dict[str, np.ndarray], profile: dict) -> Tuple[bytes, Dict[str, Dict[str, float]]]:
+    """
+    Encode several 2D index arrays as one quantized multi-band COG in memory.
+
+    Returns:
+        (COG bytes, {index name: {"band": 1-based band, "scale": .., "offset": ..}})
+    """
+    with MemoryFile() as memfile:
+        with memfile.open(**multiband_cog_profile(profile, len(indices))) as dst:
+            band_map = _write_index_bands(dst, indices)
+        return memfile.read(), band_map
+
+
+def upload_index_stack(
+    s3,
+    indices: Dict[str, np.ndarray],
+    profile: dict,
+    s3_key: str,
+) -> Tuple[str, Dict[str, Dict[str, float]]]:
+    """
+    Encode indices as one multi-band COG and upload it to s3_key.
+
+    Returns:
+        (S3 URI, band map - see encode_index_cog)
+    """
+    encoded_bytes = sum(data.size for data in indices.values()) * np.dtype(np.int16).itemsize
+    if encoded_bytes <= settings.in_memory_raster_max_mb * 1024 * 1024:
+        with stage("encode"):
+            body, band_map = encode_index_cog(indices, profile)
+        with stage("upload"):
+            return s3.upload_bytes(body, s3_key), band_map
+
+    logger.info("raster_spilled_to_disk", s3_key=s3_key, size_bytes=encoded_bytes)
+    fd, path = tempfile.mkstemp(suffix=".tif")
+    os.close(fd)
+    try:
+        with stage("encode"):
+            with rasterio.open(path, "w", **multiband_cog_profile(profile, len(indices))) as dst:
+                band_map = _write_index_bands(dst, indices)
+        with stage("upload"):
+            return s3.upload_file(path, s3_key), band_map
+    finally:
+        os.remove(path)
+
+
+class BlockRasterWriter:
+    """
+    float32 rasters (same output format as upload_raster) written window by
+    window to local files, one per name, then uploaded.
+    """
+
+    def __init__(self, names: Iterable[str], profile: dict):
+        self._dir = tempfile.mkdtemp(prefix="blocks-")
+        self.paths = {name: os.path.join(self._dir, f"{name}.tif") for name in names}
+        self._datasets = {name: rasterio.open(path, "w", **cog_profile(profile)) for name, path in self.paths.items()}
+
+    def __enter__(self) -> "BlockRasterWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, window: Window, arrays: Dict[str, np.ndarray]):
+        for name, data in arrays.items():
+            self._datasets[name].write(data.astype("float32", copy=False), 1, window=window)
+
+    def _finish(self):
+        for dst in self._datasets.values():
+            dst.close()
+        self._datasets = {}
+
+    def upload(self, s3, keys: Dict[str, str]) -> Dict[str, str]:
+        """Upload each raster (concurrently) to keys[name]; returns {name: S3 URI}."""
+        self._finish()
+        futures = {name: submit_io(_upload_encoded, s3, (None, self.paths[name]), key) for name, key in keys.items()}
+        try:
+            return {name: future.result() for name, future in futures.items()}
+        finally:
+            wait(list(futures.values()))
+
+    def close(self):
+        self._finish()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class BlockIndexStackWriter:
+    """
+    The quantized multi-band index COG (see upload_index_stack) written
+    window by window: blocks go into a tiled int16 GeoTIFF, which is copied to
+    a COG (adding overviews) on upload.
+    """
+
+    def __init__(self, names: Iterable[str], profile: dict):
+        self.names = list(names)
+        self._dir = tempfile.mkdtemp(prefix="blocks-")
+        self._path = os.path.join(self._dir, "indices-blocks.tif")
+        self._quantization = {name: quantization_for(name) for name in self.names}
+        cog = multiband_cog_profile(profile, len(self.names))
+        self._cog_options = {
+            k: cog[k] for k in ("compress", "predictor", "blocksize", "overview_resampling")
+        }
+        tiled = {k: v for k, v in cog.items() if k not in ("blocksize", "overview_resampling")}
+        tiled.update({"driver": "GTiff", "tiled": True, "blockxsize": 256, "blockysize": 256})
+        self._dst = rasterio.open(self._path, "w", **tiled)
+        self._dst.scales = [self._quantization[n][0] for n in self.names]
+        self._dst.offsets = [self._quantization[n][1] for n in self.names]
+        self._dst.descriptions = tuple(self.names)
+
+    def __enter__(self) -> "BlockIndexStackWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, window: Window, indices: Dict[str, np.ndarray]):
+        for i, name in enumerate(self.names, start=1):
+            self._dst.write(quantize(indices[name], *self._quantization[name]), i, window=window)
+
+    def upload(self, s3, s3_key: str) -> Tuple[str, Dict[str, Dict[str, float]]]:
+        """Convert to a COG and upload it; returns (S3 URI, band map)."""
+        self._dst.close()
+        cog_path = os.path.join(self._dir, "indices.tif")
+        with stage("encode"):
+            rasterio.shutil.copy(self._path, cog_path, driver="COG", **self._cog_options)
+        band_map = {
+            name: {"band": i, "scale": self._quantization[name][0], "offset": self._quantization[name][1]}
+            for i, name in enumerate(self.names, start=1)
+        }
+        with stage("upload"):
+            return s3.upload_file(cog_path, s3_key), band_map
+
+    def close(self):
+        self._dst.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
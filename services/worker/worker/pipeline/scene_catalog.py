@@ -0,0 +1,225 @@
+"""
+Local STAC scene catalog (PostGIS).
+
+The stac_scenes table mirrors the STAC items the pipelines use (footprint,
+datetime, cloud cover, asset hrefs). It is filled incrementally by the
+SYNC_SCENE_CATALOG job; stac_catalog_sync records which time range and
+extent have been synced per collection.
+
+find_scenes() answers "which scenes cover this AOI in this date range" with
+one GIST-indexed query when the catalog covers the request, and falls back
+to a live STAC search otherwise. Results have the same shape as
+STACClient.search_scenes().
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from worker.config import settings
+
+logger = structlog.get_logger()
+
+
+def catalog_covers(
+    db: Session,
+    collection: str,
+    aoi_geom: Dict[str, Any],
+    start_date: datetime,
+    end_date: datetime,
+) -> bool:
+    """True when the synced range/extent of a collection covers the request."""
+    row = db.execute(
+        text("""
+            SELECT 1
+            FROM stac_catalog_sync
+            WHERE collection = :collection
+              AND synced_from <= :start_date
+              AND synced_through >= :end_date
+              AND ST_Covers(extent, ST_SetSRID(ST_GeomFromGeoJSON(:aoi), 4326))
+        """),
+        {
+            "collection": collection,
+            "start_date": start_date,
+            "end_date": end_date,
+            "aoi": json.dumps(aoi_geom),
+        },
+    ).fetchone()
+    return row is not None
+
+
+def query_scenes(
+    db: Session,
+    collection: str,
+    aoi_geom: Dict[str, Any],
+    start_date: datetime,
+    end_date: datetime,
+    max_cloud_cover: float = 100,
+) -> List[Dict[str, Any]]:
+    """
+    Scenes from the local catalog whose footprint intersects the AOI, newest
+    first like the live STAC search.
+    """
+    rows = db.execute(
+        text("""
+            SELECT scene_id, collection, datetime, cloud_cover, platform, assets,
+                   bbox, self_href, ST_AsGeoJSON(footprint) AS footprint
+            FROM stac_scenes
+            WHERE collection = :collection
+              AND datetime BETWEEN :start_date AND :end_date
+              AND cloud_cover < :max_cloud_cover
+              AND ST_Intersects(footprint, ST_SetSRID(ST_GeomFromGeoJSON(:aoi), 4326))
+            ORDER BY datetime DESC
+        """),
+        {
+            "collection": collection,
+            "start_date": start_date,
+            "end_date": end_date,
+            "max_cloud_cover": max_cloud_cover,
+            "aoi": json.dumps(aoi_geom),
+        },
+    ).fetchall()
+
+    return [
+        {
+            "id": row.scene_id,
+            "collection": row.collection,
+            "datetime": row.datetime.isoformat(),
+            "cloud_cover": row.cloud_cover,
+            "platform": row.platform,
+            "assets": row.assets,
+            "bbox": list(row.bbox) if row.bbox else None,
+            "geometry": json.loads(row.footprint),
+            "self_href": row.self_href,
+        }
+        for row in rows
+    ]
+
+
+async def find_scenes(
+    db: Session,
+    client,
+    aoi_geom: Dict[str, Any],
+    start_date: datetime,
+    end_date: datetime,
+    max_cloud_cover: float = 100,
+    collection: str = "sentinel-2-l2a",
+) -> List[Dict[str, Any]]:
+    """
+    Scenes of a collection intersecting the AOI in [start_date, end_date].
+
+    Uses the local catalog when it covers the request, otherwise the live
+    STAC API (client.search_scenes).
+    """
+    if settings.scene_catalog_enabled:
+        try:
+            if catalog_covers(db, collection, aoi_geom, start_date, end_date):
+                scenes = query_scenes(db, collection, aoi_geom, start_date, end_date, max_cloud_cover)
+                logger.info(
+                    "scene_catalog_hit",
+                    collection=collection,
+                    start_date=str(start_date),
+                    end_date=str(end_date),
+                    scenes_found=len(scenes),
+                )
+                return scenes
+        except Exception as e:
+            # Catalog tables missing or DB hiccup: the live search still works
+            logger.warning("scene_catalog_query_failed", error=str(e))
+            db.rollback()
+
+    logger.info("scene_catalog_miss", collection=collection, start_date=str(start_date), end_date=str(end_date))
+    return await client.search_scenes(
+        aoi_geom, start_date, end_date, max_cloud_cover, collections=[collection]
+    )
+
+
+def upsert_scenes(db: Session, scenes: Iterable[Dict[str, Any]]) -> int:
+    """Insert or refresh scenes in the catalog. Returns the number written."""
+    sql = text("""
+        INSERT INTO stac_scenes
+            (collection, scene_id, datetime, cloud_cover, platform, footprint,
+             bbox, assets, self_href, synced_at)
+        VALUES
+            (:collection, :scene_id, :datetime, :cloud_cover, :platform,
+             ST_SetSRID(ST_GeomFromGeoJSON(:footprint), 4326),
+             :bbox, CAST(:assets AS jsonb), :self_href, NOW())
+        ON CONFLICT (collection, scene_id) DO UPDATE SET
+            datetime = EXCLUDED.datetime,
+            cloud_cover = EXCLUDED.cloud_cover,
+            platform = EXCLUDED.platform,
+            footprint = EXCLUDED.footprint,
+            bbox = EXCLUDED.bbox,
+            assets = EXCLUDED.assets,
+            self_href = EXCLUDED.self_href,
+            synced_at = NOW()
+    """)
+    params = [
+        {
+            "collection": scene["collection"],
+            "scene_id": scene["id"],
+            "datetime": scene["datetime"],
+            "cloud_cover": scene.get("cloud_cover") or 0,
+            "platform": scene.get("platform"),
+            "footprint": json.dumps(scene["geometry"]),
+            "bbox": scene.get("bbox"),
+            "assets": json.dumps(scene["assets"]),
+            "self_href": scene.get("self_href"),
+        }
+        for scene in scenes
+    ]
+    if params:
+        db.execute(sql, params)
+        db.commit()
+    return len(params)
+
+
+def get_sync_state(db: Session, collection: str) -> Optional[Dict[str, Any]]:
+    row = db.execute(
+        text("""
+            SELECT synced_from, synced_through, scene_count
+            FROM stac_catalog_sync
+            WHERE collection = :collection
+        """),
+        {"collection": collection},
+    ).fetchone()
+    return dict(row._mapping) if row else None
+
+
+def save_sync_state(
+    db: Session,
+    collection: str,
+    bbox: List[float],
+    synced_from: datetime,
+    synced_through: datetime,
+    added: int,
+):
+    db.execute(
+        text("""
+            INSERT INTO stac_catalog_sync
+                (collection, extent, synced_from, synced_through, scene_count, updated_at)
+            VALUES
+                (:collection, ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326),
+                 :synced_from, :synced_through, :added, NOW())
+            ON CONFLICT (collection) DO UPDATE SET
+                extent = EXCLUDED.extent,
+                synced_from = EXCLUDED.synced_from,
+                synced_through = EXCLUDED.synced_through,
+                scene_count = stac_catalog_sync.scene_count + :added,
+                updated_at = NOW()
+        """),
+        {
+            "collection": collection,
+            "minx": bbox[0],
+            "miny": bbox[1],
+            "maxx": bbox[2],
+            "maxy": bbox[3],
+            "synced_from": synced_from,
+            "synced_through": synced_through,
+            "added": added,
+        },
+    )
+    db.commit()
@@ -2,7 +2,7 @@
 Real STAC client for fetching satellite imagery and weather data.
 Integrates with Microsoft Planetary Computer and other STAC catalogs.
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import structlog
 from pystac_client import Client
@@ -11,17 +11,48 @@ from pystac_client.exceptions import APIError
 from shapely.geometry import shape, mapping
 import rasterio
 from rasterio.mask import mask
+from rasterio.errors import RasterioIOError
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, from_bounds
+from rasterio.enums import Resampling
+from rasterio.features import geometry_window
 import numpy as np
 import asyncio
+import os
 import requests
 import aiohttp
 from urllib3 import Retry
 from requests.exceptions import RequestException, Timeout as RequestsTimeout
 from tenacity import Retrying, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+from worker.config import settings
+from worker import metrics
+from worker.pipeline.asset_cache import get_asset_cache
+
 
 logger = structlog.get_logger()
 
+INGESTION_MODES = ("windowed", "download")
+
+# GDAL tuning for HTTP range reads against COGs: skip sidecar lookups,
+# read the header in one request and merge adjacent tile ranges.
+WINDOWED_READ_GDAL_ENV = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.TIF,.tiff",
+    "GDAL_INGESTED_BYTES_AT_OPEN": 32768,
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "VSI_CACHE": "TRUE",
+}
+
+
+def resolve_ingestion_mode(payload: Dict[str, Any]) -> str:
+    """Band ingestion mode for a job: payload["ingestion_mode"] or the worker default."""
+    mode = payload.get("ingestion_mode") or settings.band_ingestion_mode
+    if mode not in INGESTION_MODES:
+        raise ValueError(f"Unknown ingestion_mode '{mode}', expected one of {INGESTION_MODES}")
+    return mode
+
 
 class STACClient:
     """
@@ -136,52 +167,86 @@ class STACClient:
                        end_date=str(end_date),
                        collections=collections)
             
-            # Convert to simplified metadata
-            scenes = []
-            for item in items:
-                # Asset mapping based on collection
-                assets = {}
-                collection_id = item.collection_id
-                
-                if "sentinel-2" in collection_id:
-                    assets = {
-                        "red": item.assets.get("B04").href if "B04" in item.assets else None,
-                        "green": item.assets.get("B03").href if "B03" in item.assets else None,
-                        "blue": item.assets.get("B02").href if "B02" in item.assets else None,
-                        "nir": item.assets.get("B08").href if "B08" in item.assets else None,
-                        "swir": item.assets.get("B11").href if "B11" in item.assets else None,
-                        "swir2": item.assets.get("B12").href if "B12" in item.assets else None,
-                        "rededge": item.assets.get("B05").href if "B05" in item.assets else None,
-                        "scl": item.assets.get("SCL").href if "SCL" in item.assets else None,
-                    }
-                elif "copernicus-dem" in collection_id:
-                     assets = {
-                        "dem": item.assets.get("data").href if "data" in item.assets else None
-                     }
-
-                elif "sentinel-1" in collection_id:
-                    # Sentinel-1 RTC usually has 'vv' and 'vh'
-                    assets = {
-                        "vv": item.assets.get("vv").href if "vv" in item.assets else None,
-                        "vh": item.assets.get("vh").href if "vh" in item.assets else None,
-                    }
-                
-                scenes.append({
-                    "id": item.id,
-                    "datetime": item.datetime.isoformat(),
-                    "cloud_cover": item.properties.get("eo:cloud_cover", 0), # S1 usually 0 or null
-                    "platform": item.properties.get("platform", "unknown"),
-                    "assets": assets,
-                    "bbox": item.bbox,
-                    "geometry": mapping(shape(item.geometry))
-                })
-            
-            return scenes
+            return [self.item_to_scene(item) for item in items]
         
         except Exception as e:
             logger.error("stac_search_failed", exc_info=e)
             raise
 
+    @staticmethod
+    def item_to_scene(item) -> Dict[str, Any]:
+        """Convert a STAC item to the simplified scene metadata used by the jobs."""
+        # Asset mapping based on collection
+        assets = {}
+        collection_id = item.collection_id
+
+        if "sentinel-2" in collection_id:
+            assets = {
+                "red": item.assets.get("B04").href if "B04" in item.assets else None,
+                "green": item.assets.get("B03").href if "B03" in item.assets else None,
+                "blue": item.assets.get("B02").href if "B02" in item.assets else None,
+                "nir": item.assets.get("B08").href if "B08" in item.assets else None,
+                "swir": item.assets.get("B11").href if "B11" in item.assets else None,
+                "swir2": item.assets.get("B12").href if "B12" in item.assets else None,
+                "rededge": item.assets.get("B05").href if "B05" in item.assets else None,
+                "scl": item.assets.get("SCL").href if "SCL" in item.assets else None,
+            }
+        elif "copernicus-dem" in collection_id:
+             assets = {
+                "dem": item.assets.get("data").href if "data" in item.assets else None
+             }
+
+        elif "sentinel-1" in collection_id:
+            # Sentinel-1 RTC usually has 'vv' and 'vh'
+            assets = {
+                "vv": item.assets.get("vv").href if "vv" in item.assets else None,
+                "vh": item.assets.get("vh").href if "vh" in item.assets else None,
+            }
+
+        self_link = item.get_self_href() if hasattr(item, "get_self_href") else None
+
+        return {
+            "id": item.id,
+            "collection": collection_id,
+            "datetime": item.datetime.isoformat(),
+            "cloud_cover": item.properties.get("eo:cloud_cover", 0), # S1 usually 0 or null
+            "platform": item.properties.get("platform", "unknown"),
+            "assets": assets,
+            "bbox": item.bbox,
+            "geometry": mapping(shape(item.geometry)),
+            "self_href": self_link,
+        }
+
+    def iter_scenes(
+        self,
+        collection: str,
+        bbox: List[float],
+        start_date: datetime,
+        end_date: datetime,
+    ):
+        """
+        Yield every scene of a collection intersecting bbox in a date range
+        (no cloud filter, no item cap). Used by the scene catalog sync.
+        """
+        client = self._get_client()
+        retryer = Retrying(
+            stop=stop_after_attempt(4),
+            wait=wait_exponential(multiplier=1, min=1, max=15),
+            retry=retry_if_exception_type((APIError, RequestException, RequestsTimeout)),
+            reraise=True,
+        )
+        for attempt in retryer:
+            with attempt:
+                search = client.search(
+                    collections=[collection],
+                    bbox=list(bbox),
+                    datetime=f"{start_date.isoformat()}/{end_date.isoformat()}",
+                    limit=500,
+                )
+                items = list(search.items())
+        for item in items:
+            yield self.item_to_scene(item)
+
     async def fetch_weather_history(self, lat: float, lon: float, start_date: str, end_date: str) -> List[Dict]:
         """
         Fetch historical weather from Open-Meteo (ERA5 based).
@@ -226,11 +291,23 @@ class STACClient:
                 logger.info("open_meteo_response", days=len(results))
                 return results
 
-    
-    def _download_asset(self, href: str) -> str:
+
+    def _sign_href(self, href: str) -> str:
+        """Sign URL (Planetary Computer assets need SAS tokens)"""
+        import planetary_computer
+        try:
+            signed_href = planetary_computer.sign(href)
+            logger.info("signing_debug", original=href[:50], signed=True)
+        except Exception as e:
+            logger.warning("signing_failed_fallback", exc_info=e)
+            signed_href = href
+        return signed_href
+
+    def _download_asset(self, href: str, dest_path: Optional[str] = None) -> str:
         """
         Download asset using standard library urllib for maximum stability
         in containerized environments where requests/OpenSSL might hang.
+        Writes to dest_path when given, otherwise to a new temp file.
         """
         import urllib.request
         import tempfile
@@ -238,15 +315,8 @@ class STACClient:
         import time
         import random
         import socket
-        
-        # Sign URL (Planetary Computer assets need SAS tokens)
-        import planetary_computer
-        try:
-            signed_href = planetary_computer.sign(href)
-            logger.info("signing_debug", original=href[:50], signed=True)
-        except Exception as e:
-            logger.warning("signing_failed_fallback", exc_info=e)
-            signed_href = href
+
+        signed_href = self._sign_href(href)
 
         max_attempts = 5
         
@@ -257,8 +327,11 @@ class STACClient:
                 
                 logger.info("download_start_urllib", url=signed_href[:50], attempt=attempt+1)
                 
-                fd, temp_path = tempfile.mkstemp(suffix=".tif")
-                os.close(fd)
+                if dest_path:
+                    temp_path = dest_path
+                else:
+                    fd, temp_path = tempfile.mkstemp(suffix=".tif")
+                    os.close(fd)
                 
                 # Standard library download - simpler network stack
                 # Retries are handled by our loop, not the lib
@@ -281,64 +354,260 @@ class STACClient:
                     continue
                 raise e
 
-    async def download_and_clip_band(
-        self,
-        asset_href: str,
-        aoi_geom: Dict[str, Any],
-        output_path: str
-    ) -> np.ndarray:
+    def _clip_dataset(self, src, aoi_geom: Dict[str, Any]):
         """
-        Download and clip a raster band to AOI.
-        Uses local download first to avoid VSI conflicts.
+        Mask an open raster to the AOI, cropped to the AOI bounds.
+        With crop=True rasterio only reads the window covering the geometry.
         """
+        # Reproject AOI to match Raster CRS (crucial for Sentinel-2 UTM)
+        # aoi_geom is assumed to be EPSG:4326
+        aoi_projected = transform_geom("EPSG:4326", src.crs, aoi_geom)
+        out_image, out_transform = mask(src, [shape(aoi_projected)], crop=True)
+        metrics.count_read(out_image.nbytes)
+        out_meta = src.meta.copy()
+        return out_image, out_transform, out_meta
+
+    def _download_and_clip(self, asset_href: str, aoi_geom: Dict[str, Any]):
+        """Legacy ingestion: download the whole asset, then clip it locally."""
         import os
-        local_path = None
+        cache = get_asset_cache()
+        if cache:
+            local_path = cache.get_or_fill(
+                asset_href, lambda tmp_path: self._download_asset(asset_href, tmp_path)
+            )
+            with rasterio.open(local_path) as src:
+                return self._clip_dataset(src, aoi_geom)
+
+        local_path = self._download_asset(asset_href)
         try:
-            # 1. Download to temp file
-            local_path = await asyncio.to_thread(self._download_asset, asset_href)
-            
-            # 2. Open local raster and clip
             with rasterio.open(local_path) as src:
-                # Reproject AOI to match Raster CRS (crucial for Sentinel-2 UTM)
-                from rasterio.warp import transform_geom
-                
-                # Again, assume EPSG:4326 for aoi_geom
-                aoi_projected = transform_geom("EPSG:4326", src.crs, aoi_geom)
-                
-                geom = [shape(aoi_projected)]
-                out_image, out_transform = mask(src, geom, crop=True)
-                out_meta = src.meta.copy()
-                
-                # Update metadata
-                out_meta.update({
-                    "driver": "GTiff",
-                    "height": out_image.shape[1],
-                    "width": out_image.shape[2],
-                    "transform": out_transform
-                })
-                
-                # Save clipped raster
-                with rasterio.open(output_path, "w", **out_meta) as dest:
-                    dest.write(out_image)
-                
-                logger.info("band_clipped", output=output_path)
-                
-                return out_image[0]  # Return first band
-                
-        except Exception as e:
-            logger.error("band_clip_failed", asset=asset_href, exc_info=e)
-            raise
+                return self._clip_dataset(src, aoi_geom)
         finally:
-            # 3. Cleanup temp file
-            if local_path and os.path.exists(local_path):
+            if os.path.exists(local_path):
                 try:
                     os.remove(local_path)
-                except:
+                except OSError:
                     pass
 
+    @staticmethod
+    def _snap_to_blocks(src, window: Window) -> Window:
+        """
+        Expand a window to the COG internal tile grid. These are the tiles a
+        range read transfers anyway, and aligning cache keys lets nearby AOIs
+        share cached windows.
+        """
+        block_h, block_w = src.block_shapes[0]
+        row_off = max(0, int(np.floor(window.row_off)))
+        col_off = max(0, int(np.floor(window.col_off)))
+        row_start = (row_off // block_h) * block_h
+        col_start = (col_off // block_w) * block_w
+        row_stop = min(src.height, -(-int(np.ceil(window.row_off + window.height)) // block_h) * block_h)
+        col_stop = min(src.width, -(-int(np.ceil(window.col_off + window.width)) // block_w) * block_w)
+        return Window(col_start, row_start, max(0, col_stop - col_start), max(0, row_stop - row_start))
+
+    @classmethod
+    def _block_aligned_window(cls, src, aoi_geom: Dict[str, Any]) -> Window:
+        """Block-aligned window covering the AOI."""
+        aoi_projected = transform_geom("EPSG:4326", src.crs, aoi_geom)
+        window = geometry_window(src, [shape(aoi_projected)], pad_x=0.5, pad_y=0.5)
+        return cls._snap_to_blocks(src, window)
+
+    @staticmethod
+    def _write_window(src, window: Window, output_path: str):
+        """Copy one window of an open raster to a local tiled GeoTIFF."""
+        profile = src.profile.copy()
+        profile.update({
+            "driver": "GTiff",
+            "height": int(window.height),
+            "width": int(window.width),
+            "transform": src.window_transform(window),
+            "tiled": True,
+            "blockxsize": 256,
+            "blockysize": 256,
+            "compress": "deflate",
+        })
+        with rasterio.open(output_path, "w", **profile) as dst:
+            dst.write(src.read(window=window))
+
+    def _cached_window(self, asset_href: str, src, window: Window) -> str:
+        """Local path of a block-aligned window of an open remote asset, via the asset cache."""
+        byte_range = f"window={window.col_off},{window.row_off},{window.width},{window.height}"
+        return get_asset_cache().get_or_fill(
+            asset_href,
+            lambda tmp_path: self._write_window(src, window, tmp_path),
+            byte_range=byte_range,
+        )
 
+    def _windowed_clip(self, asset_href: str, aoi_geom: Dict[str, Any]):
+        """
+        Windowed ingestion: open the remote COG over HTTP and range-read only
+        the internal tiles that overlap the reprojected AOI bounds.
+        """
+        signed_href = self._sign_href(asset_href)
+        for attempt in self._range_read_retryer():
+            with attempt:
+                with rasterio.Env(**WINDOWED_READ_GDAL_ENV):
+                    with rasterio.open(signed_href) as src:
+                        if not get_asset_cache():
+                            return self._clip_dataset(src, aoi_geom)
+                        window = self._block_aligned_window(src, aoi_geom)
+                        local_path = self._cached_window(asset_href, src, window)
+
+        with rasterio.open(local_path) as local_src:
+            return self._clip_dataset(local_src, aoi_geom)
+
+    @staticmethod
+    def _range_read_retryer() -> Retrying:
+        return Retrying(
+            stop=stop_after_attempt(4),
+            wait=wait_exponential(multiplier=1, min=1, max=15),
+            retry=retry_if_exception_type(RasterioIOError),
+            reraise=True,
+        )
+
+    def read_header(self, asset_href: str) -> Dict[str, Any]:
+        """Read only the header of a remote COG: CRS, transform, size and internal tile shape."""
+        signed_href = self._sign_href(asset_href)
+        for attempt in self._range_read_retryer():
+            with attempt:
+                with rasterio.Env(**WINDOWED_READ_GDAL_ENV):
+                    with rasterio.open(signed_href) as src:
+                        return {
+                            "crs": src.crs,
+                            "transform": src.transform,
+                            "width": src.width,
+                            "height": src.height,
+                            "block_shape": src.block_shapes[0],
+                        }
+
+    @staticmethod
+    def _read_onto_grid(src, bounds: tuple, out_shape: tuple, resampling: Resampling) -> np.ndarray:
+        window = from_bounds(*bounds, transform=src.transform)
+        data = src.read(
+            1,
+            window=window,
+            out_shape=out_shape,
+            resampling=resampling,
+            boundless=True,
+            fill_value=0,
+        )
+        metrics.count_read(data.nbytes)
+        return data
+
+    def read_overview(self, asset_href: str, bounds: tuple, out_shape: tuple) -> np.ndarray:
+        """
+        Coarse read of the first band over bounds onto out_shape. GDAL serves
+        decimated reads from the COG overviews, so only a few small tiles are
+        fetched. Always a remote range read (never cached or downloaded).
+        """
+        signed_href = self._sign_href(asset_href)
+        for attempt in self._range_read_retryer():
+            with attempt:
+                with rasterio.Env(**WINDOWED_READ_GDAL_ENV):
+                    with rasterio.open(signed_href) as src:
+                        return self._read_onto_grid(src, bounds, out_shape, Resampling.nearest)
+
+    def read_grid_window(
+        self,
+        asset_href: str,
+        bounds: tuple,
+        out_shape: tuple,
+        resampling: Resampling = Resampling.nearest,
+        ingestion_mode: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Read the first band over bounds (in the asset CRS) onto an out_shape
+        grid. Coarser bands (e.g. 20m SCL) are resampled onto the target grid
+        in the same read; areas outside the asset read as 0.
+
+        In "windowed" mode only the tiles overlapping bounds are range-read
+        (through the asset cache when enabled); "download" mode reads from a
+        full local copy of the asset.
+        """
+        mode = ingestion_mode or settings.band_ingestion_mode
+        cache = get_asset_cache()
+
+        if mode == "download":
+            if cache:
+                local_path = cache.get_or_fill(
+                    asset_href, lambda tmp_path: self._download_asset(asset_href, tmp_path)
+                )
+                with rasterio.open(local_path) as src:
+                    return self._read_onto_grid(src, bounds, out_shape, resampling)
+            local_path = self._download_asset(asset_href)
+            try:
+                with rasterio.open(local_path) as src:
+                    return self._read_onto_grid(src, bounds, out_shape, resampling)
+            finally:
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+
+        signed_href = self._sign_href(asset_href)
+        for attempt in self._range_read_retryer():
+            with attempt:
+                with rasterio.Env(**WINDOWED_READ_GDAL_ENV):
+                    with rasterio.open(signed_href) as src:
+                        if not cache:
+                            return self._read_onto_grid(src, bounds, out_shape, resampling)
+                        window = self._snap_to_blocks(src, from_bounds(*bounds, transform=src.transform))
+                        if window.width == 0 or window.height == 0:
+                            return self._read_onto_grid(src, bounds, out_shape, resampling)
+                        local_path = self._cached_window(asset_href, src, window)
+
+        with rasterio.open(local_path) as local_src:
+            return self._read_onto_grid(local_src, bounds, out_shape, resampling)
+
+    async def clip_band(
+        self,
+        asset_href: str,
+        aoi_geom: Dict[str, Any],
+        ingestion_mode: Optional[str] = None,
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Fetch a raster band clipped to the AOI, kept in memory.
+
+        ingestion_mode selects how the asset is read (see resolve_ingestion_mode):
+        "windowed" range-reads only the AOI window, "download" fetches the whole
+        asset to a temp file first. Defaults to settings.band_ingestion_mode.
+
+        Returns:
+            (first band as a 2D array, GeoTIFF profile of the clipped band)
+        """
+        mode = ingestion_mode or settings.band_ingestion_mode
+        try:
+            if mode == "windowed":
+                clip = self._windowed_clip
+            else:
+                clip = self._download_and_clip
+            out_image, out_transform, out_meta = await asyncio.to_thread(clip, asset_href, aoi_geom)
+
+            out_meta.update({
+                "driver": "GTiff",
+                "height": out_image.shape[1],
+                "width": out_image.shape[2],
+                "transform": out_transform
+            })
+            logger.info("band_clipped", asset=asset_href[:80], ingestion_mode=mode)
+
+            return out_image[0], out_meta
+
+        except Exception as e:
+            logger.error("band_clip_failed", asset=asset_href, ingestion_mode=mode, exc_info=e)
+            raise
+
+    async def download_and_clip_band(
+        self,
+        asset_href: str,
+        aoi_geom: Dict[str, Any],
+        output_path: str,
+        ingestion_mode: Optional[str] = None,
+    ) -> np.ndarray:
+        """Fetch a raster band clipped to the AOI and save it to output_path."""
+        band, profile = await self.clip_band(asset_href, aoi_geom, ingestion_mode)
+        with rasterio.open(output_path, "w", **profile) as dest:
+            dest.write(band, 1)
+        return band
 
-    
     async def calculate_ndvi(self, red: np.ndarray, nir: np.ndarray) -> np.ndarray:
         """Calculate NDVI = (NIR - Red) / (NIR + Red)"""
         denom = nir + red
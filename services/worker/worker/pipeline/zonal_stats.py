@@ -0,0 +1,186 @@
+"""
+Streaming zonal statistics.
+
+StatsAccumulator computes count, mean, std, min, max and percentiles in a
+single pass without copying or sorting the valid pixels:
+
+- count / sum / sum of squares are accumulated per zone (values are shifted
+  to the centre of the expected range to keep the variance well conditioned)
+- percentiles come from a fixed-bin histogram over the expected value range;
+  with the default 2048 bins over [-1, 1] they are accurate to ~0.001, and
+  values outside the range are counted in the edge bins (min/max stay exact)
+- accumulators are mergeable, so partial results from row blocks, read
+  windows, scenes or AOI sub-zones combine into the same final statistics
+
+Zones follow the rasterized label convention used by the scene pipeline:
+labels 1..n_zones are zones, 0 is background. Without labels every value
+belongs to zone 1.
+"""
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_BINS = 2048
+
+# Elements processed per chunk in update(); bounds the temporaries
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Expected value ranges used for the percentile histograms. Ratio indices
+# are unbounded; values beyond the range fall into the edge bins.
+VALUE_RANGES: Dict[str, Tuple[float, float]] = {
+    "reci": (-1.0, 15.0),
+    "ari": (-0.05, 0.05),
+    "cri": (-0.05, 0.05),
+    "msi": (0.0, 5.0),
+    "ratio": (0.0, 2.0),
+    "rvi": (0.0, 1.0),
+    "anomaly": (-1.6, 0.4),
+}
+DEFAULT_VALUE_RANGE = (-1.0, 1.0)
+
+
+def value_range_for(name: str) -> Tuple[float, float]:
+    """Histogram range for an index / band name."""
+    return VALUE_RANGES.get(name, DEFAULT_VALUE_RANGE)
+
+
+class StatsAccumulator:
+    """Mergeable single-pass statistics for one or more zones."""
+
+    def __init__(
+        self,
+        n_zones: int = 1,
+        value_range: Tuple[float, float] = DEFAULT_VALUE_RANGE,
+        bins: int = DEFAULT_BINS,
+    ):
+        lo, hi = value_range
+        if hi <= lo:
+            raise ValueError(f"Invalid value range: {value_range}")
+        self.n_zones = n_zones
+        self.value_range = (float(lo), float(hi))
+        self.bins = bins
+        self._shift = (lo + hi) / 2
+        self._scale = bins / (hi - lo)
+
+        size = n_zones + 1
+        self.pixels = np.zeros(size, dtype=np.int64)  # all zone pixels, incl. invalid
+        self.count = np.zeros(size, dtype=np.int64)
+        self.sum = np.zeros(size, dtype=np.float64)
+        self.sum_sq = np.zeros(size, dtype=np.float64)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.hist = np.zeros((size, bins), dtype=np.int64)
+
+    def update(
+        self,
+        values: np.ndarray,
+        zones: Optional[np.ndarray] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> "StatsAccumulator":
+        """Accumulate values (NaN = invalid), optionally labelled by zones."""
+        values = values.ravel()
+        if zones is not None:
+            zones = zones.ravel()
+            if zones.shape != values.shape:
+                raise ValueError("zones must have the same shape as values")
+
+        for start in range(0, values.size, chunk_size):
+            chunk = values[start:start + chunk_size]
+            if zones is None:
+                self._update_single(chunk)
+            else:
+                self._update_zones(chunk, zones[start:start + chunk_size])
+        return self
+
+    def _bin_index(self, valid: np.ndarray) -> np.ndarray:
+        idx = ((valid - self.value_range[0]) * self._scale).astype(np.int64)
+        return np.clip(idx, 0, self.bins - 1)
+
+    def _update_single(self, chunk: np.ndarray):
+        self.pixels[1] += chunk.size
+        valid = chunk[~np.isnan(chunk)]
+        if valid.size == 0:
+            return
+        shifted = valid.astype(np.float64) - self._shift
+        self.count[1] += valid.size
+        self.sum[1] += shifted.sum()
+        self.sum_sq[1] += np.dot(shifted, shifted)
+        self.min[1] = min(self.min[1], float(valid.min()))
+        self.max[1] = max(self.max[1], float(valid.max()))
+        self.hist[1] += np.bincount(self._bin_index(valid), minlength=self.bins)
+
+    def _update_zones(self, chunk: np.ndarray, zones: np.ndarray):
+        size = self.n_zones + 1
+        self.pixels += np.bincount(zones, minlength=size)[:size]
+        keep = (zones > 0) & ~np.isnan(chunk)
+        if not keep.any():
+            return
+        z = zones[keep]
+        valid = chunk[keep]
+        shifted = valid.astype(np.float64) - self._shift
+        self.count += np.bincount(z, minlength=size)[:size]
+        self.sum += np.bincount(z, weights=shifted, minlength=size)[:size]
+        self.sum_sq += np.bincount(z, weights=shifted * shifted, minlength=size)[:size]
+        np.minimum.at(self.min, z, valid)
+        np.maximum.at(self.max, z, valid)
+        flat = z * self.bins + self._bin_index(valid)
+        self.hist += np.bincount(flat, minlength=size * self.bins)[:size * self.bins].reshape(size, self.bins)
+
+    def merge(self, other: "StatsAccumulator") -> "StatsAccumulator":
+        """Merge another accumulator with the same zones, range and bins into this one."""
+        if (other.n_zones, other.value_range, other.bins) != (self.n_zones, self.value_range, self.bins):
+            raise ValueError("Cannot merge accumulators with different zones, range or bins")
+        self.pixels += other.pixels
+        self.count += other.count
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.hist += other.hist
+        return self
+
+    def valid_ratio(self, zone: int = 1) -> float:
+        """Valid pixels / all pixels seen for a zone."""
+        return float(self.count[zone] / self.pixels[zone]) if self.pixels[zone] else 0.0
+
+    def mean(self, zone: int = 1) -> float:
+        return float(self.sum[zone] / self.count[zone] + self._shift)
+
+    def std(self, zone: int = 1) -> float:
+        n = self.count[zone]
+        shifted_mean = self.sum[zone] / n
+        return float(np.sqrt(max(self.sum_sq[zone] / n - shifted_mean * shifted_mean, 0.0)))
+
+    def percentile(self, q: float, zone: int = 1) -> float:
+        """Approximate q-th percentile (0-100), interpolated within the histogram bin."""
+        n = int(self.count[zone])
+        if n == 0:
+            return float("nan")
+        rank = q / 100 * (n - 1)
+        cumulative = np.cumsum(self.hist[zone])
+        b = int(np.searchsorted(cumulative, rank, side="right"))
+        b = min(b, self.bins - 1)
+        before = cumulative[b - 1] if b > 0 else 0
+        in_bin = self.hist[zone, b]
+        frac = (rank - before + 0.5) / in_bin if in_bin else 0.5
+        value = self.value_range[0] + (b + frac) / self._scale
+        return float(min(max(value, self.min[zone]), self.max[zone]))
+
+    def result(self, prefix: str, zone: int = 1, percentiles: Iterable[int] = ()) -> Dict[str, float]:
+        """
+        Statistics for a zone as {prefix}_mean/_min/_max/_std[/_pNN].
+        Empty zones report 0.0 for every statistic.
+        """
+        percentiles = list(percentiles)
+        if self.count[zone] == 0:
+            keys = ["mean", "min", "max", "std"] + [f"p{q}" for q in percentiles]
+            return {f"{prefix}_{k}": 0.0 for k in keys}
+        stats = {
+            f"{prefix}_mean": self.mean(zone),
+            f"{prefix}_min": float(self.min[zone]),
+            f"{prefix}_max": float(self.max[zone]),
+            f"{prefix}_std": self.std(zone),
+        }
+        for q in percentiles:
+            stats[f"{prefix}_p{q}"] = self.percentile(q, zone)
+        return stats
@@ -0,0 +1,185 @@
+"""
+On-demand job profiling.
+
+A job runs under cProfile and tracemalloc when its payload has
+"profile": true, or for a settings.profile_sample_rate fraction of jobs.
+The artifacts are stored next to the job in S3:
+
+    profiles/job=<id>/attempt=<n>/cpu.prof     pstats dump (pstats, snakeviz)
+    profiles/job=<id>/attempt=<n>/cpu.txt      top functions by cumulative time
+    profiles/job=<id>/attempt=<n>/memory.txt   peak memory per stage and the top
+                                               allocation sites
+
+and summarised in a job_runs row (metrics_json.profile: wall / CPU seconds,
+peak traced memory, peak per pipeline stage and the artifact URIs).
+
+cProfile sees the job thread: the handler and its event loop, where work
+handed to the raster executor or the process pool shows up as the call
+awaiting it. tracemalloc traces Python and numpy allocations (not GDAL's own
+buffers) process wide, so only one job per process is profiled at a time; a
+job selected while another is profiled runs unprofiled. Per-stage peaks are
+taken at the metrics.stage() boundaries.
+"""
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from worker import metrics
+from worker.config import settings
+
+logger = structlog.get_logger()
+
+# tracemalloc is process wide: one profiled job at a time
+_lock = threading.Lock()
+
+
+def should_profile(payload: dict) -> bool:
+    """Whether a job with this payload is profiled."""
+    if payload.get("profile"):
+        return True
+    return settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate
+
+
+class JobProfile:
+    """CPU profile and memory trace of one job run."""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_bytes = 0
+        self.stage_peaks: Dict[str, int] = {}
+        # Allocation sites at the stage end holding the most memory
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.snapshot_stage: Optional[str] = None
+        self._held_bytes = -1
+
+    def _fold_peak(self):
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self.peak_bytes = max(self.peak_bytes, peak)
+        return current, peak
+
+    def stage_started(self):
+        self._fold_peak()
+
+    def stage_finished(self, name: str):
+        current, peak = self._fold_peak()
+        self.stage_peaks[name] = max(self.stage_peaks.get(name, 0), peak)
+        if current > self._held_bytes:
+            self._held_bytes = current
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_stage = name
+
+    def cpu_summary(self) -> str:
+        buffer = io.StringIO()
+        pstats.Stats(self.profiler, stream=buffer).sort_stats("cumulative").print_stats(settings.profile_top_n)
+        return buffer.getvalue()
+
+    def memory_summary(self) -> str:
+        lines = [f"peak traced memory: {self.peak_bytes / 2**20:.1f} MiB", "", "peak per stage:"]
+        lines += [f"  {name}: {peak / 2**20:.1f} MiB" for name, peak in self.stage_peaks.items()]
+        if self.snapshot is not None:
+            lines += ["", f"top allocation sites (held at the end of {self.snapshot_stage or 'the job'}):"]
+            lines += [f"  {stat}" for stat in self.snapshot.statistics("lineno")[:settings.profile_top_n]]
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profile_job(db: Session, job_id: Optional[str], payload: dict, attempt: int = 1,
+                s3=None) -> Iterator[Optional[JobProfile]]:
+    """
+    Profile the job run inside the block if it is selected (should_profile())
+    and store the result; yields the JobProfile, or None if not profiled.
+    Storing is best effort and never fails the job.
+    """
+    if not job_id or not should_profile(payload):
+        yield None
+        return
+    if not _lock.acquire(blocking=False):
+        logger.info("job_profile_skipped", job_id=job_id, reason="another_job_profiled")
+        yield None
+        return
+
+    profile = JobProfile()
+    token = metrics.active_profile.set(profile)
+    started_at = datetime.now(timezone.utc)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    failed = False
+    tracemalloc.start()
+    profile.profiler.enable()
+    try:
+        yield profile
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        profile.profiler.disable()
+        profile.wall_seconds = time.perf_counter() - wall
+        profile.cpu_seconds = time.thread_time() - cpu
+        profile._fold_peak()
+        if profile.snapshot is None:
+            profile.snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        metrics.active_profile.reset(token)
+        _lock.release()
+        try:
+            _store(db, job_id, attempt, started_at, profile, failed, s3)
+        except Exception as e:
+            db.rollback()
+            logger.warning("job_profile_store_failed", job_id=job_id, error=str(e))
+
+
+def _store(db: Session, job_id: str, attempt: int, started_at: datetime, profile: JobProfile,
+           failed: bool, s3=None):
+    """Upload the artifacts and record the run in job_runs."""
+    if s3 is None:
+        from worker.shared.aws_clients import S3Client
+        s3 = S3Client()
+    prefix = f"profiles/job={job_id}/attempt={attempt}/"
+
+    profile.profiler.create_stats()
+    summary = {
+        "wall_seconds": round(profile.wall_seconds, 3),
+        "cpu_seconds": round(profile.cpu_seconds, 3),
+        "peak_traced_bytes": profile.peak_bytes,
+        "stage_peak_bytes": profile.stage_peaks,
+        "cpu_profile": s3.upload_bytes(
+            marshal.dumps(profile.profiler.stats), prefix + "cpu.prof", content_type="application/octet-stream"
+        ),
+        "cpu_summary": s3.upload_bytes(profile.cpu_summary().encode(), prefix + "cpu.txt", content_type="text/plain"),
+        "memory_summary": s3.upload_bytes(
+            profile.memory_summary().encode(), prefix + "memory.txt", content_type="text/plain"
+        ),
+    }
+
+    # Run status: the job's own status unless the handler raised
+    db.execute(text("""
+        INSERT INTO job_runs (tenant_id, job_id, attempt, status, metrics_json, started_at, finished_at)
+        SELECT j.tenant_id, j.id, :attempt, CASE WHEN :failed THEN 'FAILED' ELSE j.status END,
+               CAST(:metrics_json AS jsonb), :started_at, now()
+        FROM jobs j
+        WHERE j.id = :job_id
+    """), {
+        "job_id": job_id,
+        "attempt": attempt,
+        "failed": failed,
+        "metrics_json": json.dumps({"profile": summary}),
+        "started_at": started_at,
+    })
+    db.commit()
+    logger.info("job_profiled", job_id=job_id, attempt=attempt, wall_seconds=summary["wall_seconds"],
+                peak_traced_bytes=profile.peak_bytes, cpu_profile=summary["cpu_profile"])
@@ -0,0 +1,363 @@
+"""
+Worker runtime.
+
+One long-lived asyncio event loop drives a continuous receive -> dispatch
+pipeline: the poller keeps up to WORKER_CONCURRENCY plus a small lookahead
+(settings.scheduler_lookahead) messages received and starts jobs as soon as a
+slot is free, so a slow job never holds back the rest of its batch and the
+queue is polled again the moment there is room. Messages held back by a cap
+don't take up that room (up to settings.scheduler_max_blocked of them). Received messages wait
+(leased, see below) in a FairScheduler (worker/scheduling.py), which
+starts interactive jobs first and shares slots fairly between tenants and
+job types, honouring per-tenant (settings.tenant_concurrency_limit) and
+per-job-type (settings.job_type_concurrency) caps on top of the global
+WORKER_CONCURRENCY.
+
+Handlers are blocking (SQLAlchemy sessions, boto3), so each job runs on a
+job thread. Handlers that need asyncio call run_async(), which reuses one
+event loop per job thread instead of building and tearing down a loop per
+job. Blocking raster work (asyncio.to_thread in the pipelines) runs on one
+shared, bounded raster executor (settings.raster_threads) instead of a
+thread pool per job loop.
+
+Messages are received with a short visibility timeout
+(settings.sqs_visibility_timeout_seconds). While a message waits in the
+scheduler or its job's handler is running, a heartbeat on the runtime loop
+extends its lease every settings.sqs_heartbeat_interval_seconds; when the
+handler finishes (or the worker dies) the heartbeat stops, so an unfinished
+message is redelivered after one short timeout rather than the worst-case job
+duration. Messages still waiting at shutdown are handed back immediately.
+Messages of finished jobs are deleted in batches (DeleteMessageBatch) rather
+than one request per message.
+
+The queue client may also be a PostgresJobQueue (QUEUE_BACKEND=postgres,
+worker/shared/pg_queue.py), which claims jobs from the jobs table with
+FOR UPDATE SKIP LOCKED behind the same receive / lease / delete interface.
+
+With an admission controller (worker/admission.py) a job also waits until
+its estimated peak memory fits the worker's memory budget before it starts.
+
+CPU-heavy raster stages of job types registered with
+JobHandler(cpu_mode="process") run in a process pool instead
+(worker/pipeline/cpu_pool.py).
+"""
+import asyncio
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+from worker import metrics
+from worker.config import settings
+from worker.scheduling import FairScheduler, MessageMeta
+
+logger = structlog.get_logger()
+
+_raster_executor: Optional[ThreadPoolExecutor] = None
+_raster_executor_lock = threading.Lock()
+_thread_state = threading.local()
+
+
+@dataclass(frozen=True)
+class JobHandler:
+    """
+    Job handler plus how it executes.
+
+    cpu_mode: "thread" runs CPU-bound raster stages on the job/raster threads;
+        "process" sends them to the CPU process pool (see cpu_pool.CpuWorkspace)
+    """
+    handler: Callable
+    cpu_mode: str = "thread"
+
+
+def get_raster_executor() -> ThreadPoolExecutor:
+    """Process-wide executor for blocking raster I/O and compute."""
+    global _raster_executor
+    if _raster_executor is None:
+        with _raster_executor_lock:
+            if _raster_executor is None:
+                _raster_executor = ThreadPoolExecutor(
+                    max_workers=settings.raster_threads, thread_name_prefix="raster"
+                )
+    return _raster_executor
+
+
+def run_async(coro):
+    """
+    Run a coroutine to completion from a job thread.
+
+    The event loop is created once per thread and reused by every job that
+    thread runs; its default executor (asyncio.to_thread / run_in_executor(None))
+    is the shared raster executor.
+    """
+    loop = getattr(_thread_state, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        loop.set_default_executor(get_raster_executor())
+        _thread_state.loop = loop
+    return loop.run_until_complete(coro)
+
+
+class WorkerRuntime:
+    """
+    Continuous SQS consumer.
+
+    Args:
+        sqs: SQSClient or PostgresJobQueue
+        process_one: blocking callable(message, queue_url) that runs one job;
+            returns True if the message is done and should be deleted
+        concurrency: maximum jobs in flight
+        job_type_limits: per job type maximum (types not listed share the
+            global limit only)
+        visibility_timeout: lease length set by each heartbeat
+        heartbeat_interval: seconds between lease extensions
+        max_lease: stop extending a message's lease after this many seconds
+        admission: MemoryAdmission that jobs must reserve memory from
+            before they start (None = admit by count only)
+        lookahead: messages received beyond the free slots, so the scheduler
+            has other tenants' jobs to choose from (default
+            settings.scheduler_lookahead, 0 there = concurrency)
+        scheduler: FairScheduler (default: one with job_type_limits and the
+            tenant settings)
+        max_blocked: waiting messages that can't start because of a cap
+            (FairScheduler.blocked()) that don't count against the lookahead,
+            so capped jobs can't stop the worker from receiving work for its
+            free slots (default settings.scheduler_max_blocked)
+    """
+
+    def __init__(
+        self,
+        sqs,
+        process_one: Callable[[dict, str], Any],
+        concurrency: int,
+        job_type_limits: Optional[Dict[str, int]] = None,
+        visibility_timeout: Optional[int] = None,
+        heartbeat_interval: Optional[float] = None,
+        max_lease: Optional[float] = None,
+        admission=None,
+        lookahead: Optional[int] = None,
+        scheduler: Optional[FairScheduler] = None,
+        max_blocked: Optional[int] = None,
+    ):
+        self.sqs = sqs
+        self.process_one = process_one
+        self.concurrency = concurrency
+        self.job_type_limits = job_type_limits or {}
+        self.visibility_timeout = visibility_timeout or settings.sqs_visibility_timeout_seconds
+        self.heartbeat_interval = heartbeat_interval or settings.sqs_heartbeat_interval_seconds
+        self.max_lease = max_lease or settings.sqs_max_lease_seconds
+        self.admission = admission
+        if lookahead is None:
+            lookahead = settings.scheduler_lookahead or concurrency
+        self.lookahead = lookahead
+        # An empty FairScheduler is falsy (__len__)
+        if scheduler is None:
+            scheduler = FairScheduler(job_type_limits=self.job_type_limits)
+        self.scheduler = scheduler
+        self.max_blocked = settings.scheduler_max_blocked if max_blocked is None else max_blocked
+        self.in_flight = 0
+        # receipt handle -> (queue url, received at) for messages that are
+        # waiting in the scheduler or whose handler is running
+        self.leases: Dict[str, Tuple[str, float]] = {}
+        self._stopping = False
+        self._tasks: set = set()
+        self._capacity: Optional[asyncio.Condition] = None
+        # queue url -> receipt handles of finished messages awaiting deletion
+        self._done: Dict[str, List[str]] = {}
+        self._job_executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job")
+        # SQS long polls block for up to 20s; keep them off the job threads
+        # and away from lease extensions and batched deletes
+        self._poll_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqs-poll")
+        self._lease_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqs-lease")
+
+    def stop(self):
+        """Stop receiving; in-flight jobs are allowed to finish."""
+        if not self._stopping:
+            logger.info("worker_shutdown", in_flight=self.in_flight)
+        self._stopping = True
+
+    def _receive(self, max_messages: int) -> Tuple[List[dict], Optional[str]]:
+        """High priority queue first (short poll), then the default queue (long poll)."""
+        messages = self.sqs.receive_messages(
+            queue_url=self.sqs.queue_high_url, max_messages=max_messages, wait_time=2
+        )
+        if messages:
+            logger.info("processing_high_priority_job", count=len(messages))
+            return messages, self.sqs.queue_high_url
+        if self._stopping:
+            return [], None
+        messages = self.sqs.receive_messages(
+            queue_url=self.sqs.queue_url, max_messages=max_messages, wait_time=20
+        )
+        return messages, self.sqs.queue_url
+
+    def _room(self) -> int:
+        """
+        Messages that may still be received (running + waiting <= concurrency +
+        lookahead). Up to max_blocked waiting messages held back by a cap don't
+        count: they keep their lease (the heartbeat extends it) rather than
+        going back to the queue, which would use up their receive count.
+        """
+        blocked = min(self.scheduler.blocked(), self.max_blocked)
+        return self.concurrency + self.lookahead - self.in_flight - len(self.scheduler) + blocked
+
+    async def _receive_room(self) -> int:
+        async with self._capacity:
+            await self._capacity.wait_for(lambda: self._room() > 0 or self._stopping)
+            return self._room()
+
+    async def _admit_and_run(self, message: dict, queue_url: str):
+        loop = asyncio.get_running_loop()
+        if self.admission is None:
+            return await loop.run_in_executor(self._job_executor, self.process_one, message, queue_url)
+        # The estimate may hit the database; the job's own thread is free for it
+        message, reservation = await loop.run_in_executor(self._job_executor, self.admission.plan, message)
+        await self.admission.acquire(reservation)
+        try:
+            return await loop.run_in_executor(self._job_executor, self.process_one, message, queue_url)
+        finally:
+            await self.admission.release(reservation)
+
+    async def _run_job(self, message: dict, queue_url: str, meta: MessageMeta):
+        try:
+            done = await self._admit_and_run(message, queue_url)
+            if done:
+                self._done.setdefault(queue_url, []).append(message["ReceiptHandle"])
+        except Exception as e:
+            logger.error("message_processing_failed", exc_info=e)
+        finally:
+            self.leases.pop(message["ReceiptHandle"], None)
+            self.scheduler.finished(meta)
+            async with self._capacity:
+                self.in_flight -= 1
+                metrics.jobs_in_flight.dec()
+                self._start_ready()
+                self._capacity.notify_all()
+
+    def _extend_leases(self, leases: Dict[str, Tuple[str, float]]) -> List[str]:
+        """Extend the given leases; returns receipt handles that are gone."""
+        by_queue: Dict[str, List[str]] = {}
+        for handle, (queue_url, _) in leases.items():
+            by_queue.setdefault(queue_url, []).append(handle)
+        lost = []
+        for queue_url, handles in by_queue.items():
+            try:
+                lost += self.sqs.change_message_visibility_batch(
+                    handles, self.visibility_timeout, queue_url=queue_url
+                )
+            except Exception as e:
+                logger.error("lease_heartbeat_failed", queue_url=queue_url, exc_info=e)
+        return lost
+
+    async def _heartbeat(self):
+        """Periodically extend the leases of messages whose handler is still running."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            due = {}
+            for handle, (queue_url, received_at) in list(self.leases.items()):
+                if now - received_at > self.max_lease:
+                    logger.warning("lease_max_reached", receipt_handle=handle[:20], seconds=int(now - received_at))
+                    self.leases.pop(handle, None)
+                else:
+                    due[handle] = (queue_url, received_at)
+            if not due:
+                continue
+            lost = await loop.run_in_executor(self._lease_executor, self._extend_leases, due)
+            for handle in lost:
+                self.leases.pop(handle, None)
+            logger.debug("leases_extended", count=len(due) - len(lost))
+
+    def _delete_batches(self, done: Dict[str, List[str]]):
+        for queue_url, handles in done.items():
+            try:
+                self.sqs.delete_message_batch(handles, queue_url=queue_url)
+            except Exception as e:
+                # Undeleted messages are redelivered and rerun (jobs are idempotent)
+                logger.error("message_delete_batch_failed", queue_url=queue_url, count=len(handles), exc_info=e)
+
+    async def _flush_deletes(self):
+        if not self._done:
+            return
+        done, self._done = self._done, {}
+        await asyncio.get_running_loop().run_in_executor(self._lease_executor, self._delete_batches, done)
+
+    async def _deleter(self):
+        """Delete finished messages in batches every settings.sqs_delete_flush_seconds."""
+        while True:
+            await asyncio.sleep(settings.sqs_delete_flush_seconds)
+            await self._flush_deletes()
+
+    def _start_ready(self):
+        """Start waiting jobs, in scheduler order, while there are free slots."""
+        while self.in_flight < self.concurrency and not self._stopping:
+            picked = self.scheduler.pop()
+            if picked is None:
+                break
+            message, queue_url, meta = picked
+            self.in_flight += 1
+            metrics.jobs_in_flight.inc()
+            task = asyncio.create_task(self._run_job(message, queue_url, meta))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        metrics.jobs_waiting.set(len(self.scheduler))
+
+    def _release_waiting(self) -> Dict[str, List[str]]:
+        """Hand messages that never started back to the queue (visibility 0)."""
+        waiting: Dict[str, List[str]] = {}
+        for message, queue_url in self.scheduler.drain():
+            self.leases.pop(message["ReceiptHandle"], None)
+            waiting.setdefault(queue_url, []).append(message["ReceiptHandle"])
+        return waiting
+
+    def _return_batches(self, waiting: Dict[str, List[str]]):
+        for queue_url, handles in waiting.items():
+            try:
+                self.sqs.change_message_visibility_batch(handles, 0, queue_url=queue_url)
+            except Exception as e:
+                logger.error("message_release_failed", queue_url=queue_url, count=len(handles), exc_info=e)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._capacity = asyncio.Condition()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # Not on the main thread / platform without signals
+
+        logger.info("worker_runtime_started", concurrency=self.concurrency, job_type_limits=self.job_type_limits)
+        heartbeat = asyncio.create_task(self._heartbeat())
+        deleter = asyncio.create_task(self._deleter())
+        while not self._stopping:
+            try:
+                room = await self._receive_room()
+                if self._stopping:
+                    break
+                messages, queue_url = await loop.run_in_executor(
+                    self._poll_executor, self._receive, min(10, room)
+                )
+                for message in messages:
+                    self.leases[message["ReceiptHandle"]] = (queue_url, time.monotonic())
+                    self.scheduler.push(message, queue_url)
+                self._start_ready()
+            except Exception as e:
+                logger.error("worker_error", exc_info=e)
+                await asyncio.sleep(1)  # Prevent tight loop on error
+
+        waiting = self._release_waiting()
+        if waiting:
+            await loop.run_in_executor(self._lease_executor, self._return_batches, waiting)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        heartbeat.cancel()
+        deleter.cancel()
+        await self._flush_deletes()
+        self._job_executor.shutdown(wait=True)
+        self._poll_executor.shutdown(wait=False)
+        self._lease_executor.shutdown(wait=False)
@@ -0,0 +1,184 @@
+"""
+Per-tenant fair job scheduling.
+
+Jobs belong to a priority class: "interactive" (a new AOI's first weeks, a
+user's short reprocess) or "bulk" (long backfills, admin reprocessing). The
+class is set in the payload (payload["priority_class"]) by whoever creates the
+job, and BACKFILL children inherit it. Interactive jobs are sent to the
+high-priority queue (SQS) or get jobs.priority = INTERACTIVE_PRIORITY
+(Postgres backend), so they are received first.
+
+The worker runtime then holds the messages it has received (up to its free
+slots plus settings.scheduler_lookahead) in a FairScheduler, which decides
+which one starts next:
+
+- interactive before bulk;
+- within a class, weighted fair share across tenants (stride scheduling:
+  each start advances the tenant's pass by 1 / weight, the lowest pass goes
+  next), then across that tenant's job types the same way, FIFO within a
+  job type;
+- a tenant at its concurrency cap (settings.tenant_concurrency_limit /
+  settings.tenant_concurrency) or a job type at its cap
+  (settings.job_type_concurrency) is skipped until one of its jobs finishes;
+  its waiting messages (blocked()) don't count against the runtime's receive
+  room, so they can't keep other tenants' jobs from being received.
+
+One tenant's multi-year backfill therefore takes at most its share of the
+worker instead of every slot.
+"""
+import json
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from worker.config import settings
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITY_CLASSES = (INTERACTIVE, BULK)
+
+# jobs.priority of interactive jobs (Postgres backend; bulk jobs are 0)
+INTERACTIVE_PRIORITY = 10
+
+
+def priority_class(payload: Dict[str, Any]) -> str:
+    """Priority class of a job payload (unknown or missing = bulk)."""
+    value = (payload or {}).get("priority_class")
+    return value if value in PRIORITY_CLASSES else BULK
+
+
+def job_priority(payload: Dict[str, Any]) -> int:
+    """jobs.priority for a payload."""
+    return INTERACTIVE_PRIORITY if priority_class(payload) == INTERACTIVE else 0
+
+
+@dataclass(frozen=True)
+class MessageMeta:
+    priority_class: str
+    tenant_id: Optional[str]
+    job_type: Optional[str]
+
+
+def message_meta(message: dict) -> MessageMeta:
+    """Scheduling attributes of a queue message (bulk / no tenant if the body can't be parsed)."""
+    body = message.get("Body")
+    try:
+        if not isinstance(body, (dict, list)):
+            body = json.loads(body)
+        payload = body.get("payload") or {}
+        tenant_id = payload.get("tenant_id")
+        return MessageMeta(priority_class(payload), str(tenant_id) if tenant_id else None, body.get("job_type"))
+    except (TypeError, ValueError, AttributeError):
+        return MessageMeta(BULK, None, None)
+
+
+class _Stride:
+    """Stride scheduling over keys: the lowest pass goes next and advances by 1 / weight."""
+
+    def __init__(self, weight: Callable[[Hashable], float]):
+        self.weight = weight
+        self.passes: Dict[Hashable, float] = {}
+        # Pass of the last pick; new or idle keys start here instead of bursting
+        self.clock = 0.0
+
+    def pick(self, keys: List[Hashable]) -> Hashable:
+        key = min(keys, key=lambda k: max(self.passes.get(k, self.clock), self.clock))
+        self.clock = max(self.passes.get(key, self.clock), self.clock)
+        self.passes[key] = self.clock + 1.0 / max(self.weight(key), 1e-6)
+        return key
+
+
+class FairScheduler:
+    """
+    Received messages waiting for a job slot (see module docstring).
+
+    Args:
+        job_type_limits: job type -> max running jobs
+        tenant_limit: max running jobs per tenant (0 = no cap)
+        tenant_limits: tenant id -> max running jobs (overrides tenant_limit)
+        tenant_weights: tenant id -> share weight (default 1)
+        job_type_weights: job type -> share weight within a tenant (default 1)
+    """
+
+    def __init__(
+        self,
+        job_type_limits: Optional[Dict[str, int]] = None,
+        tenant_limit: Optional[int] = None,
+        tenant_limits: Optional[Dict[str, int]] = None,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        job_type_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.job_type_limits = job_type_limits or {}
+        self.tenant_limit = settings.tenant_concurrency_limit if tenant_limit is None else tenant_limit
+        self.tenant_limits = settings.tenant_concurrency if tenant_limits is None else tenant_limits
+        tenant_weights = settings.tenant_weights if tenant_weights is None else tenant_weights
+        job_type_weights = settings.job_type_weights if job_type_weights is None else job_type_weights
+        self._tenants = _Stride(lambda tenant: tenant_weights.get(tenant, 1.0))
+        self._job_types: Dict[Optional[str], _Stride] = {}
+        self._job_type_weight = lambda job_type: job_type_weights.get(job_type, 1.0)
+        # (class, tenant, job type) -> FIFO of (message, queue url)
+        self._queued: Dict[Tuple[str, Optional[str], Optional[str]], Deque[Tuple[dict, str]]] = {}
+        self.running_tenants: Dict[Optional[str], int] = {}
+        self.running_types: Dict[Optional[str], int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, message: dict, queue_url: str):
+        meta = message_meta(message)
+        key = (meta.priority_class, meta.tenant_id, meta.job_type)
+        self._queued.setdefault(key, deque()).append((message, queue_url))
+        self._size += 1
+
+    def _tenant_full(self, tenant_id: Optional[str]) -> bool:
+        limit = self.tenant_limits.get(tenant_id) if tenant_id else None
+        limit = limit or self.tenant_limit
+        return bool(limit) and tenant_id is not None and self.running_tenants.get(tenant_id, 0) >= limit
+
+    def _type_full(self, job_type: Optional[str]) -> bool:
+        limit = self.job_type_limits.get(job_type) if job_type else None
+        return bool(limit) and self.running_types.get(job_type, 0) >= limit
+
+    def blocked(self) -> int:
+        """Waiting messages that can't start until a job of their tenant or type finishes."""
+        return sum(
+            len(queue) for (_, tenant_id, job_type), queue in self._queued.items()
+            if self._tenant_full(tenant_id) or self._type_full(job_type)
+        )
+
+    def pop(self) -> Optional[Tuple[dict, str, MessageMeta]]:
+        """Next message allowed to start (None if every waiting one is capped)."""
+        for cls in PRIORITY_CLASSES:
+            startable: Dict[Optional[str], List[Optional[str]]] = {}
+            for (c, tenant_id, job_type), queue in self._queued.items():
+                if c == cls and queue and not self._tenant_full(tenant_id) and not self._type_full(job_type):
+                    startable.setdefault(tenant_id, []).append(job_type)
+            if not startable:
+                continue
+            tenant_id = self._tenants.pick(list(startable))
+            stride = self._job_types.setdefault(tenant_id, _Stride(self._job_type_weight))
+            job_type = stride.pick(startable[tenant_id])
+            key = (cls, tenant_id, job_type)
+            message, queue_url = self._queued[key].popleft()
+            if not self._queued[key]:
+                del self._queued[key]
+            self._size -= 1
+            self.running_tenants[tenant_id] = self.running_tenants.get(tenant_id, 0) + 1
+            self.running_types[job_type] = self.running_types.get(job_type, 0) + 1
+            return message, queue_url, MessageMeta(cls, tenant_id, job_type)
+        return None
+
+    def finished(self, meta: MessageMeta):
+        """A job started by pop() is done."""
+        for running, key in ((self.running_tenants, meta.tenant_id), (self.running_types, meta.job_type)):
+            running[key] -= 1
+            if not running[key]:
+                del running[key]
+
+    def drain(self) -> Iterable[Tuple[dict, str]]:
+        """Remove and return every waiting message."""
+        waiting = [item for queue in self._queued.values() for item in queue]
+        self._queued.clear()
+        self._size = 0
+        return waiting
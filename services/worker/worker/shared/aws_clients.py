@@ -1,10 +1,82 @@
+"""
+AWS clients of the worker.
+
+S3Client instances are cheap: they share one boto3 client per process
+(boto3 clients are thread safe) with a connection pool sized for the I/O
+pool, and transfers above settings.s3_multipart_threshold_mb go multipart
+with parts uploaded in parallel.
+
+submit_io() runs blocking S3 calls on the shared I/O pool, so a job can keep
+several uploads in flight (pipeline/raster_io.py).
+"""
+import contextvars
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from worker.config import settings
+from worker import metrics
 import structlog
 
 logger = structlog.get_logger()
 
+_lock = threading.Lock()
+# Per process (pid, object): neither survives a fork
+_s3_client = None
+_io_pool = None
+
+
+def _shared_s3_client():
+    global _s3_client
+    with _lock:
+        if _s3_client is None or _s3_client[0] != os.getpid():
+            config = Config(
+                max_pool_connections=settings.s3_max_pool_connections,
+                retries={"mode": "standard"},
+                s3={"addressing_style": "path"} if settings.s3_force_path_style else None,
+            )
+            client = boto3.client(
+                's3',
+                region_name=settings.aws_region,
+                endpoint_url=settings.aws_endpoint_url,
+                aws_access_key_id=settings.aws_access_key_id,
+                aws_secret_access_key=settings.aws_secret_access_key,
+                config=config,
+            )
+            _s3_client = (os.getpid(), client)
+            logger.info("s3_client_initialized", bucket=settings.s3_bucket)
+        return _s3_client[1]
+
+
+def _shared_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    with _lock:
+        if _io_pool is None or _io_pool[0] != os.getpid():
+            _io_pool = (os.getpid(), ThreadPoolExecutor(settings.s3_io_threads, thread_name_prefix="s3-io"))
+        return _io_pool[1]
+
+
+def transfer_config() -> TransferConfig:
+    """Multipart settings for upload_file / upload_fileobj."""
+    mb = 1024 * 1024
+    return TransferConfig(
+        multipart_threshold=settings.s3_multipart_threshold_mb * mb,
+        multipart_chunksize=settings.s3_multipart_chunk_mb * mb,
+        max_concurrency=settings.s3_multipart_concurrency,
+    )
+
+
+def submit_io(fn: Callable, *args, **kwargs) -> Future:
+    """Run a blocking S3 call on the shared I/O pool (in the caller's context, for metrics)."""
+    context = contextvars.copy_context()
+    return _shared_io_pool().submit(context.run, fn, *args, **kwargs)
+
 
 class SQSClient:
     def __init__(self):
@@ -57,7 +129,9 @@ class SQSClient:
             MaxNumberOfMessages=max_messages,
             WaitTimeSeconds=wait_time,
             VisibilityTimeout=settings.sqs_visibility_timeout_seconds,
-            MessageAttributeNames=['All']
+            MessageAttributeNames=['All'],
+            # Queue wait and retry metrics
+            AttributeNames=['ApproximateReceiveCount', 'SentTimestamp']
         )
         
         return response.get('Messages', [])
@@ -80,6 +154,80 @@ class SQSClient:
             VisibilityTimeout=visibility_timeout
         )
 
+    def change_message_visibility_batch(self, receipt_handles, visibility_timeout, queue_url=None):
+        """
+        Set the visibility timeout of several messages (10 per request).
+
+        Returns:
+            receipt handles that could not be updated (e.g. already deleted)
+        """
+        target_queue = queue_url if queue_url else self.queue_url
+        failed = []
+        for start in range(0, len(receipt_handles), 10):
+            chunk = receipt_handles[start:start + 10]
+            response = self.client.change_message_visibility_batch(
+                QueueUrl=target_queue,
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": handle, "VisibilityTimeout": visibility_timeout}
+                    for i, handle in enumerate(chunk)
+                ],
+            )
+            for entry in response.get("Failed", []):
+                failed.append(chunk[int(entry["Id"])])
+                logger.warning("visibility_change_failed", code=entry.get("Code"), message=entry.get("Message"))
+        return failed
+
+    def delete_message_batch(self, receipt_handles, queue_url=None):
+        """
+        Delete several messages (10 per request).
+
+        Returns:
+            receipt handles that could not be deleted
+        """
+        target_queue = queue_url if queue_url else self.queue_url
+        failed = []
+        for start in range(0, len(receipt_handles), 10):
+            chunk = receipt_handles[start:start + 10]
+            response = self.client.delete_message_batch(
+                QueueUrl=target_queue,
+                Entries=[{"Id": str(i), "ReceiptHandle": handle} for i, handle in enumerate(chunk)],
+            )
+            for entry in response.get("Failed", []):
+                failed.append(chunk[int(entry["Id"])])
+                logger.warning("message_delete_failed", code=entry.get("Code"), message=entry.get("Message"))
+        logger.info("messages_deleted", count=len(receipt_handles) - len(failed))
+        return failed
+
+    def send_message_batch(self, message_bodies, queue_url=None):
+        """
+        Send several messages (10 per request). Entries that fail with a
+        server-side error are retried once.
+
+        Raises:
+            RuntimeError if any message could not be sent
+        """
+        import json
+        target_queue = queue_url if queue_url else self.queue_url
+        bodies = [json.dumps(b) if isinstance(b, dict) else b for b in message_bodies]
+        failed = []
+        for start in range(0, len(bodies), 10):
+            chunk = bodies[start:start + 10]
+            for attempt in range(2):
+                response = self.client.send_message_batch(
+                    QueueUrl=target_queue,
+                    Entries=[{"Id": str(i), "MessageBody": body} for i, body in enumerate(chunk)],
+                )
+                errors = response.get("Failed", [])
+                retryable = [chunk[int(e["Id"])] for e in errors if not e.get("SenderFault")]
+                failed += [e for e in errors if e.get("SenderFault") or attempt == 1]
+                if not retryable:
+                    break
+                chunk = retryable
+        if failed:
+            for entry in failed:
+                logger.error("message_send_failed", code=entry.get("Code"), message=entry.get("Message"))
+            raise RuntimeError(f"{len(failed)} of {len(bodies)} messages could not be sent")
+
     def send_message(self, message_body, queue_url=None):
         """Send message to queue"""
         import json
@@ -95,34 +243,51 @@ class SQSClient:
 
 class S3Client:
     def __init__(self):
-        self.client = boto3.client(
-            's3',
-            region_name=settings.aws_region,
-            endpoint_url=settings.aws_endpoint_url,
-            aws_access_key_id=settings.aws_access_key_id,
-            aws_secret_access_key=settings.aws_secret_access_key
-        )
-        
-        # For LocalStack
-        if settings.s3_force_path_style:
-            self.client = boto3.client(
-                's3',
-                region_name=settings.aws_region,
-                endpoint_url=settings.aws_endpoint_url,
-                aws_access_key_id=settings.aws_access_key_id,
-                aws_secret_access_key=settings.aws_secret_access_key,
-                config=boto3.session.Config(s3={'addressing_style': 'path'})
-            )
-        
+        # Shared per process; path-style addressing for LocalStack
+        self.client = _shared_s3_client()
         self.bucket = settings.s3_bucket
-        logger.info("s3_client_initialized", bucket=self.bucket)
     
     def upload_file(self, file_path, s3_key):
-        """Upload file to S3"""
-        self.client.upload_file(file_path, self.bucket, s3_key)
+        """Upload file to S3 (multipart above the threshold)"""
+        self.client.upload_file(file_path, self.bucket, s3_key, Config=transfer_config())
+        metrics.count_written(os.path.getsize(file_path))
         logger.info("file_uploaded", s3_key=s3_key)
         return f"s3://{self.bucket}/{s3_key}"
     
+    def upload_bytes(self, body: bytes, s3_key: str, content_type: str = "image/tiff"):
+        """Upload an in-memory object to S3 (multipart above the threshold)"""
+        if len(body) >= settings.s3_multipart_threshold_mb * 1024 * 1024:
+            self.client.upload_fileobj(
+                io.BytesIO(body), self.bucket, s3_key,
+                ExtraArgs={"ContentType": content_type}, Config=transfer_config(),
+            )
+        else:
+            self.client.put_object(Bucket=self.bucket, Key=s3_key, Body=body, ContentType=content_type)
+        metrics.count_written(len(body))
+        logger.info("bytes_uploaded", s3_key=s3_key, size_bytes=len(body))
+        return f"s3://{self.bucket}/{s3_key}"
+
+    def get_bytes(self, s3_key: str) -> bytes | None:
+        """Download an object into memory (None if it doesn't exist)"""
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=s3_key)
+            body = response['Body'].read()
+            metrics.count_read(len(body))
+            return body
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                return None
+            raise
+
+    def delete_prefix(self, prefix: str):
+        """Delete every object under a key prefix"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if keys:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': keys})
+        logger.info("prefix_deleted", prefix=prefix)
+
     def generate_presigned_url(self, s3_key, expires_in=900):
         """Generate presigned URL for S3 object"""
         url = self.client.generate_presigned_url(
@@ -142,6 +307,7 @@ class S3Client:
             Body=body,
             ContentType='application/json'
         )
+        metrics.count_written(len(body))
         logger.info("json_uploaded", s3_key=s3_key)
         return f"s3://{self.bucket}/{s3_key}"
 
@@ -160,7 +326,9 @@ class S3Client:
         import json
         try:
             response = self.client.get_object(Bucket=self.bucket, Key=s3_key)
-            return json.loads(response['Body'].read().decode('utf-8'))
+            body = response['Body'].read()
+            metrics.count_read(len(body))
+            return json.loads(body.decode('utf-8'))
         except ClientError as e:
             if e.response['Error']['Code'] == 'NoSuchKey':
                 return None
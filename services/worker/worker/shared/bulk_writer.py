@@ -0,0 +1,190 @@
+"""
+Bulk upserts for observation and time-series tables.
+
+Jobs that write many rows at once (scene-centric weeks, weather history,
+backfills) upsert them with upsert_rows() instead of one INSERT ... ON
+CONFLICT and commit per row:
+
+- batches of settings.bulk_copy_min_rows rows or more are COPYed into a
+  temporary table shaped like the target columns and merged with a single
+  INSERT ... SELECT ... ON CONFLICT DO UPDATE
+- smaller batches (e.g. the one row of a PROCESS_WEEK) are one multi-row
+  INSERT ... VALUES ... ON CONFLICT statement, which is cheaper than the
+  temp table round trips
+
+Either way the batch is one transaction. Rows with the same key keep the
+last one (ON CONFLICT can't update a row twice in one statement).
+
+once_per_process() wraps the CREATE TABLE IF NOT EXISTS helpers of tables
+that have no migration, so their DDL runs once per worker process instead of
+on every save.
+"""
+import functools
+import io
+import json
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from worker.config import settings
+
+logger = structlog.get_logger()
+
+# Rows per INSERT ... VALUES statement (bind parameters are capped at 65535)
+VALUES_CHUNK = 500
+
+
+@dataclass
+class UpsertTarget:
+    """
+    Table written by upsert_rows().
+
+    Args:
+        table: target table
+        columns: columns written (missing row values are NULL)
+        key: conflict target (primary key / unique columns)
+        update: columns overwritten on conflict; None = every non-key column
+        touch_updated_at: also set updated_at = now() on conflict
+        casts: SQL type of columns whose values need a cast in VALUES (e.g. jsonb)
+    """
+    table: str
+    columns: Tuple[str, ...]
+    key: Tuple[str, ...]
+    update: Optional[Tuple[str, ...]] = None
+    touch_updated_at: bool = False
+    casts: Dict[str, str] = field(default_factory=dict)
+
+    def on_conflict(self) -> str:
+        update = self.update if self.update is not None else tuple(c for c in self.columns if c not in self.key)
+        assignments = [f"{c} = EXCLUDED.{c}" for c in update]
+        if self.touch_updated_at:
+            assignments.append("updated_at = now()")
+        if not assignments:
+            return f"ON CONFLICT ({', '.join(self.key)}) DO NOTHING"
+        return f"ON CONFLICT ({', '.join(self.key)}) DO UPDATE SET {', '.join(assignments)}"
+
+
+def _dedupe(target: UpsertTarget, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Last row per key, in first-seen order."""
+    by_key: Dict[Tuple, Dict[str, Any]] = {}
+    for row in rows:
+        by_key[tuple(str(row.get(c)) for c in target.key)] = row
+    return list(by_key.values())
+
+
+def _copy_value(value: Any) -> str:
+    """A value in COPY text format."""
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_upsert(db: Session, target: UpsertTarget, rows: List[Dict[str, Any]]):
+    columns = ", ".join(target.columns)
+    staging = f"_bulk_{target.table}"
+    db.execute(text(f"DROP TABLE IF EXISTS pg_temp.{staging}"))
+    db.execute(text(
+        f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {columns} FROM {target.table} WITH NO DATA"
+    ))
+
+    data = "".join("\t".join(_copy_value(row.get(c)) for c in target.columns) + "\n" for row in rows)
+    copy_sql = f"COPY {staging} ({columns}) FROM STDIN"
+    cursor = db.connection().connection.cursor()
+    try:
+        if hasattr(cursor, "copy"):
+            # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                copy.write(data)
+        else:
+            cursor.copy_expert(copy_sql, io.StringIO(data))
+    finally:
+        cursor.close()
+
+    db.execute(text(f"""
+        INSERT INTO {target.table} ({columns})
+        SELECT {columns} FROM {staging}
+        {target.on_conflict()}
+    """))
+
+
+def _values_upsert(db: Session, target: UpsertTarget, rows: List[Dict[str, Any]]):
+    columns = ", ".join(target.columns)
+    for start in range(0, len(rows), VALUES_CHUNK):
+        chunk = rows[start:start + VALUES_CHUNK]
+        values, params = [], {}
+        for i, row in enumerate(chunk):
+            placeholders = []
+            for c in target.columns:
+                placeholder = f":{c}_{i}"
+                if c in target.casts:
+                    placeholder = f"CAST({placeholder} AS {target.casts[c]})"
+                placeholders.append(placeholder)
+                params[f"{c}_{i}"] = row.get(c)
+            values.append(f"({', '.join(placeholders)})")
+        db.execute(text(f"""
+            INSERT INTO {target.table} ({columns})
+            VALUES {', '.join(values)}
+            {target.on_conflict()}
+        """), params)
+
+
+def upsert_rows(db: Session, target: UpsertTarget, rows: Sequence[Dict[str, Any]], commit: bool = True) -> int:
+    """
+    Upsert rows (dicts keyed by column) into target in one batch.
+
+    Returns:
+        number of rows written after deduplication by key
+    """
+    rows = _dedupe(target, rows)
+    if not rows:
+        return 0
+    try:
+        if len(rows) >= settings.bulk_copy_min_rows:
+            _copy_upsert(db, target, rows)
+        else:
+            _values_upsert(db, target, rows)
+        if commit:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logger.debug("rows_upserted", table=target.table, rows=len(rows))
+    return len(rows)
+
+
+def once_per_process(ensure):
+    """
+    Decorator for ensure(db) schema helpers: after the first call that
+    succeeds in this process, later calls return without touching the DB.
+    """
+    lock = threading.Lock()
+    done = False
+
+    @functools.wraps(ensure)
+    def wrapper(db: Session):
+        nonlocal done
+        if done:
+            return
+        with lock:
+            if not done:
+                ensure(db)
+                done = True
+
+    return wrapper
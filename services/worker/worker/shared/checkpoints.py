@@ -0,0 +1,166 @@
+"""
+Stage checkpoints for resumable jobs.
+
+A long job records each completed stage (e.g. "scene_selected",
+"bands_fetched", "indices_written", "stats_saved") with the data the later
+stages need in job_checkpoints. When the same job runs again - an SQS
+redelivery, a Postgres-queue retry, or a FAILED job re-created by a new
+backfill (same job id) - it resumes after the last stage it recorded
+instead of searching STAC and reading every band again.
+
+Large intermediates (the band stack) are stored as .npy objects under
+checkpoints/job=<id>/ in the bucket. Checkpoints are dropped when the job
+completes, so a later rerun of a DONE job starts from scratch.
+"""
+import io
+import json
+from typing import Any, Dict, Optional
+
+import numpy as np
+import structlog
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from worker.config import settings
+
+logger = structlog.get_logger()
+
+# Stages of PROCESS_WEEK / PROCESS_RADAR_WEEK, in pipeline order
+SCENE_SELECTED = "scene_selected"
+RADAR_SAVED = "radar_saved"
+BANDS_FETCHED = "bands_fetched"
+INDICES_WRITTEN = "indices_written"
+STATS_SAVED = "stats_saved"
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def profile_to_json(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Raster profile (CRS / Affine values) in a form save() can store."""
+    data = dict(profile)
+    if data.get("crs") is not None:
+        data["crs"] = data["crs"].to_wkt()
+    if data.get("transform") is not None:
+        data["transform"] = list(data["transform"])[:6]
+    return data
+
+
+def profile_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of profile_to_json()."""
+    from affine import Affine
+    from rasterio.crs import CRS
+
+    profile = dict(data)
+    if profile.get("crs") is not None:
+        profile["crs"] = CRS.from_wkt(profile["crs"])
+    if profile.get("transform") is not None:
+        profile["transform"] = Affine(*profile["transform"])
+    return profile
+
+
+class JobCheckpoints:
+    """
+    Checkpoints of one job (see module docstring). With
+    settings.checkpoints_enabled off, nothing is read or written.
+
+    Args:
+        db: session; save() commits
+        job_id: jobs.id (None = not resumable)
+        s3: S3Client for array artifacts (created on first use)
+    """
+
+    def __init__(self, db: Session, job_id: Optional[str], s3=None):
+        self.db = db
+        self.job_id = job_id
+        self._s3 = s3
+        self.enabled = bool(settings.checkpoints_enabled and job_id)
+        self._stages: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            from worker.shared.aws_clients import S3Client
+            self._s3 = S3Client()
+        return self._s3
+
+    @property
+    def prefix(self) -> str:
+        return f"checkpoints/job={self.job_id}/"
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._stages is None:
+            self._stages = {}
+            if self.enabled:
+                rows = self.db.execute(
+                    text("SELECT stage, data_json FROM job_checkpoints WHERE job_id = :job_id"),
+                    {"job_id": self.job_id},
+                ).fetchall()
+                self._stages = {row[0]: json.loads(row[1]) for row in rows}
+                if self._stages:
+                    logger.info("job_resuming", job_id=self.job_id, stages=sorted(self._stages))
+        return self._stages
+
+    def get(self, stage: str) -> Optional[Dict[str, Any]]:
+        """Data saved with a completed stage, or None."""
+        return self._load().get(stage)
+
+    def save(self, stage: str, data: Dict[str, Any]):
+        """Record a completed stage (commits)."""
+        if not self.enabled:
+            return
+        data_json = json.dumps(data, default=_json_default)
+        self.db.execute(text("""
+            INSERT INTO job_checkpoints (job_id, stage, data_json)
+            VALUES (:job_id, :stage, :data_json)
+            ON CONFLICT (job_id, stage) DO UPDATE
+            SET data_json = EXCLUDED.data_json, created_at = now()
+        """), {"job_id": self.job_id, "stage": stage, "data_json": data_json})
+        self.db.commit()
+        self._load()[stage] = json.loads(data_json)
+        logger.info("job_checkpoint_saved", job_id=self.job_id, stage=stage)
+
+    def put_array(self, name: str, array: np.ndarray) -> Optional[str]:
+        """
+        Store an intermediate array; returns its key, or None if it is over
+        settings.checkpoint_band_stack_max_mb (the stage is then redone).
+        """
+        if not self.enabled or array.nbytes > settings.checkpoint_band_stack_max_mb * 1024 * 1024:
+            return None
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        key = self.prefix + f"{name}.npy"
+        self.s3.upload_bytes(buffer.getvalue(), key, content_type="application/octet-stream")
+        return key
+
+    def get_array(self, key: Optional[str], out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Array stored by put_array() (copied into out if given), or None if it is gone."""
+        if not key:
+            return None
+        body = self.s3.get_bytes(key)
+        if body is None:
+            return None
+        array = np.load(io.BytesIO(body), allow_pickle=False)
+        if out is None:
+            return array
+        np.copyto(out, array)
+        return out
+
+    def clear(self):
+        """Drop the job's checkpoints and artifacts (the job completed)."""
+        if not self.enabled:
+            return
+        has_artifacts = any(data.get("artifact") for data in self._load().values())
+        self.db.execute(text("DELETE FROM job_checkpoints WHERE job_id = :job_id"), {"job_id": self.job_id})
+        self.db.commit()
+        if has_artifacts:
+            try:
+                self.s3.delete_prefix(self.prefix)
+            except Exception as e:
+                logger.warning("checkpoint_artifacts_delete_failed", job_id=self.job_id, error=str(e))
+        self._stages = {}
@@ -0,0 +1,299 @@
+"""
+Bulk job creation and dispatch.
+
+Fan-out jobs (BACKFILL) create many child jobs at once. create_jobs() upserts
+them with multi-row INSERT ... ON CONFLICT statements and enqueue_jobs() sends
+their messages with SendMessageBatch, so N jobs cost about N/10 round trips
+instead of two per job.
+
+Jobs can depend on other jobs of the same batch (NewJob.depends_on): they are
+created WAITING with rows in job_dependencies and are not enqueued. When a
+job reaches a final status, the worker calls release_dependents(), which
+flips the dependents whose upstream jobs are all final to PENDING (FAILED if
+none of them is DONE) and enqueues them - completion drives dispatch, nothing
+polls.
+
+Coalescing: a job whose (tenant_id, job_key) matches a job that is still
+PENDING, WAITING or RUNNING attaches to it instead of being reset and sent
+again (NewJob.coalesced); the worker also skips a message whose job is
+already DONE or being run by another worker (claim_job()). An in-flight job
+that has not been updated for settings.job_coalesce_max_age_seconds and holds
+no live lease is presumed lost (e.g. its message expired) and reset instead.
+"""
+import hashlib
+import json
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from worker.config import settings
+from worker.scheduling import INTERACTIVE, job_priority, priority_class
+
+logger = structlog.get_logger()
+
+# Rows per INSERT statement
+INSERT_CHUNK = 500
+
+
+@dataclass
+class NewJob:
+    tenant_id: str
+    aoi_id: Optional[str]
+    job_type: str
+    job_key: str
+    payload: Dict[str, Any]
+    # job_key of jobs in the same create_jobs() call that must finish first
+    depends_on: List[str] = field(default_factory=list)
+    # Set by create_jobs(): attached to an in-flight job with the same key
+    coalesced: bool = False
+
+
+def job_key(*parts: Any) -> str:
+    """Idempotency key: sha256 of the concatenated parts."""
+    return hashlib.sha256("".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def create_jobs(db: Session, jobs: List[NewJob]) -> List[Tuple[str, NewJob]]:
+    """
+    Upsert jobs as PENDING, or WAITING if they have depends_on, and record
+    their dependencies. A finished (DONE / FAILED) or stale in-flight job with
+    the same key is reset, taking the new job's payload and priority; an
+    in-flight one is kept and the new job marked coalesced.
+    Does not commit.
+
+    Returns:
+        [(job id, job)] in input order, one per distinct (tenant_id, job_key);
+        the id of a coalesced job is the in-flight job's
+    """
+    unique: Dict[Tuple[str, str], NewJob] = {}
+    for job in jobs:
+        # One statement can't upsert the same key twice
+        unique[(str(job.tenant_id), job.job_key)] = job
+    jobs = list(unique.values())
+    for job in jobs:
+        for upstream in job.depends_on:
+            if (str(job.tenant_id), upstream) not in unique:
+                raise ValueError(f"{job.job_type} depends on job_key {upstream} outside this batch")
+
+    ids: Dict[Tuple[str, str], str] = {}
+    for start in range(0, len(jobs), INSERT_CHUNK):
+        chunk = jobs[start:start + INSERT_CHUNK]
+        values, params = [], {"coalesce_max_age": settings.job_coalesce_max_age_seconds}
+        for i, job in enumerate(chunk):
+            status = "WAITING" if job.depends_on else "PENDING"
+            values.append(
+                f"(:tenant_id_{i}, :aoi_id_{i}, :job_type_{i}, :job_key_{i}, '{status}', "
+                f"{job_priority(job.payload)}, :payload_{i})"
+            )
+            params.update({
+                f"tenant_id_{i}": job.tenant_id,
+                f"aoi_id_{i}": job.aoi_id,
+                f"job_type_{i}": job.job_type,
+                f"job_key_{i}": job.job_key,
+                f"payload_{i}": json.dumps(job.payload),
+            })
+        sql = text(f"""
+            INSERT INTO jobs (tenant_id, aoi_id, job_type, job_key, status, priority, payload_json)
+            VALUES {', '.join(values)}
+            ON CONFLICT (tenant_id, job_key) DO UPDATE
+            SET status = EXCLUDED.status, priority = EXCLUDED.priority,
+                payload_json = EXCLUDED.payload_json,
+                attempts = 0, lease_expires_at = NULL, leased_by = NULL, updated_at = now()
+            WHERE jobs.status NOT IN ('PENDING', 'WAITING', 'RUNNING')
+               OR (jobs.updated_at < now() - make_interval(secs => :coalesce_max_age)
+                   AND (jobs.lease_expires_at IS NULL OR jobs.lease_expires_at < now()))
+            RETURNING id, tenant_id, job_key
+        """)
+        for row in db.execute(sql, params).fetchall():
+            ids[(str(row[1]), row[2])] = str(row[0])
+
+        # Rows left alone by the upsert are in flight: attach to them
+        attached = [job for job in chunk if (str(job.tenant_id), job.job_key) not in ids]
+        if attached:
+            rows = db.execute(text("""
+                SELECT id, tenant_id, job_key FROM jobs
+                WHERE tenant_id = ANY(CAST(:tenant_ids AS uuid[]))
+                  AND job_key = ANY(CAST(:job_keys AS text[]))
+            """), {
+                "tenant_ids": sorted({str(job.tenant_id) for job in attached}),
+                "job_keys": [job.job_key for job in attached],
+            }).fetchall()
+            for row in rows:
+                ids.setdefault((str(row[1]), row[2]), str(row[0]))
+            for job in attached:
+                job.coalesced = True
+            logger.info("jobs_coalesced", count=len(attached))
+
+    edges = []
+    for job in jobs:
+        if job.coalesced:
+            continue  # Already has its dependencies (or is running)
+        tenant_id = str(job.tenant_id)
+        for upstream in job.depends_on:
+            edges.append((ids[(tenant_id, job.job_key)], ids[(tenant_id, upstream)]))
+    for start in range(0, len(edges), INSERT_CHUNK):
+        chunk = edges[start:start + INSERT_CHUNK]
+        values, params = [], {}
+        for i, (job_id, upstream_id) in enumerate(chunk):
+            values.append(f"(:job_id_{i}, :depends_on_{i})")
+            params.update({f"job_id_{i}": job_id, f"depends_on_{i}": upstream_id})
+        db.execute(text(f"""
+            INSERT INTO job_dependencies (job_id, depends_on_job_id)
+            VALUES {', '.join(values)}
+            ON CONFLICT DO NOTHING
+        """), params)
+
+    return [(ids[(str(job.tenant_id), job.job_key)], job) for job in jobs]
+
+
+def get_queue_client():
+    """Queue backend of settings.queue_backend (SQSClient or PostgresJobQueue)."""
+    if settings.queue_backend == "postgres":
+        from worker.shared.pg_queue import PostgresJobQueue
+        return PostgresJobQueue()
+    from worker.shared.aws_clients import SQSClient
+    return SQSClient()
+
+
+def enqueue_jobs(sqs, created: List[Tuple[str, NewJob]], queue_url: Optional[str] = None):
+    """
+    Send the worker message of each created job (SendMessageBatch). Jobs
+    with depends_on are skipped (release_dependents() enqueues them), and so
+    are coalesced ones. Interactive jobs go to the high-priority queue unless
+    queue_url is given.
+    """
+    created = [(job_id, job) for job_id, job in created if not job.depends_on and not job.coalesced]
+    if not created:
+        return
+    by_queue: Dict[Optional[str], List[Tuple[str, NewJob]]] = {}
+    for job_id, job in created:
+        target = queue_url
+        if target is None and priority_class(job.payload) == INTERACTIVE:
+            target = getattr(sqs, "queue_high_url", None)
+        by_queue.setdefault(target, []).append((job_id, job))
+    for target, jobs in by_queue.items():
+        sqs.send_message_batch(
+            [
+                {"job_id": job_id, "job_type": job.job_type, "payload": job.payload}
+                for job_id, job in jobs
+            ],
+            queue_url=target,
+        )
+    logger.info("jobs_enqueued", count=len(created))
+
+
+# Statuses after which a job never runs again (a failed attempt that will be
+# retried leaves the job RUNNING, see worker.main.process_message())
+FINAL_STATUSES = ("DONE", "FAILED", "CANCELLED")
+
+
+def _release(db: Session, candidates_sql: str, params: Dict[str, Any]) -> List[Tuple[str, NewJob]]:
+    final = ", ".join(f"'{s}'" for s in FINAL_STATUSES)
+    sql = text(f"""
+        UPDATE jobs j
+        SET status = CASE WHEN ready.any_done THEN 'PENDING' ELSE 'FAILED' END,
+            error_message = CASE WHEN ready.any_done THEN j.error_message ELSE 'Upstream jobs failed' END,
+            updated_at = now()
+        FROM (
+            SELECT d.job_id, bool_or(upstream.status = 'DONE') AS any_done
+            FROM job_dependencies d
+            JOIN jobs upstream ON upstream.id = d.depends_on_job_id
+            WHERE d.job_id IN ({candidates_sql})
+            GROUP BY d.job_id
+            HAVING bool_and(upstream.status IN ({final}))
+        ) ready
+        WHERE j.id = ready.job_id AND j.status = 'WAITING'
+        RETURNING j.id, j.tenant_id, j.aoi_id, j.job_type, j.job_key, j.payload_json, j.status
+    """)
+    released, failed = [], []
+    for row in db.execute(sql, params).fetchall():
+        if row[6] == "FAILED":
+            failed.append(str(row[0]))
+            continue
+        payload = row[5] if isinstance(row[5], dict) else json.loads(row[5] or "{}")
+        released.append((str(row[0]), NewJob(
+            str(row[1]), str(row[2]) if row[2] else None, row[3], row[4], payload
+        )))
+    if failed:
+        logger.info("dependent_jobs_failed", job_ids=failed)
+        # Their own dependents may now be ready (or fail too)
+        released += _release(
+            db,
+            "SELECT job_id FROM job_dependencies WHERE depends_on_job_id = ANY(CAST(:failed_ids AS uuid[]))",
+            {"failed_ids": failed},
+        )
+    return released
+
+
+def release_dependents(db: Session, job_id: str) -> List[Tuple[str, NewJob]]:
+    """
+    Update the WAITING dependents of a job that reached a final status
+    (FINAL_STATUSES) once all their upstream jobs are final: to PENDING if at
+    least one of them is DONE, else to FAILED ("Upstream jobs failed"), which
+    in turn releases their own dependents. A range job (e.g. ALERTS_WEEK over
+    a backfill's weeks) therefore runs for the weeks that were processed
+    instead of waiting forever on one failed week.
+
+    Does not commit: enqueue the returned (PENDING) jobs with enqueue_jobs(),
+    then commit, so a failed send leaves them WAITING for a retry.
+
+    Call after the job's own final status is committed. When the last two
+    upstream jobs of a dependent finish together, at least one of them sees
+    both final, and the row lock on the dependent lets only one release it.
+    """
+    released = _release(
+        db, "SELECT job_id FROM job_dependencies WHERE depends_on_job_id = :job_id", {"job_id": job_id}
+    )
+    if released:
+        logger.info("dependent_jobs_released", job_id=job_id, count=len(released))
+    return released
+
+
+def release_ready(db: Session, job_ids: List[str]) -> List[Tuple[str, NewJob]]:
+    """
+    release_dependents() for newly created WAITING jobs: call after their
+    rows are committed. An upstream job they attached to may have finished
+    before they were visible to its release.
+    """
+    if not job_ids:
+        return []
+    return _release(db, "SELECT unnest(CAST(:job_ids AS uuid[]))", {"job_ids": list(job_ids)})
+
+
+@contextmanager
+def claim_job(db: Session, job_id: Optional[str]) -> Iterator[bool]:
+    """
+    Claim-time coalescing: yields False if the job is already DONE or
+    CANCELLED (a duplicate delivery, or a message sent before the job it
+    duplicates finished)
+    or another worker is running it right now, True otherwise.
+
+    "Running right now" is a Postgres advisory lock on the job id, held on a
+    dedicated autocommit connection for the duration of the with block, so it
+    goes away with a crashed worker.
+    """
+    if not job_id:
+        yield True
+        return
+    lock_key = f"job:{job_id}"
+    with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        locked = conn.execute(
+            text("SELECT pg_try_advisory_lock(hashtextextended(:key, 0))"), {"key": lock_key}
+        ).scalar()
+        if not locked:
+            logger.info("job_coalesced_running", job_id=job_id)
+            yield False
+            return
+        try:
+            status = conn.execute(text("SELECT status FROM jobs WHERE id = :job_id"), {"job_id": job_id}).scalar()
+            if status in ("DONE", "CANCELLED"):
+                logger.info("job_coalesced_done", job_id=job_id)
+                yield False
+            else:
+                yield True
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(hashtextextended(:key, 0))"), {"key": lock_key})
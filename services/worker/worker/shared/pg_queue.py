@@ -0,0 +1,259 @@
+"""
+Postgres job queue backend (QUEUE_BACKEND=postgres).
+
+Every job already has a row in `jobs`, so instead of also sending it to SQS
+the worker can claim PENDING rows directly:
+
+    SELECT ... ORDER BY priority DESC, <tenant turn>, created_at
+    LIMIT n FOR UPDATE SKIP LOCKED
+
+Concurrent workers skip each other's locked rows, so a claim never blocks
+and never hands the same job to two workers. A claimed job gets a lease
+(lease_expires_at) that the runtime heartbeat extends like an SQS visibility
+timeout; when the worker finishes the message the lease is cleared.
+
+Retries: a job whose lease ran out without being finished (worker crashed, or
+the handler failed and the job is still RUNNING, see process_message()) is
+claimed again once
+settings.queue_retry_backoff_seconds * 2^(attempts - 1) have passed since
+the lease expired, up to settings.sqs_max_receive_count attempts - the same
+limit after which SQS moves a message to the DLQ. Jobs that exhaust their
+attempts while RUNNING are marked FAILED and their dependents released
+(release_dependents()).
+
+PostgresJobQueue has the interface of SQSClient that WorkerRuntime and
+enqueue_jobs() use. Messages carry a receipt handle of "<job id>:<attempt>",
+so a stale worker can't extend or finish a lease that was re-claimed.
+Sending is a no-op: the job row is the message.
+"""
+import json
+import os
+import socket
+import time
+from typing import Any, Dict, List, Tuple
+
+import structlog
+from sqlalchemy import text
+
+from worker.config import settings
+from worker.shared.job_queue import release_dependents
+
+logger = structlog.get_logger()
+
+DEFAULT_QUEUE = "postgres://jobs"
+# Receives from the "high" queue only claim jobs with priority > 0
+HIGH_PRIORITY_QUEUE = "postgres://jobs?priority=high"
+
+def _retryable(t: str) -> str:
+    """Rows of jobs alias t whose lease expired long enough ago to be claimed again."""
+    return f"""
+        {t}.status IN ('RUNNING', 'FAILED')
+        AND {t}.lease_expires_at IS NOT NULL
+        AND {t}.attempts < :max_attempts
+        AND {t}.lease_expires_at
+            + make_interval(secs => :retry_backoff * power(2, greatest({t}.attempts - 1, 0)))
+            <= now()
+    """
+
+
+def _claimable(t: str) -> str:
+    """Rows of jobs alias t that may be claimed: PENDING, or a retry whose lease expired long enough ago."""
+    return f"""
+        {t}.priority >= :min_priority
+        AND ({t}.status = 'PENDING' OR ({_retryable(t)}))
+    """
+
+
+# Within a priority, tenants take turns (each tenant's oldest job, then each
+# one's second oldest, ...), so one tenant's backlog can't fill every claim.
+# Only the first :depth claimable jobs of each tenant (idx_jobs_tenant_claim)
+# and the first :depth retries (idx_jobs_lease_expires) are ranked, so a poll
+# costs O(tenants * depth) whatever the backlog.
+# The predicate is repeated on the locked rows: a row another worker claimed
+# after the ranking snapshot is re-checked there and skipped.
+_CLAIM_SQL = text(f"""
+    WITH candidates AS (
+        SELECT p.id, p.tenant_id, p.priority, p.created_at
+        FROM tenants t
+        CROSS JOIN LATERAL (
+            SELECT c.id, c.tenant_id, c.priority, c.created_at
+            FROM jobs c
+            WHERE c.tenant_id = t.id AND c.status = 'PENDING' AND c.priority >= :min_priority
+            ORDER BY c.priority DESC, c.created_at
+            LIMIT :depth
+        ) p
+        UNION ALL
+        SELECT r.id, r.tenant_id, r.priority, r.created_at
+        FROM (
+            SELECT c.id, c.tenant_id, c.priority, c.created_at
+            FROM jobs c
+            WHERE c.priority >= :min_priority AND {_retryable("c")}
+            ORDER BY c.lease_expires_at
+            LIMIT :depth
+        ) r
+    ),
+    ranked AS (
+        SELECT c.id, c.priority, c.created_at,
+               row_number() OVER (PARTITION BY c.priority, c.tenant_id ORDER BY c.created_at) AS tenant_turn
+        FROM candidates c
+    ),
+    next AS (
+        SELECT l.id, l.updated_at AS enqueued_at
+        FROM jobs l
+        JOIN ranked ON ranked.id = l.id
+        WHERE {_claimable("l")}
+        ORDER BY ranked.priority DESC, ranked.tenant_turn, ranked.created_at
+        LIMIT :limit
+        FOR UPDATE OF l SKIP LOCKED
+    )
+    UPDATE jobs j
+    SET status = 'RUNNING',
+        attempts = j.attempts + 1,
+        lease_expires_at = now() + make_interval(secs => :lease_seconds),
+        leased_by = :worker,
+        updated_at = now()
+    FROM next
+    WHERE j.id = next.id
+    RETURNING j.id, j.job_type, j.payload_json, j.attempts,
+              (extract(epoch FROM next.enqueued_at) * 1000)::bigint AS enqueued_ms
+""")
+
+# Jobs that used up their attempts while RUNNING (the worker died each time)
+_EXPIRE_SQL = text("""
+    UPDATE jobs
+    SET status = 'FAILED',
+        error_message = 'Lease expired after ' || attempts || ' attempts',
+        lease_expires_at = NULL,
+        updated_at = now()
+    WHERE status = 'RUNNING'
+      AND lease_expires_at <= now()
+      AND attempts >= :max_attempts
+    RETURNING id
+""")
+
+
+def _parse_handle(handle: str) -> Tuple[str, int]:
+    job_id, attempt = handle.rsplit(":", 1)
+    return job_id, int(attempt)
+
+
+class PostgresJobQueue:
+    """
+    Job queue on the jobs table (see module docstring).
+
+    Args:
+        session_factory: callable returning a SQLAlchemy session (closed after use)
+    """
+
+    def __init__(self, session_factory=None):
+        if session_factory is None:
+            from worker.database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.queue_url = DEFAULT_QUEUE
+        self.queue_high_url = HIGH_PRIORITY_QUEUE
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        logger.info("postgres_job_queue_initialized", worker=self.worker_id)
+
+    def _claim(self, max_messages: int, min_priority: int) -> List[dict]:
+        db = self.session_factory()
+        try:
+            expired = db.execute(_EXPIRE_SQL, {"max_attempts": settings.sqs_max_receive_count}).fetchall()
+            for (job_id,) in expired:
+                # PENDING rows are claimed directly: nothing to enqueue
+                release_dependents(db, str(job_id))
+            rows = db.execute(_CLAIM_SQL, {
+                "min_priority": min_priority,
+                "max_attempts": settings.sqs_max_receive_count,
+                "retry_backoff": settings.queue_retry_backoff_seconds,
+                "limit": max_messages,
+                "depth": max(settings.queue_claim_depth, max_messages),
+                "lease_seconds": settings.sqs_visibility_timeout_seconds,
+                "worker": self.worker_id,
+            }).fetchall()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        messages = []
+        for job_id, job_type, payload, attempt, enqueued_ms in rows:
+            if not isinstance(payload, dict):
+                payload = json.loads(payload or "{}")
+            messages.append({
+                "MessageId": str(job_id),
+                "ReceiptHandle": f"{job_id}:{attempt}",
+                "Body": json.dumps({"job_id": str(job_id), "job_type": job_type, "payload": payload}),
+                # SentTimestamp: when the job became claimable (for queue wait metrics)
+                "Attributes": {"ApproximateReceiveCount": str(attempt), "SentTimestamp": str(enqueued_ms)},
+            })
+        return messages
+
+    def receive_messages(self, queue_url=None, max_messages=1, wait_time=20):
+        """
+        Claim up to max_messages jobs, polling every
+        settings.queue_poll_interval_seconds for up to wait_time seconds.
+        The high priority queue is claimed once without waiting.
+        """
+        if queue_url == self.queue_high_url:
+            return self._claim(max_messages, min_priority=1)
+
+        deadline = time.monotonic() + wait_time
+        while True:
+            messages = self._claim(max_messages, min_priority=-(2 ** 31))
+            if messages or time.monotonic() >= deadline:
+                return messages
+            time.sleep(min(settings.queue_poll_interval_seconds, max(0.0, deadline - time.monotonic())))
+
+    def _update_leases(self, receipt_handles: List[str], set_sql: str, params: Dict[str, Any]) -> List[str]:
+        """Apply set_sql to the jobs still held by these handles; returns the handles that aren't."""
+        if not receipt_handles:
+            return []
+        parsed = [_parse_handle(h) for h in receipt_handles]
+        db = self.session_factory()
+        try:
+            rows = db.execute(text(f"""
+                UPDATE jobs j
+                SET {set_sql}
+                FROM unnest(CAST(:ids AS uuid[]), CAST(:attempts AS int[])) AS held(id, attempt)
+                WHERE j.id = held.id AND j.attempts = held.attempt AND j.lease_expires_at IS NOT NULL
+                RETURNING j.id, j.attempts
+            """), dict(params, ids=[p[0] for p in parsed], attempts=[p[1] for p in parsed])).fetchall()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        held = {f"{row[0]}:{row[1]}" for row in rows}
+        return [h for h in receipt_handles if h not in held]
+
+    def change_message_visibility_batch(self, receipt_handles, visibility_timeout, queue_url=None):
+        """
+        Extend the leases of claimed jobs.
+
+        Returns:
+            receipt handles whose lease is gone (finished or re-claimed)
+        """
+        return self._update_leases(
+            receipt_handles,
+            "lease_expires_at = now() + make_interval(secs => :timeout)",
+            {"timeout": visibility_timeout},
+        )
+
+    def delete_message_batch(self, receipt_handles, queue_url=None):
+        """
+        Finish claimed jobs: clear their lease so they are never re-claimed.
+
+        Returns:
+            receipt handles that were no longer held
+        """
+        failed = self._update_leases(receipt_handles, "lease_expires_at = NULL, leased_by = NULL", {})
+        logger.info("messages_deleted", count=len(receipt_handles) - len(failed))
+        return failed
+
+    def send_message_batch(self, message_bodies, queue_url=None):
+        """No-op: PENDING job rows are claimed directly."""
+        logger.debug("postgres_queue_send_skipped", count=len(message_bodies))
@@ -17,6 +17,15 @@ def get_week_date_range(year: int, week: int):
     # Let's check usage. client.search_scenes takes datetime.
     return start_date, end_date
 
+def payload_weeks(payload: dict):
+    """
+    (year, week) pairs of a weekly job: {"year", "week"} for one week, or
+    {"weeks": [[year, week], ...]} for a range job, in chronological order.
+    """
+    if payload.get("weeks"):
+        return sorted((int(year), int(week)) for year, week in payload["weeks"])
+    return [(int(payload["year"]), int(payload["week"]))]
+
 def get_aoi_geometry(aoi_id: str, db: Session):
     """Get AOI geometry as dict (GeoJSON)"""
     # Fetch geometry from DB. Assuming it's in WKT or GeoJSON column
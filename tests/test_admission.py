@@ -0,0 +1,119 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker import admission
+from worker.admission import (
+    MB,
+    MemoryAdmission,
+    estimate_job_memory,
+    estimate_out_of_core_memory,
+    resolve_processing_mode,
+)
+from worker.runtime import WorkerRuntime
+
+
+def _message(i, size_mb, job_type="PROCESS_WEEK"):
+    body = {"job_id": str(i), "job_type": job_type, "payload": {"size_mb": size_mb}}
+    return {"MessageId": str(i), "ReceiptHandle": str(i), "Body": json.dumps(body)}
+
+
+class DummySQS:
+    queue_url = "default"
+    queue_high_url = "high"
+
+    def __init__(self, messages):
+        self.pending = list(messages)
+
+    def receive_messages(self, queue_url=None, max_messages=1, wait_time=20):
+        if queue_url == self.queue_high_url:
+            return []
+        batch, self.pending = self.pending[:max_messages], self.pending[max_messages:]
+        if not batch:
+            time.sleep(0.01)
+        return batch
+
+
+def test_estimate_scales_with_aoi_area(monkeypatch):
+    import worker.shared.utils as utils
+
+    square = {"type": "Polygon", "coordinates": [[[0, 0], [0.01, 0], [0.01, 0.01], [0, 0.01], [0, 0]]]}
+    monkeypatch.setattr(utils, "get_aoi_geometry", lambda aoi_id, db: square)
+    monkeypatch.setattr(admission.settings, "job_base_memory_mb", 100)
+    monkeypatch.setattr(admission.settings, "use_dynamic_tiling", False)
+
+    week = estimate_job_memory("PROCESS_WEEK", {"aoi_id": "a"}, None)
+    assert week == 100 * MB + 112 * 112 * 120
+    assert estimate_job_memory("ALERTS_WEEK", {"aoi_id": "a"}, None) == 100 * MB
+
+
+def test_dynamic_tiling_week_is_charged_the_base_and_stays_in_memory(monkeypatch):
+    import worker.shared.utils as utils
+
+    def no_geometry(aoi_id, db):
+        raise AssertionError("dynamic-tiling weeks are not sized from the AOI")
+
+    monkeypatch.setattr(utils, "get_aoi_geometry", no_geometry)
+    monkeypatch.setattr(admission.settings, "job_base_memory_mb", 100)
+    monkeypatch.setattr(admission.settings, "use_dynamic_tiling", True)
+    assert estimate_job_memory("PROCESS_WEEK", {"aoi_id": "a"}, None) == 100 * MB
+
+    controller = MemoryAdmission(1000 * MB, lambda job_type, payload: payload["size_mb"] * MB)
+    message, reservation = controller.plan(_message(1, 5000))
+    assert resolve_processing_mode(json.loads(message["Body"])["payload"]) == "in_memory"
+    assert reservation == 1000 * MB
+
+
+def test_oversized_job_is_routed_out_of_core(monkeypatch):
+    monkeypatch.setattr(admission.settings, "use_dynamic_tiling", False)
+    controller = MemoryAdmission(1000 * MB, lambda job_type, payload: payload["size_mb"] * MB)
+
+    message, reservation = controller.plan(_message(1, 5000))
+    payload = json.loads(message["Body"])["payload"]
+    assert resolve_processing_mode(payload) == "out_of_core"
+    assert reservation == estimate_out_of_core_memory("PROCESS_WEEK") < 1000 * MB
+
+    # No block-wise path for this job type: it runs alone, in memory
+    message, reservation = controller.plan(_message(3, 5000, "PROCESS_TOPOGRAPHY"))
+    assert resolve_processing_mode(json.loads(message["Body"])["payload"]) == "in_memory"
+    assert reservation == 1000 * MB
+
+    message, reservation = controller.plan(_message(2, 300))
+    assert resolve_processing_mode(json.loads(message["Body"])["payload"]) == "in_memory"
+    assert reservation == 300 * MB
+
+
+def test_runtime_admits_jobs_within_memory_budget():
+    sizes = [500, 300, 900, 150]
+    messages = [_message(i, size) for i, size in enumerate(sizes)]
+    controller = MemoryAdmission(1000 * MB, lambda job_type, payload: payload["size_mb"] * MB)
+    lock = threading.Lock()
+    running, peak, started = [0], [0], []
+
+    def process_one(message, queue_url):
+        size = json.loads(message["Body"])["payload"]["size_mb"]
+        with lock:
+            started.append(message["MessageId"])
+            running[0] += size
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= size
+            if len(started) == len(messages) and running[0] == 0:
+                runtime.stop()
+
+    runtime = WorkerRuntime(DummySQS(messages), process_one, concurrency=5, admission=controller)
+    asyncio.run(asyncio.wait_for(runtime.run(), 10))
+
+    assert peak[0] <= 1000
+    # The 150 MB job would fit next to the first two, but doesn't overtake the 900 MB one
+    assert started == ["0", "1", "2", "3"] or started == ["1", "0", "2", "3"]
+    assert controller.reserved == 0
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.pipeline.asset_cache import AssetCache
+
+
+def test_get_or_fill_fills_once_for_concurrent_callers(tmp_path):
+    cache = AssetCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    fills = []
+
+    def fill(path):
+        fills.append(path)
+        time.sleep(0.05)
+        with open(path, "wb") as f:
+            f.write(b"band-data")
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        paths = list(pool.map(lambda _: cache.get_or_fill("https://example.com/B04.tif", fill), range(4)))
+
+    assert len(fills) == 1
+    assert len(set(paths)) == 1
+    with open(paths[0], "rb") as f:
+        assert f.read() == b"band-data"
+
+
+def test_byte_range_is_part_of_the_key(tmp_path):
+    cache = AssetCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+
+    def fill_with(content):
+        def fill(path):
+            with open(path, "wb") as f:
+                f.write(content)
+        return fill
+
+    a = cache.get_or_fill("https://example.com/B04.tif", fill_with(b"a"), byte_range="window=0,0,256,256")
+    b = cache.get_or_fill("https://example.com/B04.tif", fill_with(b"b"), byte_range="window=256,0,256,256")
+
+    assert a != b
+
+
+def test_evict_removes_least_recently_used_first(tmp_path, monkeypatch):
+    from worker.pipeline import asset_cache
+
+    monkeypatch.setattr(asset_cache, "EVICTION_GRACE_SECONDS", 0)
+    cache = AssetCache(str(tmp_path), max_bytes=2500)
+
+    def fill(path):
+        with open(path, "wb") as f:
+            f.write(b"x" * 1000)
+
+    old = cache.get_or_fill("https://example.com/old.tif", fill)
+    recent = cache.get_or_fill("https://example.com/recent.tif", fill)
+    os.utime(old, (time.time() - 100, time.time() - 100))
+    os.utime(recent, (time.time() - 50, time.time() - 50))
+
+    newest = cache.get_or_fill("https://example.com/newest.tif", fill)
+
+    assert not os.path.exists(old)
+    assert os.path.exists(recent)
+    assert os.path.exists(newest)
+    # Evicted entries take their lock file with them
+    locks = sorted(name for name in os.listdir(tmp_path) if name.endswith(".lock") and name != ".evict.lock")
+    assert locks == sorted(os.path.basename(p)[:-len(".tif")] + ".lock" for p in (recent, newest))
@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.shared.aws_clients import S3Client
+
+
+class BotoS3Stub:
+    def __init__(self):
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.calls.append(("put_object", Key))
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None):
+        self.calls.append(("upload_fileobj", Key, Config.multipart_chunksize, ExtraArgs))
+
+
+def _s3(boto):
+    s3 = S3Client.__new__(S3Client)
+    s3.client, s3.bucket = boto, "b"
+    return s3
+
+
+def test_large_objects_are_uploaded_multipart(monkeypatch):
+    monkeypatch.setattr("worker.shared.aws_clients.settings.s3_multipart_threshold_mb", 1)
+    monkeypatch.setattr("worker.shared.aws_clients.settings.s3_multipart_chunk_mb", 8)
+    boto = BotoS3Stub()
+
+    _s3(boto).upload_bytes(b"x" * 1024, "small.tif")
+    _s3(boto).upload_bytes(b"x" * 2 * 1024 * 1024, "large.tif")
+
+    assert boto.calls == [
+        ("put_object", "small.tif"),
+        ("upload_fileobj", "large.tif", 8 * 1024 * 1024, {"ContentType": "image/tiff"}),
+    ]
+
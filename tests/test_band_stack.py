@@ -0,0 +1,69 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform_geom
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.pipeline.band_stack import AOIGrid, read_band_stack, read_cloud_mask
+from worker.pipeline.stac_client import STACClient
+
+CRS = "EPSG:32722"
+
+
+def _write(path, data, res):
+    with rasterio.open(
+        path, "w", driver="GTiff", height=data.shape[0], width=data.shape[1], count=1,
+        dtype=data.dtype, crs=CRS, transform=from_origin(500000, 7000000, res, res), tiled=True,
+    ) as dst:
+        dst.write(data, 1)
+    return str(path)
+
+
+def _client(monkeypatch):
+    from worker.pipeline import stac_client
+
+    monkeypatch.setattr(stac_client.settings, "asset_cache_enabled", False)
+    client = STACClient.__new__(STACClient)
+    client._sign_href = lambda href: href
+    return client
+
+
+def test_read_band_stack_aligns_20m_bands_on_10m_grid(tmp_path, monkeypatch):
+    client = _client(monkeypatch)
+    red = np.arange(400 * 400, dtype=np.uint16).reshape(400, 400)
+    rededge = np.arange(200 * 200, dtype=np.uint16).reshape(200, 200)
+    scl = np.full((200, 200), 4, dtype=np.uint8)
+    scl[50:60, 50:60] = 9
+    assets = {
+        "red": _write(tmp_path / "red.tif", red, 10),
+        "rededge": _write(tmp_path / "rededge.tif", rededge, 20),
+        "scl": _write(tmp_path / "scl.tif", scl, 20),
+        "blue": None,
+    }
+    aoi = transform_geom(CRS, "EPSG:4326", {
+        "type": "Polygon",
+        "coordinates": [[[501000, 6998000], [502000, 6998000], [502000, 6999000], [501000, 6999000], [501000, 6998000]]],
+    })
+
+    grid = AOIGrid.from_header(client.read_header(assets["red"]), aoi)
+    stack, band_index = asyncio.run(read_band_stack(client, assets, ["red", "rededge", "blue"], grid))
+    clouds = asyncio.run(read_cloud_mask(client, assets["scl"], grid))
+
+    assert stack.dtype == np.float32
+    assert band_index == {"red": 0, "rededge": 1}
+    rows, cols = slice(100, 100 + grid.height), slice(100, 100 + grid.width)
+    np.testing.assert_array_equal(stack[0], red[rows, cols])
+    # Each 20m pixel covers 2x2 10m pixels
+    upsampled = np.repeat(np.repeat(rededge, 2, axis=0), 2, axis=1)
+    np.testing.assert_array_equal(stack[1], upsampled[rows, cols])
+    assert clouds.shape == grid.shape
+    assert clouds[0:20, 0:20].all() and not clouds[20:, 20:].any()
+    assert grid.inside_mask().all()
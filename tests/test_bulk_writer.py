@@ -0,0 +1,152 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.shared.bulk_writer import UpsertTarget, once_per_process, upsert_rows
+
+TARGET = UpsertTarget(
+    table="derived_weather_daily",
+    columns=("tenant_id", "aoi_id", "date", "temp_max", "note"),
+    key=("tenant_id", "aoi_id", "date"),
+    touch_updated_at=True,
+    casts={"note": "jsonb"},
+)
+
+
+class Psycopg3Cursor:
+    def __init__(self, db):
+        self.db = db
+
+    def copy(self, sql):
+        db = self.db
+
+        class Copy:
+            def __enter__(self):
+                return self
+
+            def write(self, data):
+                db.copied.append((sql, data))
+
+            def __exit__(self, *exc):
+                return False
+
+        return Copy()
+
+    def close(self):
+        pass
+
+
+class Psycopg2Cursor:
+    def __init__(self, db):
+        self.db = db
+
+    def copy_expert(self, sql, file):
+        self.db.copied.append((sql, file.read()))
+
+    def close(self):
+        pass
+
+
+class DummyDB:
+    def __init__(self, cursor_class=Psycopg3Cursor):
+        self.sql = []
+        self.params = []
+        self.copied = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.cursor_class = cursor_class
+
+    def execute(self, sql, params=None):
+        self.sql.append(" ".join(str(sql).split()))
+        self.params.append(params)
+
+    def connection(self):
+        db = self
+
+        class Connection:
+            class connection:
+                @staticmethod
+                def cursor():
+                    return db.cursor_class(db)
+
+        return Connection()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def _row(date, temp, **extra):
+    return dict({"tenant_id": "t", "aoi_id": "a", "date": date, "temp_max": temp}, **extra)
+
+
+def test_small_batches_are_one_values_upsert_keeping_the_last_row_per_key(monkeypatch):
+    monkeypatch.setattr("worker.shared.bulk_writer.settings.bulk_copy_min_rows", 50)
+    db = DummyDB()
+
+    written = upsert_rows(db, TARGET, [_row("2024-01-01", 1.0), _row("2024-01-02", 2.0), _row("2024-01-01", 3.0)])
+
+    assert written == 2 and db.commits == 1 and db.copied == []
+    assert len(db.sql) == 1
+    assert "VALUES (:tenant_id_0, :aoi_id_0, :date_0, :temp_max_0, CAST(:note_0 AS jsonb))," in db.sql[0]
+    assert db.sql[0].endswith(
+        "ON CONFLICT (tenant_id, aoi_id, date) DO UPDATE SET temp_max = EXCLUDED.temp_max, "
+        "note = EXCLUDED.note, updated_at = now()"
+    )
+    assert (db.params[0]["temp_max_0"], db.params[0]["temp_max_1"], db.params[0]["note_1"]) == (3.0, 2.0, None)
+
+
+@pytest.mark.parametrize("cursor_class", [Psycopg3Cursor, Psycopg2Cursor])
+def test_large_batches_are_copied_into_a_staging_table_and_merged_once(monkeypatch, cursor_class):
+    monkeypatch.setattr("worker.shared.bulk_writer.settings.bulk_copy_min_rows", 2)
+    db = DummyDB(cursor_class)
+
+    rows = [
+        _row("2024-01-01", None, note={"src": "a\tb"}),
+        _row("2024-01-02", float("nan"), note="back\\slash\nline"),
+        _row("2024-01-03", True),
+    ]
+    assert upsert_rows(db, TARGET, rows) == 3
+
+    assert db.sql[:2] == [
+        "DROP TABLE IF EXISTS pg_temp._bulk_derived_weather_daily",
+        "CREATE TEMP TABLE _bulk_derived_weather_daily ON COMMIT DROP AS "
+        "SELECT tenant_id, aoi_id, date, temp_max, note FROM derived_weather_daily WITH NO DATA",
+    ]
+    copy_sql, data = db.copied[0]
+    assert copy_sql == "COPY _bulk_derived_weather_daily (tenant_id, aoi_id, date, temp_max, note) FROM STDIN"
+    assert data.split("\n") == [
+        't\ta\t2024-01-01\t\\N\t{"src": "a\\\\tb"}',
+        "t\ta\t2024-01-02\tNaN\tback\\\\slash\\nline",
+        "t\ta\t2024-01-03\tt\t\\N",
+        "",
+    ]
+    assert db.sql[2].startswith(
+        "INSERT INTO derived_weather_daily (tenant_id, aoi_id, date, temp_max, note) "
+        "SELECT tenant_id, aoi_id, date, temp_max, note FROM _bulk_derived_weather_daily ON CONFLICT"
+    )
+    assert len(db.sql) == 3 and db.commits == 1
+
+
+def test_schema_helpers_run_once_per_process_after_succeeding():
+    calls = []
+
+    @once_per_process
+    def ensure_table(db):
+        calls.append(db)
+        if len(calls) == 1:
+            raise RuntimeError("connection lost")
+
+    with pytest.raises(RuntimeError):
+        ensure_table("db-1")
+    ensure_table("db-2")
+    ensure_table("db-3")
+    assert calls == ["db-1", "db-2"]
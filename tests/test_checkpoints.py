@@ -0,0 +1,188 @@
+import json
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.shared.checkpoints import (
+    BANDS_FETCHED, SCENE_SELECTED, JobCheckpoints, profile_from_json, profile_to_json,
+)
+
+
+class DummyResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class DummyDB:
+    """job_checkpoints of one job."""
+
+    def __init__(self):
+        self.rows = {}
+        self.commits = 0
+
+    def execute(self, sql, params):
+        sql = str(sql).strip()
+        if sql.startswith("SELECT"):
+            return DummyResult(list(self.rows.items()))
+        if sql.startswith("INSERT"):
+            self.rows[params["stage"]] = params["data_json"]
+        elif sql.startswith("DELETE"):
+            self.rows.clear()
+        return DummyResult([])
+
+    def commit(self):
+        self.commits += 1
+
+
+class DummyS3:
+    def __init__(self):
+        self.objects = {}
+
+    def upload_bytes(self, body, s3_key, content_type=None):
+        self.objects[s3_key] = body
+        return f"s3://b/{s3_key}"
+
+    def get_bytes(self, s3_key):
+        return self.objects.get(s3_key)
+
+    def delete_prefix(self, prefix):
+        for key in [k for k in self.objects if k.startswith(prefix)]:
+            del self.objects[key]
+
+
+def test_a_rerun_of_the_job_sees_its_completed_stages_and_artifacts(monkeypatch):
+    monkeypatch.setattr("worker.shared.checkpoints.settings.checkpoints_enabled", True)
+    db, s3 = DummyDB(), DummyS3()
+    stack = np.arange(24, dtype="float32").reshape(2, 3, 4)
+    stack[0, 0, 0] = np.nan
+
+    first = JobCheckpoints(db, "job-1", s3)
+    assert first.get(SCENE_SELECTED) is None
+    first.save(SCENE_SELECTED, {"best_scene": {"id": "S"}, "est_valid": np.float32(0.5)})
+    key = first.put_array("bands", stack)
+    first.save(BANDS_FETCHED, {"artifact": key, "valid_pixel_ratio": float("nan")})
+
+    rerun = JobCheckpoints(db, "job-1", s3)
+    assert rerun.get(SCENE_SELECTED) == {"best_scene": {"id": "S"}, "est_valid": 0.5}
+    assert math.isnan(rerun.get(BANDS_FETCHED)["valid_pixel_ratio"])
+    out = np.empty_like(stack)
+    restored = rerun.get_array(rerun.get(BANDS_FETCHED)["artifact"], out)
+    assert restored is out and np.array_equal(out, stack, equal_nan=True)
+
+    rerun.clear()
+    assert db.rows == {} and s3.objects == {}
+    assert JobCheckpoints(db, "job-1", s3).get(SCENE_SELECTED) is None
+
+
+def test_checkpoints_are_skipped_when_disabled_or_too_large(monkeypatch):
+    monkeypatch.setattr("worker.shared.checkpoints.settings.checkpoints_enabled", False)
+    db, s3 = DummyDB(), DummyS3()
+    disabled = JobCheckpoints(db, "job-1", s3)
+    disabled.save(SCENE_SELECTED, {"best_scene": None})
+    assert disabled.put_array("bands", np.zeros(4)) is None
+    assert db.rows == {} and s3.objects == {}
+
+    monkeypatch.setattr("worker.shared.checkpoints.settings.checkpoints_enabled", True)
+    monkeypatch.setattr("worker.shared.checkpoints.settings.checkpoint_band_stack_max_mb", 1)
+    assert JobCheckpoints(db, "job-1", s3).put_array("bands", np.zeros(2**20, dtype="float32")) is None
+
+
+def test_raster_profiles_survive_a_checkpoint():
+    from affine import Affine
+    from rasterio.crs import CRS
+
+    profile = {"driver": "GTiff", "crs": CRS.from_epsg(32722), "transform": Affine(10, 0, 5e5, 0, -10, 7e6), "nodata": None}
+    restored = profile_from_json(profile_to_json(profile))
+    assert restored == profile
+
+
+class JobDB(DummyDB):
+    """job_checkpoints plus the status of the job."""
+
+    def __init__(self):
+        super().__init__()
+        self.status = "RUNNING"
+
+    def execute(self, sql, params=None):
+        statement = str(sql).strip()
+        if statement.startswith("UPDATE jobs"):
+            if "status = 'DONE'" in statement:
+                self.status = "DONE"
+            else:
+                self.status = params["status"]
+            return DummyResult([])
+        return super().execute(sql, params)
+
+    def rollback(self):
+        pass
+
+
+def test_a_week_failing_after_indices_written_is_retried_and_resumes_at_the_db_stage(monkeypatch):
+    from contextlib import contextmanager
+
+    import worker.pipeline.stac_client as stac_client
+    import worker.shared.utils as utils
+    from worker import main
+    from worker.jobs import process_week
+
+    @contextmanager
+    def claimed(db, job_id):
+        yield True
+
+    calls = {"search": 0, "indices": 0, "save": 0}
+
+    async def select_scenes(*args):
+        calls["search"] += 1
+        scene = {"id": "S2", "assets": {"red": "red.tif", "nir": "nir.tif"}}
+        return {"best_scene": scene, "est_valid": 0.9, "is_fallback": False, "best_radar": None}
+
+    async def compute_optical_indices(*args):
+        calls["indices"] += 1
+        return {"uris": {"ndvi": "s3://b/ndvi.tif"}, "stats": {"anomaly_mean": 0.1}, "baseline": 0.6, "band_map": {}}
+
+    def save_observation(*args, **kwargs):
+        calls["save"] += 1
+        if calls["save"] == 1:
+            raise RuntimeError("connection reset")
+
+    monkeypatch.setattr("worker.shared.checkpoints.settings.checkpoints_enabled", True)
+    monkeypatch.setattr(main.settings, "use_dynamic_tiling", False)
+    monkeypatch.setattr(main.settings, "sqs_max_receive_count", 3)
+    monkeypatch.setattr(main, "claim_job", claimed)
+    monkeypatch.setattr(utils, "get_week_date_range", lambda year, week: (None, None))
+    monkeypatch.setattr(utils, "get_aoi_geometry", lambda aoi_id, db: {"type": "Point", "coordinates": [0, 0]})
+    monkeypatch.setattr(stac_client, "get_stac_client", lambda: None)
+    monkeypatch.setattr(process_week, "S3Client", lambda: None)
+    monkeypatch.setattr(process_week, "select_scenes", select_scenes)
+    monkeypatch.setattr(process_week, "compute_optical_indices", compute_optical_indices)
+    monkeypatch.setattr(process_week, "save_observation", save_observation)
+    monkeypatch.setattr(process_week, "save_derived_assets", lambda *args, **kwargs: None)
+
+    db = JobDB()
+    payload = {"tenant_id": "t", "aoi_id": "a", "year": 2024, "week": 10}
+    body = {"job_id": "job-1", "job_type": "PROCESS_WEEK", "payload": payload}
+
+    def deliver(attempt):
+        message = {"Body": json.dumps(body), "Attributes": {"ApproximateReceiveCount": str(attempt)}}
+        main.process_message(message, db)
+
+    with pytest.raises(RuntimeError):
+        deliver(1)
+    # Not the last attempt: the job stays RUNNING for the redelivery
+    assert db.status == "RUNNING"
+    assert set(db.rows) == {"scene_selected", "indices_written"}
+
+    deliver(2)
+    assert calls == {"search": 1, "indices": 1, "save": 2}
+    assert db.status == "DONE" and db.rows == {}
@@ -0,0 +1,76 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.warp import transform_geom
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.pipeline.cloud_prescreen import pick_best_scene, screen_scene
+from worker.pipeline.stac_client import STACClient
+
+CRS = "EPSG:32722"
+
+
+def _write_scl(path, scl):
+    with rasterio.open(
+        path, "w", driver="GTiff", height=scl.shape[0], width=scl.shape[1], count=1,
+        dtype="uint8", crs=CRS, transform=from_origin(500000, 7000000, 20, 20), tiled=True,
+    ) as dst:
+        dst.write(scl, 1)
+        dst.build_overviews([2, 4, 8], Resampling.nearest)
+    return str(path)
+
+
+def _aoi(x0, y0, x1, y1):
+    return transform_geom(CRS, "EPSG:4326", {
+        "type": "Polygon",
+        "coordinates": [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]],
+    })
+
+
+def _client():
+    client = STACClient.__new__(STACClient)
+    client._sign_href = lambda href: href
+    return client
+
+
+def test_prescreen_prefers_scene_clear_over_aoi(tmp_path):
+    # Scene A: low scene cloud cover but cloudy exactly over the AOI
+    cloudy = np.full((400, 400), 4, dtype=np.uint8)
+    cloudy[0:200, 0:200] = 9
+    # Scene B: higher scene cloud cover, clear over the AOI
+    clear = np.full((400, 400), 4, dtype=np.uint8)
+    clear[200:, :] = 8
+    scenes = [
+        {"id": "A", "cloud_cover": 5.0, "assets": {"scl": _write_scl(tmp_path / "a.tif", cloudy)}},
+        {"id": "B", "cloud_cover": 50.0, "assets": {"scl": _write_scl(tmp_path / "b.tif", clear)}},
+    ]
+    aoi = _aoi(500400, 6997600, 503200, 6999600)
+
+    best, fraction = asyncio.run(pick_best_scene(_client(), scenes, aoi))
+
+    assert best["id"] == "B"
+    assert fraction == 1.0
+
+
+def test_screen_scene_scores_each_aoi_from_one_read(tmp_path):
+    scl = np.full((400, 400), 4, dtype=np.uint8)
+    scl[:, 200:] = 3  # cloud shadow over the east half
+    scene = {"id": "S", "cloud_cover": 10.0, "assets": {"scl": _write_scl(tmp_path / "s.tif", scl)}}
+    west = _aoi(500800, 6996000, 503200, 6998400)
+    east = _aoi(504800, 6996000, 507200, 6998400)
+    outside = _aoi(600000, 6900000, 601000, 6901000)
+
+    fractions = asyncio.run(screen_scene(_client(), scene, [west, east, outside], resolution=160))
+
+    assert fractions[0] == 1.0
+    assert fractions[1] == 0.0
+    assert fractions[2] is None
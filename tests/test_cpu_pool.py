@@ -0,0 +1,56 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.pipeline import cpu_pool
+from worker.pipeline.cpu_pool import CpuWorkspace, cpu_mode, current_cpu_mode, row_chunks
+
+BANDS = ["blue", "green", "red", "rededge", "nir", "swir1", "swir2"]
+
+
+def _fill(stack):
+    rng = np.random.default_rng(7)
+    stack[...] = rng.uniform(0.01, 0.6, stack.shape).astype(np.float32)
+    stack[:, :5, :5] = np.nan
+    return {band: i for i, band in enumerate(BANDS)}
+
+
+def _run(mode, monkeypatch):
+    monkeypatch.setattr(cpu_pool.settings, "cpu_pool_processes", 2)
+    names = ["ndvi", "ndwi", "savi", "anomaly"]
+    with CpuWorkspace(mode) as workspace:
+        stack = workspace.empty((len(BANDS), 70, 40))
+        band_index = _fill(stack)
+        indices, stats = asyncio.run(workspace.indices_with_stats(
+            stack, band_index, names, percentiles={"ndvi": (10, 50, 90)}, block_rows=16
+        ))
+        return {name: indices[name].copy() for name in names}, stats, len(workspace._shared)
+
+
+def test_process_mode_matches_thread_mode(monkeypatch):
+    thread_indices, thread_stats, thread_shared = _run("thread", monkeypatch)
+    process_indices, process_stats, process_shared = _run("process", monkeypatch)
+
+    assert thread_shared == 0 and process_shared == 5  # stack + one output per index
+    for name, values in thread_indices.items():
+        np.testing.assert_array_equal(values, process_indices[name])
+    assert thread_stats.keys() == process_stats.keys()
+    for key, value in thread_stats.items():
+        assert np.isclose(value, process_stats[key], rtol=1e-9, atol=1e-12), key
+
+
+def test_cpu_mode_is_scoped_and_chunks_align_to_blocks(monkeypatch):
+    monkeypatch.setattr(cpu_pool.settings, "cpu_pool_enabled", True)
+    with cpu_mode("process"):
+        assert current_cpu_mode() == "process"
+    assert current_cpu_mode() == "thread"
+
+    assert row_chunks(100, 3, block_rows=16) == [(0, 48), (48, 96), (96, 100)]
+    assert row_chunks(10, 8, block_rows=16) == [(0, 10)]
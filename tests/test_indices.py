@@ -0,0 +1,69 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.pipeline.indices import available_indices, compute_indices, titiler_expressions
+
+BANDS = ["red", "green", "blue", "nir", "swir", "swir2", "rededge"]
+
+
+def _legacy_indices(b):
+    """Per-index formulas as originally implemented in PROCESS_WEEK."""
+    red, green, blue, nir = b["red"], b["green"], b["blue"], b["nir"]
+    swir, swir2, rededge = b["swir"], b["swir2"], b["rededge"]
+
+    def safe_nd(a, c, L=0.0, scale=1.0):
+        denom = a + c + L
+        denom = np.where(denom == 0, 0.0001, denom)
+        return np.clip(((a - c) / denom) * scale, -1, 1)
+
+    ndvi = safe_nd(nir, red)
+    return {
+        "ndvi": ndvi,
+        "savi": safe_nd(nir, red, L=0.5, scale=1.5),
+        "ndwi": safe_nd(green, nir),
+        "ndmi": safe_nd(nir, swir),
+        "anomaly": ndvi - 0.60,
+        "ndre": (nir - rededge) / (nir + rededge + 1e-6),
+        "reci": (nir / (rededge + 1e-6)) - 1,
+        "ari": (1 / (green + 1e-6)) - (1 / (rededge + 1e-6)),
+        "gndvi": (nir - green) / (nir + green + 1e-6),
+        "evi": 2.5 * ((nir - red) / (nir + 6 * red - 7.5 * blue + 1 + 1e-6)),
+        "bsi": ((swir + red) - (nir + blue)) / ((swir + red) + (nir + blue) + 1e-6),
+        "cri": (1 / (blue + 1e-6)) - (1 / (green + 1e-6)),
+        "msi": swir / (nir + 1e-6),
+        "nbr": (nir - swir2) / (nir + swir2 + 1e-6),
+    }
+
+
+def test_compute_indices_matches_legacy_formulas_across_blocks():
+    rng = np.random.default_rng(42)
+    stack = rng.uniform(100, 5000, size=(len(BANDS), 37, 23)).astype(np.float32)
+    stack[:, rng.random((37, 23)) < 0.1] = np.nan
+    band_index = {b: i for i, b in enumerate(BANDS)}
+
+    names = available_indices(band_index)
+    result = compute_indices(stack, band_index, names, block_rows=8)
+    expected = _legacy_indices({b: stack[i] for b, i in band_index.items()})
+
+    assert set(result) == set(expected)
+    for name, arr in result.items():
+        assert arr.dtype == np.float32
+        np.testing.assert_allclose(arr, expected[name], rtol=1e-5, atol=1e-6, equal_nan=True)
+
+
+def test_available_indices_depends_on_bands():
+    names = available_indices(["red", "nir", "green"])
+    assert names == ["ndvi", "savi", "ndwi", "anomaly", "gndvi"]
+
+
+def test_titiler_expressions_cover_stats_indices():
+    expressions = titiler_expressions()
+    assert expressions["ndvi"] == "(B08-B04)/(B08+B04)"
+    assert "anomaly" not in expressions
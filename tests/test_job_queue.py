@@ -0,0 +1,221 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.shared.aws_clients import SQSClient
+from worker.shared.job_queue import NewJob, create_jobs, enqueue_jobs, job_key, release_dependents
+
+
+class DummyResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class DummyDB:
+    def __init__(self):
+        self.statements = []
+        self.sql = []
+
+    def execute(self, sql, params):
+        self.sql.append(str(sql))
+        if "job_dependencies" in str(sql):
+            return DummyResult([])
+        self.statements.append(params)
+        n = len(params) // 5
+        return DummyResult([
+            (f"id-{params[f'job_key_{i}']}", params[f"tenant_id_{i}"], params[f"job_key_{i}"]) for i in range(n)
+        ])
+
+
+class BotoStub:
+    def __init__(self, failures=()):
+        self.calls = []
+        self.queues = []
+        self.failures = list(failures)
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls.append([e["MessageBody"] for e in Entries])
+        self.queues.append(QueueUrl)
+        return {"Failed": self.failures.pop(0)} if self.failures else {}
+
+
+def _sqs(boto):
+    sqs = SQSClient.__new__(SQSClient)
+    sqs.queue_url, sqs.queue_high_url, sqs.client = "q", "q-high", boto
+    return sqs
+
+
+def test_create_jobs_uses_multi_row_statements_and_dedupes(monkeypatch):
+    monkeypatch.setattr("worker.shared.job_queue.INSERT_CHUNK", 4)
+    jobs = [NewJob("t", "a", "PROCESS_WEEK", job_key("t", "a", w), {"week": w}) for w in range(10)]
+    jobs.append(NewJob("t", "a", "PROCESS_WEEK", job_key("t", "a", 3), {"week": 3}))
+    db = DummyDB()
+
+    created = create_jobs(db, jobs)
+
+    assert [len(p) // 5 for p in db.statements] == [4, 4, 2]
+    assert [job.payload["week"] for _, job in created] == list(range(10))
+    assert all(job_id == f"id-{job.job_key}" for job_id, job in created)
+
+
+def test_dependent_jobs_wait_and_are_enqueued_on_release():
+    upstream = NewJob("t", "a", "PROCESS_WEEK", "pw", {"week": 1})
+    downstream = NewJob("t", "a", "ALERTS_WEEK", "aw", {"week": 1}, depends_on=["pw"])
+    db = DummyDB()
+
+    created = create_jobs(db, [upstream, downstream])
+
+    assert "'PENDING'" in db.sql[0].split("VALUES")[1].split("),")[0]
+    assert "'WAITING'" in db.sql[0].split("VALUES")[1].split("),")[1]
+    assert "job_dependencies" in db.sql[1]
+    boto = BotoStub()
+    enqueue_jobs(_sqs(boto), created)
+    assert [json.loads(b)["job_type"] for b in boto.calls[0]] == ["PROCESS_WEEK"]
+
+    class ReleaseDB:
+        def execute(self, sql, params):
+            assert params == {"job_id": "id-pw"}
+            return DummyResult([("id-aw", "t", "a", "ALERTS_WEEK", "aw", {"week": 1}, "PENDING")])
+
+    released = release_dependents(ReleaseDB(), "id-pw")
+    enqueue_jobs(_sqs(boto), released)
+    assert json.loads(boto.calls[1][0]) == {"job_id": "id-aw", "job_type": "ALERTS_WEEK", "payload": {"week": 1}}
+
+    with pytest.raises(ValueError):
+        create_jobs(DummyDB(), [NewJob("t", "a", "ALERTS_WEEK", "aw", {}, depends_on=["missing"])])
+
+
+def test_dependents_of_failed_jobs_fail_and_release_their_own_dependents():
+    class ReleaseDB:
+        def __init__(self):
+            self.params = []
+
+        def execute(self, sql, params):
+            self.params.append(params)
+            assert "HAVING bool_and(upstream.status IN ('DONE', 'FAILED', 'CANCELLED'))" in str(sql)
+            if "job_id" in params:
+                # FORECAST_WEEK only waited on the failed week
+                return DummyResult([("id-fw", "t", "a", "FORECAST_WEEK", "fw", {"week": 1}, "FAILED")])
+            return DummyResult([("id-next", "t", "a", "ALERTS_WEEK", "next", {"week": 1}, "PENDING")])
+
+    db = ReleaseDB()
+    released = release_dependents(db, "id-pw")
+
+    assert db.params == [{"job_id": "id-pw"}, {"failed_ids": ["id-fw"]}]
+    assert [(job_id, job.job_type) for job_id, job in released] == [("id-next", "ALERTS_WEEK")]
+
+
+def test_process_week_in_dynamic_tiling_mode_is_marked_done_and_releases_dependents(monkeypatch):
+    from contextlib import contextmanager
+
+    from worker import main
+    from worker.config import settings
+
+    @contextmanager
+    def claimed(db, job_id):
+        yield True
+
+    class JobDB:
+        def __init__(self):
+            self.sql = []
+
+        def execute(self, sql, params=None):
+            self.sql.append(" ".join(str(sql).split()))
+            if "job_dependencies" in str(sql):
+                return DummyResult([("id-aw", "t", "a", "ALERTS_WEEK", "aw", {"week": 1}, "PENDING")])
+            return DummyResult([])
+
+        def commit(self):
+            pass
+
+        def rollback(self):
+            pass
+
+    monkeypatch.setattr(settings, "use_dynamic_tiling", True)
+    monkeypatch.setattr(main, "claim_job", claimed)
+    # calculate_stats_handler leaves the job RUNNING
+    monkeypatch.setattr("worker.jobs.calculate_stats.calculate_stats_handler", lambda job_id, payload, db: {"ok": True})
+    db, boto = JobDB(), BotoStub()
+    message = {"Body": json.dumps({"job_id": "id-pw", "job_type": "PROCESS_WEEK", "payload": {"week": 1}})}
+
+    main.process_message(message, db, _sqs(boto))
+
+    done = [s for s in db.sql if "SET status = 'DONE'" in s]
+    assert done and "status NOT IN ('DONE', 'FAILED', 'CANCELLED')" in done[0]
+    assert db.sql.index(done[0]) < next(i for i, s in enumerate(db.sql) if "job_dependencies" in s)
+    assert [json.loads(b)["job_id"] for b in boto.calls[0]] == ["id-aw"]
+
+
+def test_interactive_jobs_are_enqueued_on_the_high_priority_queue():
+    db = DummyDB()
+    created = create_jobs(db, [
+        NewJob("t", "a", "PROCESS_WEEK", "bulk", {"week": 1}),
+        NewJob("t", "a", "PROCESS_WEEK", "new-aoi", {"week": 2, "priority_class": "interactive"}),
+    ])
+    rows = db.sql[0].split("VALUES")[1]
+    assert "'PENDING', 0," in rows and "'PENDING', 10," in rows
+
+    boto = BotoStub()
+    enqueue_jobs(_sqs(boto), created)
+    routed = {queue: [json.loads(b)["payload"]["week"] for b in bodies] for queue, bodies in zip(boto.queues, boto.calls)}
+    assert routed == {"q": [1], "q-high": [2]}
+
+
+def test_jobs_with_the_key_of_an_in_flight_job_attach_to_it():
+    # "running" is in flight: the upsert leaves it alone
+    class InFlightDB(DummyDB):
+        def execute(self, sql, params):
+            if "job_key = ANY" in str(sql):
+                self.sql.append(str(sql))
+                assert params["job_keys"] == ["running"]
+                return DummyResult([("id-existing", "t", "running")])
+            result = super().execute(sql, params)
+            result.rows = [row for row in result.rows if row[2] != "running"]
+            return result
+
+    db = InFlightDB()
+    created = create_jobs(db, [
+        NewJob("t", "a", "PROCESS_WEEK", "running", {"week": 1}),
+        NewJob("t", "a", "PROCESS_WEEK", "new", {"week": 2}),
+        NewJob("t", "a", "ALERTS_WEEK", "alerts", {"weeks": [[2024, 1], [2024, 2]]}, depends_on=["running", "new"]),
+    ])
+
+    assert "WHERE jobs.status NOT IN ('PENDING', 'WAITING', 'RUNNING')" in db.sql[0]
+    # ... unless it is stale and holds no lease
+    assert "jobs.updated_at < now() - make_interval(secs => :coalesce_max_age)" in db.sql[0]
+    assert db.statements[0]["coalesce_max_age"] == 6 * 3600
+    # A reset job takes the new payload and starts with a fresh retry budget and no lease
+    assert "payload_json = EXCLUDED.payload_json" in db.sql[0]
+    assert "attempts = 0, lease_expires_at = NULL, leased_by = NULL" in db.sql[0]
+    assert [(job_id, job.coalesced) for job_id, job in created] == [
+        ("id-existing", True), ("id-new", False), ("id-alerts", False)
+    ]
+    boto = BotoStub()
+    enqueue_jobs(_sqs(boto), created)
+    assert [json.loads(b)["job_id"] for b in boto.calls[0]] == ["id-new"]
+
+
+def test_enqueue_sends_batches_of_ten_and_retries_server_errors():
+    boto = BotoStub(failures=[[{"Id": "2", "SenderFault": False, "Code": "InternalError"}]])
+    created = [(str(i), NewJob("t", "a", "ALERTS_WEEK", str(i), {"i": i})) for i in range(23)]
+
+    enqueue_jobs(_sqs(boto), created)
+
+    assert [len(c) for c in boto.calls] == [10, 1, 10, 3]
+    assert json.loads(boto.calls[1][0])["job_id"] == "2"
+
+
+def test_send_message_batch_raises_on_sender_fault():
+    boto = BotoStub(failures=[[{"Id": "0", "SenderFault": True, "Code": "InvalidMessageContents"}]])
+    with pytest.raises(RuntimeError):
+        _sqs(boto).send_message_batch([{"a": 1}])
@@ -0,0 +1,69 @@
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from prometheus_client import REGISTRY
+
+from worker import metrics
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_stages_and_bytes_are_labelled_with_the_running_job_type():
+    token = metrics.current_job_type.set("TEST_STAGES")
+    try:
+        with metrics.stage("read"):
+            metrics.count_read(100)
+        metrics.count_written(40)
+    finally:
+        metrics.current_job_type.reset(token)
+
+    assert _sample("vivacampo_worker_stage_duration_seconds_count", job_type="TEST_STAGES", stage="read") == 1
+    assert _sample("vivacampo_worker_bytes_read_total", job_type="TEST_STAGES") == 100
+    assert _sample("vivacampo_worker_bytes_written_total", job_type="TEST_STAGES") == 40
+    assert metrics.current_job_type.get() == "none"
+
+
+def test_redelivered_messages_count_as_retries_and_record_queue_wait():
+    sent = str(int((time.time() - 30) * 1000))
+    metrics.observe_message("TEST_QUEUE", "bulk", {"Attributes": {"SentTimestamp": sent, "ApproximateReceiveCount": "1"}})
+    metrics.observe_message("TEST_QUEUE", "bulk", {"Attributes": {"SentTimestamp": sent, "ApproximateReceiveCount": "3"}})
+    metrics.observe_message("TEST_QUEUE", "bulk", {})
+
+    assert _sample("vivacampo_worker_queue_wait_seconds_count", job_type="TEST_QUEUE", priority_class="bulk") == 2
+    assert _sample("vivacampo_worker_queue_wait_seconds_sum", job_type="TEST_QUEUE", priority_class="bulk") >= 60
+    assert _sample("vivacampo_worker_job_retries_total", job_type="TEST_QUEUE") == 1
+
+
+def test_dynamic_tiling_stats_record_search_read_and_db_stages(monkeypatch):
+    from worker.jobs import calculate_stats
+
+    class Row:
+        geom_wkt = "POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))"
+
+    class DB:
+        def execute(self, sql, params):
+            return type("Result", (), {"fetchone": lambda self: Row()})()
+
+    async def tiler_stats(mosaic_url, expression, geometry):
+        return {"mean": 0.5}
+
+    monkeypatch.setattr(calculate_stats, "ensure_mosaic_exists", lambda year, week, collection: "s3://b/m.json")
+    monkeypatch.setattr(calculate_stats, "fetch_stats_from_tiler", tiler_stats)
+    monkeypatch.setattr(calculate_stats, "_save_observations", lambda *args, **kwargs: None)
+
+    token = metrics.current_job_type.set("TEST_DYNAMIC")
+    try:
+        calculate_stats.calculate_stats_handler("j", {"aoi_id": "a", "tenant_id": "t", "year": 2024, "week": 3}, DB())
+    finally:
+        metrics.current_job_type.reset(token)
+
+    for stage, count in (("search", 1), ("read", 1), ("db", 2)):
+        assert _sample("vivacampo_worker_stage_duration_seconds_count", job_type="TEST_DYNAMIC", stage=stage) == count
@@ -0,0 +1,107 @@
+import asyncio
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform_geom
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.pipeline import out_of_core
+from worker.pipeline.band_stack import AOIGrid, read_band_stack, read_cloud_mask
+from worker.pipeline.indices import available_indices, compute_indices
+from worker.pipeline.out_of_core import aligned_blocks, grid_blocks, process_optical_blocks
+from worker.pipeline.stac_client import STACClient
+from worker.pipeline.zonal_stats import StatsAccumulator, value_range_for
+
+CRS = "EPSG:32722"
+BANDS = ["red", "green", "blue", "nir", "swir", "swir2", "rededge"]
+
+
+def _write(path, data, res):
+    with rasterio.open(
+        path, "w", driver="GTiff", height=data.shape[0], width=data.shape[1], count=1,
+        dtype=data.dtype, crs=CRS, transform=from_origin(500000, 7000000, res, res),
+        tiled=True, blockxsize=64, blockysize=64,
+    ) as dst:
+        dst.write(data, 1)
+    return str(path)
+
+
+class DummyS3:
+    def __init__(self, root):
+        self.root = root
+
+    def upload_file(self, path, key):
+        target = self.root / key.replace("/", "_")
+        shutil.copy(path, target)
+        return str(target)
+
+
+def _client(monkeypatch):
+    from worker.pipeline import stac_client
+
+    monkeypatch.setattr(stac_client.settings, "asset_cache_enabled", False)
+    client = STACClient.__new__(STACClient)
+    client._sign_href = lambda href: href
+    return client
+
+
+def test_aligned_blocks_follow_source_tiles():
+    assert aligned_blocks(300, 100, 128) == [(0, 28), (28, 156), (156, 284), (284, 300)]
+    assert aligned_blocks(50, 0, 128) == [(0, 50)]
+
+
+def test_block_wise_indices_match_in_memory(tmp_path, monkeypatch):
+    client = _client(monkeypatch)
+    rng = np.random.default_rng(3)
+    assets = {}
+    for band in BANDS:
+        res = 20 if band in ("swir", "swir2", "rededge") else 10
+        size = 200 if res == 20 else 400
+        assets[band] = _write(tmp_path / f"{band}.tif", rng.integers(1, 6000, (size, size), dtype=np.uint16), res)
+    scl = np.full((200, 200), 4, dtype=np.uint8)
+    scl[60:90, 60:120] = 9
+    assets["scl"] = _write(tmp_path / "scl.tif", scl, 20)
+    # Triangle, so the AOI mask matters
+    aoi = transform_geom(CRS, "EPSG:4326", {
+        "type": "Polygon",
+        "coordinates": [[[500500, 6997000], [503500, 6997000], [500500, 6999500], [500500, 6997000]]],
+    })
+    monkeypatch.setattr(out_of_core.settings, "index_output_mode", "per_index")
+    monkeypatch.setattr(out_of_core.settings, "min_valid_pixel_ratio", 0.1)
+
+    header = client.read_header(assets["red"])
+    grid = AOIGrid.from_header(header, aoi)
+    assert len(grid_blocks(grid, header, block_size=128)) > 4
+
+    # In-memory reference
+    stack, band_index = asyncio.run(read_band_stack(client, assets, BANDS, grid))
+    invalid = ~grid.inside_mask() | asyncio.run(read_cloud_mask(client, assets["scl"], grid))
+    stack[:, invalid] = np.nan
+    names = available_indices(band_index)
+    expected = compute_indices(stack, band_index, names)
+
+    result = asyncio.run(process_optical_blocks(
+        client, DummyS3(tmp_path), assets, BANDS, grid, header, "out/",
+        percentiles={"ndvi": (10, 50, 90)}, block_size=128,
+    ))
+
+    assert set(result.uris) == set(names)
+    for name in names:
+        with rasterio.open(result.uris[name]) as src:
+            np.testing.assert_array_equal(src.read(1), expected[name])
+        stats = StatsAccumulator(value_range=value_range_for(name)).update(expected[name]).result(
+            name, percentiles=(10, 50, 90) if name == "ndvi" else ()
+        )
+        for key, value in stats.items():
+            assert np.isclose(result.stats[key], value, rtol=1e-9), key
+    inside = grid.inside_mask()
+    assert result.valid_pixel_ratio == (~np.isnan(expected["ndvi"])).sum() / inside.sum()
+    assert 0.1 < result.valid_pixel_ratio < 1.0
@@ -0,0 +1,77 @@
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.shared.pg_queue import PostgresJobQueue
+
+
+class DummyResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class DummySession:
+    """Answers the claim / lease statements of PostgresJobQueue from canned rows."""
+
+    def __init__(self, claimable, held):
+        self.claimable = claimable
+        self.held = held
+        self.params = []
+
+    def execute(self, sql, params):
+        self.params.append(params)
+        if "SKIP LOCKED" in str(sql):
+            rows = [r for r in self.claimable if r[4] >= params["min_priority"]][:params["limit"]]
+            self.claimable = [r for r in self.claimable if r not in rows]
+            return DummyResult([r[:4] + (1700000000000,) for r in rows])
+        if "unnest" in str(sql):
+            return DummyResult([
+                (i, a) for i, a in zip(params["ids"], params["attempts"]) if (i, a) in self.held
+            ])
+        return DummyResult([])
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_postgres_queue_claims_by_priority_and_fences_stale_handles():
+    session = DummySession(
+        claimable=[
+            ("j1", "PROCESS_WEEK", {"week": 1}, 1, 0),
+            ("j2", "SYNC_SCENE_CATALOG", json.dumps({"full": True}), 2, 5),
+        ],
+        held={("j1", 1), ("j2", 2)},
+    )
+    queue = PostgresJobQueue(session_factory=lambda: session)
+
+    high = queue.receive_messages(queue_url=queue.queue_high_url, max_messages=10)
+    assert [m["ReceiptHandle"] for m in high] == ["j2:2"]
+    assert json.loads(high[0]["Body"]) == {"job_id": "j2", "job_type": "SYNC_SCENE_CATALOG", "payload": {"full": True}}
+    assert high[0]["Attributes"] == {"ApproximateReceiveCount": "2", "SentTimestamp": "1700000000000"}
+
+    # Only the oldest claimable jobs of each tenant are ranked
+    claim = next(p for p in session.params if "min_priority" in p)
+    assert claim["depth"] == 20
+
+    default = queue.receive_messages(queue_url=queue.queue_url, max_messages=10, wait_time=0)
+    assert [m["ReceiptHandle"] for m in default] == ["j1:1"]
+    assert queue.receive_messages(max_messages=10, wait_time=0) == []
+
+    # j1 was re-claimed by another worker (attempt 2): its old handle is lost
+    session.held = {("j2", 2)}
+    assert queue.change_message_visibility_batch(["j1:1", "j2:2"], 60) == ["j1:1"]
+    assert queue.delete_message_batch(["j2:2"]) == []
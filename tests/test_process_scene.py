@@ -0,0 +1,138 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from affine import Affine
+from shapely.geometry import box
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.jobs import process_scene
+from worker.jobs.process_scene import assign_aois_to_scenes, build_label_layers, pack_windows
+
+
+def _box(minx, miny, maxx, maxy):
+    return {
+        "type": "Polygon",
+        "coordinates": [[[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]],
+    }
+
+
+def test_assign_prefers_lowest_cloud_covering_scene():
+    scenes = [
+        {"id": "cloudy", "cloud_cover": 40, "geometry": _box(0, 0, 10, 10), "assets": {"red": "r", "nir": "n"}},
+        {"id": "clear", "cloud_cover": 5, "geometry": _box(0, 0, 5, 5), "assets": {"red": "r", "nir": "n"}},
+    ]
+    aois = [
+        {"aoi_id": "inside-both", "geom": _box(1, 1, 2, 2)},
+        {"aoi_id": "inside-cloudy", "geom": _box(7, 7, 8, 8)},
+        {"aoi_id": "outside", "geom": _box(20, 20, 21, 21)},
+    ]
+
+    groups, unassigned = assign_aois_to_scenes(aois, scenes)
+
+    assert [a["aoi_id"] for a in groups["clear"][1]] == ["inside-both"]
+    assert [a["aoi_id"] for a in groups["cloudy"][1]] == ["inside-cloudy"]
+    assert [a["aoi_id"] for a in unassigned] == ["outside"]
+
+
+
+def test_pack_windows_groups_neighbours_under_the_pixel_budget():
+    transform = Affine(1, 0, 0, 0, -1, 1000)
+    projected = [
+        box(0, 990, 10, 1000),   # north-west
+        box(20, 980, 30, 990),   # next to it
+        box(900, 0, 910, 10),    # south-east
+        box(880, 20, 890, 30),   # next to it
+        box(400, 400, 600, 600),  # alone over the budget
+    ]
+
+    packed = pack_windows(projected, transform, 1000, 1000, max_pixels=100 * 100)
+
+    assert [members for _, members in packed] == [[0, 1], [4], [3, 2]]
+    assert (packed[0][0].col_off, packed[0][0].row_off, packed[0][0].width, packed[0][0].height) == (0, 0, 30, 20)
+    assert all(w.width * w.height <= 100 * 100 for w, members in packed if len(members) > 1)
+
+
+def test_overlapping_aois_go_to_separate_label_layers():
+    projected = [
+        box(0, 0, 10, 10),
+        box(5, 5, 15, 15),  # overlaps 0
+        box(10, 0, 20, 4),  # only touches 0
+        box(6, 6, 8, 8),    # inside 0 and 1
+    ]
+
+    assert build_label_layers(projected, [0, 1, 2, 3]) == [[0, 2], [1], [3]]
+
+
+SCENE_TRANSFORM = Affine(0.001, 0, 0, 0, -0.001, 1)
+
+
+def _synthetic_band(grid, band):
+    """Band values as a function of the scene pixel, whatever grid it is read onto."""
+    col0 = round((grid.transform.c - SCENE_TRANSFORM.c) / SCENE_TRANSFORM.a)
+    row0 = round((grid.transform.f - SCENE_TRANSFORM.f) / SCENE_TRANSFORM.e)
+    rows, cols = np.indices(grid.shape)
+    rows, cols = rows + row0, cols + col0
+    if band == "red":
+        return (800 + (rows * 37 + cols * 11) % 700).astype(np.float32)
+    return (1500 + (rows * 13 + cols * 29) % 1600).astype(np.float32)
+
+
+async def _read_band_stack(client, assets, bands, grid, ingestion_mode=None, required=(), out=None):
+    return np.stack([_synthetic_band(grid, b) for b in bands]), {b: i for i, b in enumerate(bands)}
+
+
+async def _read_cloud_mask(client, scl_href, grid, ingestion_mode=None):
+    return (_synthetic_band(grid, "red") + _synthetic_band(grid, "nir")).astype(int) % 9 == 0
+
+
+def test_labelled_pass_matches_per_aoi_process_week_stats(monkeypatch):
+    from worker.jobs.process_week import calculate_band_stats
+    from worker.pipeline.band_stack import AOIGrid
+    from worker.pipeline.indices import compute_indices
+
+    header = {"crs": "EPSG:4326", "transform": SCENE_TRANSFORM, "width": 1000, "height": 1000}
+    aois = [
+        {"tenant_id": "t", "aoi_id": "a", "geom": _box(0.10, 0.10, 0.20, 0.25)},
+        {"tenant_id": "t", "aoi_id": "b", "geom": _box(0.15, 0.20, 0.30, 0.30)},  # overlaps a
+        {"tenant_id": "t", "aoi_id": "c", "geom": {
+            "type": "Polygon", "coordinates": [[[0.6, 0.6], [0.8, 0.62], [0.7, 0.8], [0.6, 0.6]]],
+        }},
+    ]
+
+    class Client:
+        def read_header(self, href):
+            return header
+
+    saved = []
+    monkeypatch.setattr(process_scene, "read_band_stack", _read_band_stack)
+    monkeypatch.setattr(process_scene, "read_cloud_mask", _read_cloud_mask)
+    monkeypatch.setattr(process_scene, "save_observation_rows", lambda db, ok, no_data: saved.append((ok, no_data)))
+    monkeypatch.setattr(process_scene.settings, "min_valid_pixel_ratio", 0.1)
+
+    scene = {"id": "S2", "assets": {"red": "r", "nir": "n", "scl": "s"}}
+    counts = asyncio.run(process_scene._process_scene_group(Client(), scene, aois, 2024, 10, None))
+    assert counts == {"ok": 3, "no_data": 0}
+    rows = {row["aoi_id"]: row for row in saved[0][0]}
+
+    for aoi in aois:
+        # What PROCESS_WEEK computes for the AOI on its own grid
+        grid = AOIGrid.from_header(header, aoi["geom"])
+        stack, band_index = asyncio.run(_read_band_stack(None, {}, ["red", "nir"], grid))
+        invalid = ~grid.inside_mask()
+        aoi_pixels = invalid.size - int(invalid.sum())
+        invalid |= asyncio.run(_read_cloud_mask(None, "s", grid))
+        stack[:, invalid] = np.nan
+        ndvi = compute_indices(stack, band_index, ["ndvi"])["ndvi"]
+        expected = calculate_band_stats(ndvi, "ndvi", percentiles=(10, 50, 90))
+
+        row = rows[aoi["aoi_id"]]
+        assert row["valid_pixel_ratio"] == pytest.approx(np.count_nonzero(~np.isnan(ndvi)) / aoi_pixels)
+        for key in ("ndvi_mean", "ndvi_std", "ndvi_p10", "ndvi_p50", "ndvi_p90"):
+            assert row[key] == pytest.approx(expected[key], abs=1e-6), (aoi["aoi_id"], key)
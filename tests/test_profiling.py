@@ -0,0 +1,81 @@
+import json
+import marshal
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker import metrics
+from worker.profiling import profile_job
+
+
+class DummyDB:
+    def __init__(self):
+        self.runs = []
+        self.commits = 0
+
+    def execute(self, sql, params):
+        assert "INSERT INTO job_runs" in str(sql)
+        self.runs.append(params)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class DummyS3:
+    def __init__(self):
+        self.objects = {}
+
+    def upload_bytes(self, body, s3_key, content_type=None):
+        self.objects[s3_key] = body
+        return f"s3://b/{s3_key}"
+
+
+def _allocate_stack():
+    with metrics.stage("read"):
+        stack = np.ones((8, 512, 512), dtype="float32")
+    with metrics.stage("indices"):
+        return float(stack.sum())
+
+
+def test_a_profiled_job_stores_its_cpu_profile_and_memory_trace():
+    db, s3 = DummyDB(), DummyS3()
+    with profile_job(db, "job-1", {"profile": True}, attempt=2, s3=s3) as profile:
+        assert profile is not None
+        _allocate_stack()
+
+    prefix = "profiles/job=job-1/attempt=2/"
+    assert sorted(s3.objects) == [prefix + "cpu.prof", prefix + "cpu.txt", prefix + "memory.txt"]
+    stats = marshal.loads(s3.objects[prefix + "cpu.prof"])
+    assert any(func[2] == "_allocate_stack" for func in stats)
+    assert "_allocate_stack" in s3.objects[prefix + "cpu.txt"].decode()
+
+    run = db.runs[0]
+    assert (run["job_id"], run["attempt"], run["failed"]) == ("job-1", 2, False)
+    summary = json.loads(run["metrics_json"])["profile"]
+    assert summary["stage_peak_bytes"]["read"] >= 8 * 512 * 512 * 4
+    assert summary["peak_traced_bytes"] >= summary["stage_peak_bytes"]["read"]
+    assert summary["cpu_profile"] == f"s3://b/{prefix}cpu.prof"
+    assert db.commits == 1
+    assert metrics.active_profile.get() is None
+
+
+def test_jobs_are_not_profiled_unless_requested_or_sampled(monkeypatch):
+    monkeypatch.setattr("worker.profiling.settings.profile_sample_rate", 0.0)
+    db, s3 = DummyDB(), DummyS3()
+    with profile_job(db, "job-1", {"week": 1}, s3=s3) as profile:
+        assert profile is None
+    assert db.runs == [] and s3.objects == {}
+
+    monkeypatch.setattr("worker.profiling.settings.profile_sample_rate", 1.0)
+    with profile_job(db, "job-2", {"week": 1}, s3=s3) as profile:
+        assert profile is not None
+    assert db.runs[0]["job_id"] == "job-2"
@@ -0,0 +1,129 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.pipeline import raster_io
+
+PROFILE = {
+    "driver": "GTiff",
+    "height": 300,
+    "width": 200,
+    "count": 1,
+    "dtype": "uint16",
+    "crs": "EPSG:32722",
+    "transform": from_origin(500000, 7000000, 10, 10),
+}
+
+
+class DummyS3:
+    def __init__(self):
+        self.objects = {}
+
+    def upload_bytes(self, body, s3_key, content_type="image/tiff"):
+        self.objects[s3_key] = ("bytes", body)
+        return f"s3://bucket/{s3_key}"
+
+    def upload_file(self, file_path, s3_key):
+        with open(file_path, "rb") as f:
+            self.objects[s3_key] = ("file", f.read())
+        return f"s3://bucket/{s3_key}"
+
+
+def _read(body):
+    with MemoryFile(body) as memfile:
+        with memfile.open() as src:
+            return src.read(1), src.profile
+
+
+def test_upload_raster_encodes_in_memory_below_threshold():
+    data = np.random.default_rng(0).uniform(-1, 1, (300, 200)).astype(np.float32)
+    data[0, 0] = np.nan
+    s3 = DummyS3()
+
+    uri = raster_io.upload_raster(s3, data, PROFILE, "a/ndvi.tif")
+
+    assert uri == "s3://bucket/a/ndvi.tif"
+    kind, body = s3.objects["a/ndvi.tif"]
+    assert kind == "bytes"
+    read, profile = _read(body)
+    assert profile["dtype"] == "float32"
+    assert profile["tiled"]
+    np.testing.assert_array_equal(read, data)
+
+
+def test_upload_raster_spills_to_disk_above_threshold(monkeypatch):
+    monkeypatch.setattr(raster_io.settings, "in_memory_raster_max_mb", 0)
+    data = np.ones((300, 200), dtype=np.float32)
+    s3 = DummyS3()
+
+    raster_io.upload_raster(s3, data, PROFILE, "a/big.tif")
+
+    kind, body = s3.objects["a/big.tif"]
+    assert kind == "file"
+    np.testing.assert_array_equal(_read(body)[0], data)
+
+
+def test_upload_rasters_overlaps_uploads_up_to_the_job_limit(monkeypatch):
+    monkeypatch.setattr(raster_io.settings, "s3_job_upload_concurrency", 2)
+
+    class SlowS3(DummyS3):
+        def __init__(self):
+            super().__init__()
+            self.lock = threading.Lock()
+            self.in_flight = self.max_in_flight = 0
+
+        def upload_bytes(self, body, s3_key, content_type="image/tiff"):
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.05)
+            with self.lock:
+                self.in_flight -= 1
+            return super().upload_bytes(body, s3_key, content_type)
+
+    s3 = SlowS3()
+    rasters = [(f"i{n}", np.full((300, 200), n, dtype=np.float32), PROFILE, f"a/i{n}.tif") for n in range(5)]
+
+    uris = raster_io.upload_rasters(s3, rasters)
+
+    assert list(uris) == [f"i{n}" for n in range(5)]
+    assert uris["i3"] == "s3://bucket/a/i3.tif"
+    assert s3.max_in_flight == 2
+    np.testing.assert_array_equal(_read(s3.objects["a/i4.tif"][1])[0], rasters[4][1])
+
+
+def test_upload_index_stack_writes_one_quantized_multiband_cog():
+    rng = np.random.default_rng(1)
+    indices = {
+        "ndvi": rng.uniform(-1, 1, (300, 200)).astype(np.float32),
+        "msi": rng.uniform(0, 5, (300, 200)).astype(np.float32),
+    }
+    indices["ndvi"][10:20, 10:20] = np.nan
+    s3 = DummyS3()
+
+    uri, band_map = raster_io.upload_index_stack(s3, indices, PROFILE, "a/indices.tif")
+
+    assert uri == "s3://bucket/a/indices.tif"
+    assert list(s3.objects) == ["a/indices.tif"]
+    assert [band_map[n]["band"] for n in ("ndvi", "msi")] == [1, 2]
+    with MemoryFile(s3.objects["a/indices.tif"][1]) as memfile:
+        with memfile.open() as src:
+            assert src.count == 2 and src.dtypes == ("int16", "int16")
+            assert src.descriptions == ("ndvi", "msi")
+            assert src.overviews(1)
+            for name, data in indices.items():
+                entry = band_map[name]
+                raw = src.read(entry["band"], masked=True)
+                assert np.array_equal(raw.mask, np.isnan(data))
+                decoded = raw.astype(np.float64) * entry["scale"] + entry["offset"]
+                assert np.nanmax(np.abs(decoded - data)) <= entry["scale"]
@@ -0,0 +1,125 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.jobs import sync_scene_catalog
+from worker.pipeline import scene_catalog
+
+
+class DummyClient:
+    def __init__(self):
+        self.searched = []
+        self.live_calls = []
+
+    def iter_scenes(self, collection, bbox, start_date, end_date):
+        self.searched.append((start_date, end_date))
+        yield {"id": f"{collection}-{start_date:%Y%m%d}", "collection": collection}
+
+    async def search_scenes(self, aoi_geom, start_date, end_date, max_cloud_cover=60.0, collections=None):
+        self.live_calls.append(collections)
+        return [{"id": "live", "cloud_cover": 1.0}]
+
+
+def _patch_state(monkeypatch, state):
+    saved = []
+    monkeypatch.setattr(sync_scene_catalog, "get_sync_state", lambda db, collection: state)
+    monkeypatch.setattr(sync_scene_catalog, "upsert_scenes", lambda db, scenes: len(list(scenes)))
+    monkeypatch.setattr(
+        sync_scene_catalog,
+        "save_sync_state",
+        lambda db, collection, bbox, synced_from, synced_through, added: saved.append((synced_from, synced_through)),
+    )
+    return saved
+
+
+def test_sync_resumes_with_overlap_and_extends_range(monkeypatch):
+    first = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    through = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    end = through + timedelta(days=2)
+    saved = _patch_state(monkeypatch, {"synced_from": first, "synced_through": through, "scene_count": 10})
+    monkeypatch.setattr(sync_scene_catalog.settings, "scene_catalog_overlap_days", 3)
+
+    client = DummyClient()
+    total = sync_scene_catalog.sync_collection(client, None, "sentinel-2-l2a", end=end)
+
+    assert client.searched[0][0] == through - timedelta(days=3)
+    assert client.searched[-1][1] == end
+    assert all(b - a <= timedelta(days=1) for a, b in client.searched)
+    assert total == len(client.searched) == 5
+    assert saved[-1] == (first, end)
+
+
+def test_sync_restarts_range_when_not_contiguous(monkeypatch):
+    old = {
+        "synced_from": datetime(2023, 1, 1, tzinfo=timezone.utc),
+        "synced_through": datetime(2023, 2, 1, tzinfo=timezone.utc),
+        "scene_count": 1,
+    }
+    saved = _patch_state(monkeypatch, old)
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+    sync_scene_catalog.sync_collection(DummyClient(), None, "sentinel-1-rtc", start, start + timedelta(days=2))
+
+    assert saved == [(start, start + timedelta(days=1)), (start, start + timedelta(days=2))]
+
+
+def test_find_scenes_falls_back_to_live_search(monkeypatch):
+    monkeypatch.setattr(scene_catalog.settings, "scene_catalog_enabled", True)
+    monkeypatch.setattr(scene_catalog, "catalog_covers", lambda *args: False)
+    client = DummyClient()
+
+    scenes = asyncio.run(scene_catalog.find_scenes(
+        None, client, {"type": "Point", "coordinates": [0, 0]},
+        datetime(2024, 1, 1), datetime(2024, 1, 7), collection="sentinel-1-rtc",
+    ))
+
+    assert scenes == [{"id": "live", "cloud_cover": 1.0}]
+    assert client.live_calls == [["sentinel-1-rtc"]]
+
+
+class CatalogDB:
+    """Returns the catalog rows in the order the query's ORDER BY asks for."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, statement, params=None):
+        newest_first = "ORDER BY datetime DESC" in str(statement)
+        rows = sorted(self.rows, key=lambda row: row.datetime, reverse=newest_first)
+        return SimpleNamespace(fetchall=lambda: rows)
+
+
+def test_catalog_and_live_search_return_scenes_in_the_same_order(monkeypatch):
+    days = [datetime(2024, 1, d, tzinfo=timezone.utc) for d in (3, 1, 5)]
+    rows = [
+        SimpleNamespace(
+            scene_id=f"S2-{day:%d}", collection="sentinel-2-l2a", datetime=day, cloud_cover=5.0,
+            platform="sentinel-2a", assets={}, bbox=None, self_href=None,
+            footprint='{"type": "Point", "coordinates": [0, 0]}',
+        )
+        for day in days
+    ]
+
+    class LiveClient(DummyClient):
+        async def search_scenes(self, aoi_geom, start_date, end_date, max_cloud_cover=60.0, collections=None):
+            # The STAC API returns the newest scenes first
+            return [{"id": f"S2-{day:%d}"} for day in sorted(days, reverse=True)]
+
+    def find(covered):
+        monkeypatch.setattr(scene_catalog, "catalog_covers", lambda *args: covered)
+        return asyncio.run(scene_catalog.find_scenes(
+            CatalogDB(rows), LiveClient(), {"type": "Point", "coordinates": [0, 0]},
+            datetime(2024, 1, 1), datetime(2024, 1, 7),
+        ))
+
+    monkeypatch.setattr(scene_catalog.settings, "scene_catalog_enabled", True)
+    catalog, live = find(True), find(False)
+
+    assert [s["id"] for s in catalog] == [s["id"] for s in live] == ["S2-05", "S2-03", "S2-01"]
@@ -252,8 +252,8 @@ async def test_backfill_creates_child_jobs_and_marks_done(db_session, tenant_far
     created_messages = []
 
     class DummySQS:
-        def send_message(self, message_body, queue_url=None):  # noqa: ANN001
-            created_messages.append(message_body)
+        def send_message_batch(self, message_bodies, queue_url=None):  # noqa: ANN001
+            created_messages.extend(message_bodies)
 
     monkeypatch.setattr("worker.shared.aws_clients.SQSClient", lambda: DummySQS())
     monkeypatch.setattr(settings, "signals_enabled", True)
@@ -321,10 +321,25 @@ async def test_backfill_creates_child_jobs_and_marks_done(db_session, tenant_far
     ).fetchall()
     created_map = {row[0]: row[1] for row in created}
     assert created_map.get("PROCESS_WEEK") == 2
-    assert created_map.get("ALERTS_WEEK") == 2
-    assert created_map.get("SIGNALS_WEEK") == 2
+    # One range job each over both weeks
+    assert created_map.get("ALERTS_WEEK") == 1
+    assert created_map.get("SIGNALS_WEEK") == 1
     assert created_map.get("FORECAST_WEEK") == 2
 
+    # Observation consumers wait for their weeks' PROCESS_WEEK (one row per edge)
+    waiting = db_session.execute(
+        text("""
+            SELECT j.job_type, COUNT(*)
+            FROM jobs j
+            JOIN job_dependencies d ON d.job_id = j.id
+            JOIN jobs upstream ON upstream.id = d.depends_on_job_id
+            WHERE j.tenant_id = :tenant_id AND j.status = 'WAITING' AND upstream.job_type = 'PROCESS_WEEK'
+            GROUP BY j.job_type
+        """),
+        {"tenant_id": tenant_farm_aoi["tenant_id"]},
+    ).fetchall()
+    assert dict(waiting) == {"ALERTS_WEEK": 2, "SIGNALS_WEEK": 2, "FORECAST_WEEK": 2}
+
 
 def test_process_week_handler_updates_status_and_observation(db_session, tenant_farm_aoi, monkeypatch):
     from worker.jobs import process_week as process_week_job
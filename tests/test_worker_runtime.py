@@ -0,0 +1,261 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.runtime import WorkerRuntime, run_async
+
+
+def _message(i, job_type, tenant_id=None, priority_class=None):
+    payload = {}
+    if tenant_id:
+        payload["tenant_id"] = tenant_id
+    if priority_class:
+        payload["priority_class"] = priority_class
+    body = {"job_type": job_type, "payload": payload}
+    return {"MessageId": str(i), "ReceiptHandle": str(i), "Body": json.dumps(body)}
+
+
+class DummySQS:
+    queue_url = "default"
+    queue_high_url = "high"
+
+    def __init__(self, messages):
+        self.pending = list(messages)
+        self.requested = []
+
+    def receive_messages(self, queue_url=None, max_messages=1, wait_time=20):
+        if queue_url == self.queue_high_url:
+            return []
+        self.requested.append(max_messages)
+        batch, self.pending = self.pending[:max_messages], self.pending[max_messages:]
+        if not batch:
+            time.sleep(0.01)
+        return batch
+
+
+def test_runtime_keeps_polling_while_a_slow_job_runs_and_caps_job_types():
+    messages = [_message(0, "SLOW")] + [_message(i, "FAST") for i in range(1, 7)] + [
+        _message(i, "CAPPED") for i in range(7, 11)
+    ]
+    sqs = DummySQS(messages)
+    lock = threading.Lock()
+    done, running, peak = [], {"CAPPED": 0}, {"CAPPED": 0}
+    slow_release = threading.Event()
+
+    def process_one(message, queue_url):
+        job_type = json.loads(message["Body"])["job_type"]
+        if job_type == "SLOW":
+            assert slow_release.wait(5)
+        elif job_type == "CAPPED":
+            with lock:
+                running["CAPPED"] += 1
+                peak["CAPPED"] = max(peak["CAPPED"], running["CAPPED"])
+            time.sleep(0.02)
+            with lock:
+                running["CAPPED"] -= 1
+        with lock:
+            done.append(message["MessageId"])
+            # Everything else finished while the slow job still held its slot
+            if len(done) == len(messages) - 1:
+                slow_release.set()
+            if len(done) == len(messages):
+                runtime.stop()
+
+    runtime = WorkerRuntime(sqs, process_one, concurrency=3, job_type_limits={"CAPPED": 1})
+    asyncio.run(asyncio.wait_for(runtime.run(), 10))
+
+    assert sorted(done, key=int) == [m["MessageId"] for m in messages]
+    assert done[-1] == "0"
+    assert peak["CAPPED"] == 1
+    # Free slots plus the scheduler lookahead, never more
+    assert max(sqs.requested) <= 3 + runtime.lookahead
+
+
+def test_capped_messages_do_not_stop_receiving_work_for_free_slots():
+    # BACKFILL is capped at 1: the backfills received behind the running one
+    # must not fill the lookahead while the second slot is idle
+    messages = [_message(i, "BACKFILL") for i in range(4)] + [_message(i, "FAST") for i in range(4, 7)]
+    sqs = DummySQS(messages)
+    fast_ran = threading.Event()
+    lock = threading.Lock()
+    done = []
+
+    def process_one(message, queue_url):
+        job_type = json.loads(message["Body"])["job_type"]
+        if job_type == "BACKFILL" and not done:
+            assert fast_ran.wait(5)
+        elif job_type == "FAST":
+            fast_ran.set()
+        with lock:
+            done.append(job_type)
+            if len(done) == len(messages):
+                runtime.stop()
+
+    runtime = WorkerRuntime(sqs, process_one, concurrency=2, job_type_limits={"BACKFILL": 1}, lookahead=1)
+    asyncio.run(asyncio.wait_for(runtime.run(), 10))
+
+    assert done[0] == "FAST"
+    assert sorted(done) == ["BACKFILL"] * 4 + ["FAST"] * 3
+
+
+def test_run_async_reuses_one_loop_per_thread():
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    first = run_async(current_loop())
+    second = run_async(current_loop())
+    assert first is second and not first.is_running()
+
+
+def test_heartbeat_extends_lease_only_while_handler_runs():
+    sqs = DummySQS([_message(1, "PROCESS_WEEK")])
+    extended = []
+    sqs.change_message_visibility_batch = (
+        lambda handles, timeout, queue_url=None: extended.append((tuple(handles), timeout, time.monotonic())) or []
+    )
+    finished = {}
+
+    def process_one(message, queue_url):
+        time.sleep(0.3)
+        finished["at"] = time.monotonic()
+
+    async def run_then_stop():
+        runtime = WorkerRuntime(sqs, process_one, concurrency=1, visibility_timeout=60, heartbeat_interval=0.05)
+        task = asyncio.create_task(runtime.run())
+        while "at" not in finished:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.2)  # several more heartbeat intervals
+        runtime.stop()
+        await task
+        return runtime
+
+    runtime = asyncio.run(asyncio.wait_for(run_then_stop(), 10))
+
+    assert len(extended) >= 3
+    assert all(handles == ("1",) and timeout == 60 for handles, timeout, _ in extended)
+    assert all(at <= finished["at"] + 0.05 for _, _, at in extended)
+    assert runtime.leases == {}
+
+
+def test_finished_messages_are_deleted_in_batches(monkeypatch):
+    from worker.shared.aws_clients import SQSClient
+
+    monkeypatch.setattr("worker.runtime.settings.sqs_delete_flush_seconds", 0.05)
+    messages = [_message(i, "FAST") for i in range(23)]
+    sqs = DummySQS(messages)
+    requests = []
+
+    class BotoStub:
+        def delete_message_batch(self, QueueUrl, Entries):
+            requests.append((QueueUrl, [e["ReceiptHandle"] for e in Entries]))
+            return {"Failed": [{"Id": "0", "Code": "ReceiptHandleIsInvalid"}]} if len(requests) == 1 else {}
+
+    real = SQSClient.__new__(SQSClient)
+    real.queue_url, real.client = "default", BotoStub()
+    sqs.delete_message_batch = real.delete_message_batch
+    done = []
+
+    def process_one(message, queue_url):
+        done.append(message["MessageId"])
+        if len(done) == len(messages):
+            runtime.stop()
+        return message["MessageId"] != "5"  # a failed job keeps its message
+
+    runtime = WorkerRuntime(sqs, process_one, concurrency=4)
+    asyncio.run(asyncio.wait_for(runtime.run(), 10))
+
+    deleted = [handle for _, handles in requests for handle in handles]
+    assert sorted(deleted, key=int) == [str(i) for i in range(23) if i != 5]
+    assert all(queue == "default" and len(handles) <= 10 for queue, handles in requests)
+    assert len(requests) < len(deleted)
+
+
+def test_fair_scheduler_orders_interactive_first_then_shares_tenants():
+    from worker.scheduling import FairScheduler
+
+    scheduler = FairScheduler(tenant_limit=2, tenant_limits={}, tenant_weights={"b": 2.0}, job_type_weights={})
+    for i in range(10):
+        scheduler.push(_message(i, "PROCESS_WEEK", "a"), "q")
+    for i in range(10, 14):
+        scheduler.push(_message(i, "PROCESS_WEEK", "b"), "q")
+    scheduler.push(_message(99, "BACKFILL", "c", "interactive"), "q")
+
+    order = []
+    while True:
+        picked = scheduler.pop()
+        if picked is None:
+            break
+        order.append(picked)
+
+    # Interactive first; b has twice a's weight; two running per tenant at most
+    assert [message["MessageId"] for message, _, _ in order] == ["99", "0", "10", "11", "1"]
+    assert len(scheduler) == 10
+
+    scheduler.finished(order[1][2])
+    message, _, meta = scheduler.pop()
+    assert (message["MessageId"], meta.tenant_id) == ("2", "a")
+
+
+def test_runtime_does_not_let_one_tenant_starve_another():
+    # Tenant "big" queued a long backfill before tenant "small" created an AOI
+    messages = [_message(i, "PROCESS_WEEK", "big") for i in range(30)] + [
+        _message(100 + i, "PROCESS_WEEK", "small") for i in range(2)
+    ]
+    sqs = DummySQS(messages)
+    started = []
+    lock = threading.Lock()
+
+    def process_one(message, queue_url):
+        with lock:
+            started.append(json.loads(message["Body"])["payload"]["tenant_id"])
+            if len(started) == len(messages):
+                runtime.stop()
+        time.sleep(0.01)
+
+    runtime = WorkerRuntime(sqs, process_one, concurrency=2, lookahead=40)
+    asyncio.run(asyncio.wait_for(runtime.run(), 10))
+
+    assert len(started) == 32
+    assert max(i for i, tenant in enumerate(started) if tenant == "small") < 6
+
+
+def test_tenant_capped_messages_leave_room_for_other_tenants():
+    # Tenant "big" is capped at 1 running job; its queued backlog arrives
+    # first and must not fill the lookahead while "small" has jobs to run
+    from worker.scheduling import FairScheduler
+
+    messages = [_message(i, "PROCESS_WEEK", "big") for i in range(5)] + [
+        _message(100 + i, "PROCESS_WEEK", "small") for i in range(2)
+    ]
+    sqs = DummySQS(messages)
+    small_ran = threading.Event()
+    lock = threading.Lock()
+    started = []
+
+    def process_one(message, queue_url):
+        tenant_id = json.loads(message["Body"])["payload"]["tenant_id"]
+        with lock:
+            first = not started
+            started.append(tenant_id)
+        if first:
+            assert small_ran.wait(5)
+        elif tenant_id == "small":
+            small_ran.set()
+        with lock:
+            if len(started) == len(messages):
+                runtime.stop()
+
+    scheduler = FairScheduler(tenant_limit=1, tenant_limits={}, tenant_weights={}, job_type_weights={})
+    runtime = WorkerRuntime(sqs, process_one, concurrency=2, lookahead=1, scheduler=scheduler)
+    asyncio.run(asyncio.wait_for(runtime.run(), 10))
+
+    assert started[:2] == ["big", "small"]
+    assert sorted(started) == ["big"] * 5 + ["small"] * 2
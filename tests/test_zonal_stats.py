@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER_ROOT = ROOT / "services" / "worker"
+if str(WORKER_ROOT) not in sys.path:
+    sys.path.insert(0, str(WORKER_ROOT))
+
+from worker.pipeline.zonal_stats import StatsAccumulator
+
+BIN_WIDTH = 2.0 / 2048
+
+
+def _ndvi(shape, seed=0, nan_fraction=0.2):
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(-1, 1, size=shape).astype(np.float32)
+    data[rng.random(shape) < nan_fraction] = np.nan
+    return data
+
+
+def test_single_zone_matches_numpy():
+    data = _ndvi((120, 90))
+    valid = data[~np.isnan(data)].astype(np.float64)
+
+    acc = StatsAccumulator().update(data, chunk_size=1000)
+    stats = acc.result("ndvi", percentiles=(10, 50, 90))
+
+    assert np.isclose(stats["ndvi_mean"], valid.mean())
+    assert np.isclose(stats["ndvi_std"], valid.std())
+    assert stats["ndvi_min"] == valid.min()
+    assert stats["ndvi_max"] == valid.max()
+    for q in (10, 50, 90):
+        assert abs(stats[f"ndvi_p{q}"] - np.percentile(valid, q)) <= BIN_WIDTH
+    assert np.isclose(acc.valid_ratio(), valid.size / data.size)
+
+
+def test_zones_match_per_zone_computation():
+    data = _ndvi((50, 60))
+    labels = np.zeros(data.shape, dtype=np.int32)
+    labels[5:20, 5:25] = 1
+    labels[25:45, 30:55] = 2
+
+    acc = StatsAccumulator(n_zones=3).update(data, labels)
+
+    for zone in (1, 2):
+        values = data[labels == zone]
+        valid = values[~np.isnan(values)].astype(np.float64)
+        assert np.isclose(acc.mean(zone), valid.mean())
+        assert np.isclose(acc.std(zone), valid.std())
+        assert abs(acc.percentile(50, zone) - np.percentile(valid, 50)) <= BIN_WIDTH
+        assert np.isclose(acc.valid_ratio(zone), valid.size / values.size)
+    assert acc.result("ndvi", zone=3, percentiles=(50,)) == {
+        "ndvi_mean": 0.0, "ndvi_min": 0.0, "ndvi_max": 0.0, "ndvi_std": 0.0, "ndvi_p50": 0.0,
+    }
+
+
+def test_merged_partials_equal_one_pass():
+    data = _ndvi((100, 80))
+    whole = StatsAccumulator().update(data)
+
+    top = StatsAccumulator().update(data[:37])
+    bottom = StatsAccumulator().update(data[37:])
+    merged = top.merge(bottom)
+
+    merged_stats = merged.result("ndvi", percentiles=(10, 90))
+    whole_stats = whole.result("ndvi", percentiles=(10, 90))
+    assert merged_stats.keys() == whole_stats.keys()
+    for key, value in whole_stats.items():
+        assert np.isclose(merged_stats[key], value)